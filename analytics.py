@@ -0,0 +1,157 @@
+"""
+Vectorized statistics of a Q-table, how often each card is seen and picked
+
+The table is read in chunks of states as columnar NumPy arrays (hand
+counts and Q rows), so a .qmap or .qpol file streams from disk and memory
+stays bounded by the chunk size whatever the table size. Counts per hand
+size and card are bincount group-bys over each chunk.
+
+    python analytics.py q_table.qmap [NUM_CARDS] [position|type]
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import itertools
+import sys
+
+import numpy as np
+import pandas as pd
+
+from cards import CARD_TYPES, NUM_TYPES
+from policy import load_table
+from qtable import NUM_ACTIONS, ArrayQTable
+from qtable_file import NO_ACTION, MappedQTable, PolicyTable
+
+ANALYTICS_CHUNK = 1 << 16  # States per chunk
+
+
+def table_chunks(table, chunk_size=ANALYTICS_CHUNK):
+    """(hands, Q rows) arrays of at most chunk_size stored states at a time
+
+    hands are the first 10 counts of each state. table is a dict, an
+    ArrayQTable, a MappedQTable or a PolicyTable, whose rows are one-hot
+    on the stored action.
+    """
+    if isinstance(table, PolicyTable):
+        eye = np.eye(NUM_ACTIONS, dtype=np.float32)
+        for start in range(0, table.num_states, chunk_size):
+            actions = np.asarray(table.actions[start:start + chunk_size])
+            stored = np.flatnonzero(actions != NO_ACTION)
+            if len(stored):
+                yield table.unrank_many(start + stored, NUM_TYPES), eye[actions[stored]]
+        return
+    if isinstance(table, (ArrayQTable, MappedQTable)):
+        if isinstance(table, ArrayQTable):
+            ranks, q_values = table.rows()
+        else:
+            ranks, q_values = table.state_ranks, table.q_values
+        for start in range(0, len(ranks), chunk_size):
+            yield (
+                table.unrank_many(np.asarray(ranks[start:start + chunk_size]), NUM_TYPES),
+                np.asarray(q_values[start:start + chunk_size]),
+            )
+        return
+    items = iter(table.items())
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        states, rows = zip(*chunk)
+        yield np.array(states, dtype=np.int64)[:, :NUM_TYPES], np.array(rows, dtype=np.float64)
+
+
+def chosen_cards(hands, rows, action_space="position"):
+    """(card type, valid) of the greedy action of every row
+
+    Position rows take the argmax over all 10 actions like the original
+    stats loop, which skips rows whose argmax is past the end of the hand.
+    """
+    if action_space == "type":
+        cards = np.argmax(np.where(hands > 0, rows, -np.inf), axis=1)
+        return cards, np.ones(len(cards), dtype=bool)
+    best = np.argmax(rows, axis=1)
+    # The card at that index of the sorted hand
+    cards = np.count_nonzero(np.cumsum(hands, axis=1) <= best[:, None], axis=1)
+    return cards, best < hands.sum(axis=1)
+
+
+def hand_stats(table, num_cards, action_space="position", chunk_size=ANALYTICS_CHUNK):
+    """(popularity, seen) count arrays of shape (num_cards, 10)
+
+    Row h is hand size h + 1. seen counts the cards of every stored hand,
+    popularity how often the greedy action picks each card. States with
+    an empty hand or more than num_cards cards are skipped.
+    """
+    popularity = np.zeros(num_cards * NUM_TYPES, dtype=np.int64)
+    seen = np.zeros(num_cards * NUM_TYPES, dtype=np.int64)
+    for hands, rows in table_chunks(table, chunk_size):
+        sizes = hands.sum(axis=1)
+        keep = (sizes > 0) & (sizes <= num_cards)
+        hands, rows, offsets = hands[keep], rows[keep], (sizes[keep] - 1) * NUM_TYPES
+        seen += np.bincount(
+            (offsets[:, None] + np.arange(NUM_TYPES)).ravel(),
+            weights=hands.ravel(),
+            minlength=len(seen),
+        ).astype(np.int64)
+        cards, valid = chosen_cards(hands, rows, action_space)
+        popularity += np.bincount(offsets[valid] + cards[valid], minlength=len(popularity))
+    return popularity.reshape(num_cards, NUM_TYPES), seen.reshape(num_cards, NUM_TYPES)
+
+
+def shares(counts, scale=1):
+    """scale * count / total of its hand size, 0 for empty hand sizes"""
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(scale * counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+
+
+def rounded(values, digits):
+    """Python's round of every value, which np.round can differ from"""
+    return [round(value, digits) for value in values.ravel().tolist()]
+
+
+def format_hand_stats(popularity, seen):
+    """Seen and played counts per hand size, as train.py prints them"""
+    lines = []
+    percent_played = rounded(shares(popularity), 4)
+    for size, played in enumerate(popularity):
+        lines.append(f"\nHand Size {size + 1}:")
+        lines.append("Card\t\tTimes Seen\tTimes Played\t% Played")
+        for card, name in enumerate(CARD_TYPES):
+            lines.append(
+                f"{name.ljust(14)}\t"
+                f"{str(seen[size, card]).ljust(10)}\t"
+                f"{str(played[card]).ljust(10)}\t"
+                f"{str(percent_played[size * NUM_TYPES + card]).ljust(10)}"
+            )
+        lines.append(f"Total Played: {played.sum()}")
+    return "\n".join(lines)
+
+
+def stats_frame(popularity, seen):
+    """Popularity %, Seen % and their ratio for every hand size and card"""
+    pop_percent = shares(popularity, 100)
+    seen_percent = shares(seen, 100)
+    ratio = np.divide(
+        pop_percent, seen_percent, out=np.zeros(seen_percent.shape), where=seen_percent > 0
+    )
+    sizes = np.arange(1, len(popularity) + 1)
+    return pd.DataFrame({
+        "Hand Size": np.repeat(sizes, NUM_TYPES),
+        "Card Type": np.tile(CARD_TYPES, len(sizes)),
+        "Popularity %": rounded(pop_percent, 2),
+        "Seen %": rounded(seen_percent, 2),
+        "Pop/Seen Ratio": rounded(ratio, 2),
+    })
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python analytics.py TABLE [NUM_CARDS] [position|type]")
+        sys.exit(1)
+    loaded = load_table(sys.argv[1])
+    stats = hand_stats(
+        loaded,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+        getattr(loaded, "action_space", sys.argv[3] if len(sys.argv) > 3 else "position"),
+    )
+    print(format_hand_stats(*stats))
+    print(stats_frame(*stats).to_string(index=False))
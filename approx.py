@@ -0,0 +1,267 @@
+"""
+Small NumPy network that approximates a Q-table, for serving
+
+A Q-table only knows the states it has visited: unseen ones read as zero
+rows, and the number of states explodes with NUM_CARDS and players. A
+QNetwork maps the 20 counts of Game.state_key (and a few scoring features,
+see features) through a small ReLU MLP to a row of 10 Q-values, so it has
+a row for every state and takes a few hundred KB whatever the table size.
+It is distilled from a trained table by regression on the valid actions
+of its stored rows, minibatch Adam, NumPy only.
+
+Player(name, "approx", "q_network.npz") plays one; policy.lookup and
+BatchGame evaluate a whole batch of states in one forward pass.
+`python approx.py distill q_table.pkl q_network.npz [NUM_CARDS]` trains one
+and `python bench.py distill q_table.pkl q_network.npz` compares its win
+rate and decisions/sec with the table's.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import os
+import sys
+
+import numpy as np
+
+from cards import DUMPLING, MAKI_VALUES, NIGIRI_VALUES, NUM_TYPES, SASHIMI, TEMPURA, WASABI
+from policy import action_masks, load_table, policy_fidelity
+from qtable import NUM_ACTIONS, STATE_LENGTH, ArrayQTable, StateRanker
+from qtable_file import MappedQTable, PolicyTable, table_arrays
+
+NETWORK_PATH = "q_network.npz"
+HIDDEN = (128, 128)  # Hidden layer sizes, about 90 KB of float32 weights
+NUM_EXTRA = 6  # Features added to the 20 counts, see features
+FEATURE_SCALE = 4.0  # Counts are divided by this
+DISTILL_EPOCHS = 40
+DISTILL_BATCH = 256
+DISTILL_STATES = 1_000_000  # Stored states sampled for training at most
+LEARNING_RATE = 1e-3
+ADAM_BETAS = (0.9, 0.999)
+ADAM_EPSILON = 1e-8
+
+NIGIRI_TYPES = np.flatnonzero(NIGIRI_VALUES)
+MAKI = np.array(MAKI_VALUES, dtype=np.float32)
+
+
+def features(states, extra=True):
+    """float32 (n, 20 or 26) network inputs of an (n, 20) array of states
+
+    extra adds what scoring reads from the played cards: cards left to
+    pick, tempura mod 2, sashimi mod 3, dumplings up to 5, wasabi that may
+    still be open (wasabi minus nigiri) and maki icons.
+    """
+    states = np.asarray(states, dtype=np.float32)
+    columns = [states / FEATURE_SCALE]
+    if extra:
+        hands, played = states[:, :NUM_TYPES], states[:, NUM_TYPES:]
+        columns.append(np.stack([
+            hands.sum(axis=1) / FEATURE_SCALE,
+            played[:, TEMPURA] % 2,
+            played[:, SASHIMI] % 3 / 2,
+            np.minimum(played[:, DUMPLING], 5) / 5,
+            np.maximum(played[:, WASABI] - played[:, NIGIRI_TYPES].sum(axis=1), 0),
+            played @ MAKI / FEATURE_SCALE,
+        ], axis=1))
+    return np.concatenate(columns, axis=1)
+
+
+class QNetwork:
+    """ReLU MLP from a state to its 10 Q-values, read like a Q-table
+
+    get and setdefault return the predicted row without storing anything,
+    so a player with fallback "zeros" plays it like a read-only table.
+    Outputs are multiplied by scale, the spread of the distilled targets.
+    """
+
+    def __init__(self, weights, biases, action_space="position", extra=True, scale=1.0):
+        """Initialize variables"""
+        self.weights = [np.asarray(weight, dtype=np.float32) for weight in weights]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in biases]
+        self.action_space = action_space
+        self.extra = extra
+        self.scale = float(scale)
+
+    @classmethod
+    def create(cls, hidden=HIDDEN, action_space="position", extra=True, seed=None):
+        """Untrained network with He-initialized weights"""
+        rng = np.random.default_rng(seed)
+        sizes = [STATE_LENGTH + NUM_EXTRA * extra, *hidden, NUM_ACTIONS]
+        weights = [
+            rng.normal(0, np.sqrt(2 / fan_in), (fan_in, fan_out))
+            for fan_in, fan_out in zip(sizes[:-1], sizes[1:])
+        ]
+        biases = [np.zeros(fan_out) for fan_out in sizes[1:]]
+        return cls(weights, biases, action_space, extra)
+
+    def forward(self, inputs):
+        """Activations of every layer, the last one is the scaled-down output"""
+        activations = [inputs]
+        for layer, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            output = activations[-1] @ weight + bias
+            if layer < len(self.weights) - 1:
+                np.maximum(output, 0, out=output)
+            activations.append(output)
+        return activations
+
+    def predict(self, states):
+        """float32 (n, 10) Q-values of an (n, 20) array of states"""
+        return self.forward(features(states, self.extra))[-1] * np.float32(self.scale)
+
+    def get(self, state, default=None):
+        """Predicted Q row of one state, like dict.get on a full table"""
+        return self.predict(np.array([state]))[0].tolist()
+
+    def setdefault(self, state, default=None):
+        """Same as get, nothing is stored"""
+        return self.get(state)
+
+    def gradients(self, inputs, targets, masks):
+        """(loss, weight gradients, bias gradients) of one minibatch
+
+        The loss is the mean squared error of the valid actions only,
+        targets already divided by scale.
+        """
+        activations = self.forward(inputs)
+        error = np.where(masks, activations[-1] - targets, 0).astype(np.float32)
+        count = max(int(masks.sum()), 1)
+        loss = float(np.sum(error * error)) / count
+        delta = 2 * error / count
+        weight_grads, bias_grads = [], []
+        for layer in range(len(self.weights) - 1, -1, -1):
+            weight_grads.append(activations[layer].T @ delta)
+            bias_grads.append(delta.sum(axis=0))
+            if layer:
+                delta = (delta @ self.weights[layer].T) * (activations[layer] > 0)
+        return loss, weight_grads[::-1], bias_grads[::-1]
+
+    @property
+    def parameters(self):
+        """Weight and bias arrays, in the order Adam updates them"""
+        return self.weights + self.biases
+
+    @property
+    def num_parameters(self):
+        """Number of trained values"""
+        return sum(parameter.size for parameter in self.parameters)
+
+    @property
+    def nbytes(self):
+        """Bytes of the weights and biases"""
+        return sum(parameter.nbytes for parameter in self.parameters)
+
+    def save(self, path):
+        """Writes the network as an uncompressed .npz file"""
+        arrays = {f"weight{i}": weight for i, weight in enumerate(self.weights)}
+        arrays.update({f"bias{i}": bias for i, bias in enumerate(self.biases)})
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                action_space=np.array(self.action_space),
+                extra=np.array(self.extra),
+                scale=np.array(self.scale),
+                **arrays,
+            )
+
+    @classmethod
+    def load(cls, path):
+        """Network saved by save"""
+        with np.load(path) as saved:
+            layers = sum(1 for name in saved.files if name.startswith("weight"))
+            return cls(
+                [saved[f"weight{i}"] for i in range(layers)],
+                [saved[f"bias{i}"] for i in range(layers)],
+                str(saved["action_space"]),
+                bool(saved["extra"]),
+                float(saved["scale"]),
+            )
+
+
+def stored_rows(table, num_cards):
+    """(ranks, Q rows) of every state stored in a table with Q-values"""
+    if isinstance(table, PolicyTable):
+        raise ValueError("A .qpol keeps no Q-values, distill the table it came from")
+    if isinstance(table, MappedQTable):
+        return table.state_ranks, table.q_values
+    if isinstance(table, ArrayQTable):
+        return table.rows()
+    return table_arrays(table, num_cards)
+
+
+def distill(table, num_cards=None, hidden=HIDDEN, epochs=DISTILL_EPOCHS,
+            batch_size=DISTILL_BATCH, learning_rate=LEARNING_RATE, max_states=DISTILL_STATES,
+            action_space="position", extra=True, seed=0, network=None):
+    """QNetwork fitted to the valid actions of a table's stored rows
+
+    At most max_states stored states are sampled; states are unranked a
+    minibatch at a time, so memory does not grow with the table. Pass a
+    network to keep training it, e.g. on a newer table.
+    """
+    if num_cards is None:
+        num_cards = getattr(table, "num_cards", None) or max(sum(state) for state in table)
+    rng = np.random.default_rng(seed)
+    ranks, rows = stored_rows(table, num_cards)
+    sample = np.arange(len(ranks))
+    if len(sample) > max_states:
+        sample = np.sort(rng.choice(sample, max_states, replace=False))
+    ranker = StateRanker(num_cards)
+    if network is None:
+        network = QNetwork.create(hidden, action_space, extra, seed)
+        probe = rng.choice(sample, min(len(sample), 1 << 16), replace=False)
+        hands = ranker.unrank_many(np.asarray(ranks)[probe], NUM_TYPES)
+        valid = np.asarray(rows)[probe][action_masks(hands, action_space)]
+        network.scale = float(valid.std()) if valid.size and valid.std() > 0 else 1.0
+    parameters = network.parameters
+    moments = [np.zeros_like(parameter) for parameter in parameters]
+    squares = [np.zeros_like(parameter) for parameter in parameters]
+    beta1, beta2 = ADAM_BETAS
+    step = 0
+    for _ in range(epochs):
+        rng.shuffle(sample)
+        for start in range(0, len(sample), batch_size):
+            batch = np.sort(sample[start:start + batch_size])
+            states = ranker.unrank_many(np.asarray(ranks)[batch])
+            masks = action_masks(states[:, :NUM_TYPES], network.action_space)
+            targets = np.asarray(rows)[batch] / network.scale
+            _, weight_grads, bias_grads = network.gradients(
+                features(states, network.extra), targets, masks
+            )
+            step += 1
+            rate = learning_rate * np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            for parameter, grad, moment, square in zip(
+                parameters, weight_grads + bias_grads, moments, squares
+            ):
+                moment += (1 - beta1) * (grad - moment)
+                square += (1 - beta2) * (grad * grad - square)
+                parameter -= rate * moment / (np.sqrt(square) + ADAM_EPSILON)
+    return network
+
+
+def load_network(path=NETWORK_PATH):
+    """QNetwork of a path, an untrained one if the file is missing"""
+    try:
+        network = QNetwork.load(path)
+        print("Successfully loaded in Q network")
+    except FileNotFoundError:
+        network = QNetwork.create()
+        print("Unsuccessfully loaded in Q network - FileNotFoundError")
+    return network
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == "distill":
+        # python approx.py distill q_table.pkl q_network.npz [NUM_CARDS] [position|type]
+        source = load_table(sys.argv[2])
+        trained = distill(
+            source,
+            int(sys.argv[4]) if len(sys.argv) > 4 else None,
+            action_space=sys.argv[5] if len(sys.argv) > 5 else "position",
+        )
+        trained.save(sys.argv[3])
+        report = policy_fidelity(
+            source, trained, trained.action_space, getattr(source, "num_cards", 8)
+        )
+        print(f"{trained.num_parameters} parameters, {os.path.getsize(sys.argv[3])} bytes")
+        print(f"{report['mismatches']} of {report['states']} greedy actions differ "
+              f"from the table ({100 * report['mismatch_rate']:.2f}%)")
+    else:
+        print("Usage: python approx.py distill TABLE NETWORK.npz [NUM_CARDS] [position|type]")
+        sys.exit(1)
@@ -0,0 +1,216 @@
+"""
+Vectorized game logic, plays many games of SushiGo at once with NumPy
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import numpy as np
+
+import cards
+from cards import NUM_TYPES, RULES_PRIORITY, WASABI
+from dealing import deal_hands, new_decks
+from policy import lookup, select_cards
+from qtable import ArrayQTable
+from scoring import maki_points_batch, score_counts_batch
+
+NIGIRI_VALUES = np.array(cards.NIGIRI_VALUES)
+MAKI_VALUES = np.array(cards.MAKI_VALUES)
+TYPE_IDS = np.arange(NUM_TYPES)
+# counts @ INCLUSIVE_SUM is the running total along each hand, see policy.EXCLUSIVE_SUM
+INCLUSIVE_SUM = np.triu(np.ones((NUM_TYPES, NUM_TYPES), dtype=np.float32))
+
+
+class BatchGame:
+    """Game logic for playing many rounds of SushiGo in lockstep
+
+    Hands and played cards are count matrices of shape
+    (num_games, num_players, 10). Each pick is one vectorized step for
+    every game, so the Python overhead is per turn instead of per card.
+    """
+
+    def __init__(self, num_cards, players, num_games, update=True, seed=None,
+                 shuffle_seats=True):
+        """Initialize variables"""
+        for player in players:
+            if player.strategy not in ("model", "approx", "random", "rules", "rules2", "worst"):
+                raise ValueError(f"Unsupported batch strategy: {player.strategy}")
+        self.num_cards = num_cards
+        self.num_players = len(players)
+        self.num_games = num_games
+        self.players = players
+        self.update = update
+        self.shuffle_seats = shuffle_seats
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(num_games)
+        self.reset()
+
+    def reset(self):
+        """Resets variables before next batch of games"""
+        shape = (self.num_games, self.num_players)
+        self.deck = new_decks(self.num_games)  # Cards left of each type
+        self.round = 1
+        self.scores = np.zeros(shape, dtype=np.int64)
+        self.previous_scores = np.zeros(shape, dtype=np.int64)
+        self.hands = np.zeros(shape + (NUM_TYPES,), dtype=np.int8)
+        self.played = np.zeros(shape + (NUM_TYPES,), dtype=np.int8)
+        self.nigiri_points = np.zeros(shape, dtype=np.int64)
+        self.open_wasabi = np.zeros(shape, dtype=np.int64)
+        # Seat order per game, next_player[g, p] is who passes to p
+        if self.shuffle_seats:
+            order = np.argsort(self.rng.random(shape), axis=1)
+        else:
+            order = np.tile(np.arange(self.num_players), (self.num_games, 1))
+        seats = np.argsort(order, axis=1)
+        self.next_player = order[
+            self.rows[:, None], (seats + 1) % self.num_players
+        ]
+        # Per player, one (states or slots, actions, has_card) entry per turn
+        self.state_action_pairs = [[] for _ in self.players]
+
+    def deal_cards(self):
+        """Deals out cards from every deck to players' hands, see dealing.py"""
+        self.hands = deal_hands(self.deck, self.num_players, self.num_cards, self.rng)
+
+    def encode_game_states(self, index):
+        """Encoded (hand, played) state of one player for every game"""
+        return np.concatenate([self.hands[:, index], self.played[:, index]], axis=1)
+
+    def choose_cards(self, index, player):
+        """Picks a card type for one player in every game, -1 if hand is empty"""
+        hand = self.hands[:, index]
+        if player.strategy == "random":
+            # Uniform over cards in hand, so weighted by count
+            totals = hand.astype(np.float32) @ INCLUSIVE_SUM
+            target = (self.rng.random(self.num_games) * totals[:, -1]).astype(np.int8)
+            choice = np.argmax(totals > target[:, None], axis=1)
+            choice = np.where(totals[:, -1] > 0, choice, -1)
+        elif player.strategy == "rules":
+            # Player.choose_card_ai removes one of every listed card it holds
+            # and plays the last one it found
+            present = hand > 0
+            choice = np.full(self.num_games, -1)
+            for card in RULES_PRIORITY:
+                choice = np.where(present[:, card], card, choice)
+            hand -= present
+            return choice
+        elif player.strategy in ("rules2", "worst"):
+            # Every card is in the list, so both play the first card in hand
+            present = hand > 0
+            choice = np.argmax(present, axis=1)
+            choice = np.where(present[self.rows, choice], choice, -1)
+        else:
+            choice = self.choose_cards_model(index, player, hand)
+        # One count per game instead of a one-hot row, -1 subtracts nothing
+        self.hands[self.rows, index, choice] -= choice >= 0
+        return choice
+
+    def choose_cards_model(self, index, player, hand):
+        """Epsilon-greedy Q-table picks for every game, see policy.py"""
+        states = self.encode_game_states(index)
+        q_vals, slots, found = lookup(player.q_table, states, player.fallback)
+        actions, choice = select_cards(
+            q_vals,
+            hand,
+            player.epsilon,
+            self.rng,
+            ~found if player.fallback == "random" else None,
+            player.action_space,
+        )
+        if self.update and not player.read_only:
+            self.state_action_pairs[index].append(
+                (states if slots is None else slots, actions, actions >= 0)
+            )
+        return choice
+
+    def update_q_table(self, player, turns, rewards):
+        """Applies one round of rewards to a model player's Q-table"""
+        states, actions, has_card = (np.stack(arrays, axis=1) for arrays in zip(*turns))
+        # Slots are stored (n, turns) for an ArrayQTable that inserts states
+        if isinstance(player.q_table, ArrayQTable) and states.ndim == 2:
+            # Game-major order, the same order as one Game per batch row
+            rewards = np.broadcast_to(rewards[:, None], has_card.shape)
+            slots, actions, rewards = states[has_card], actions[has_card], rewards[has_card]
+            deltas = player.q_table.update_many(
+                slots, actions, rewards, player.alpha, player.gamma
+            )
+            player.q_updates.extend(deltas)
+            if player.replay is not None:
+                # Before maintain(), so the slots are still valid
+                player.replay.add(player.q_table.slot_ranks(slots), actions, rewards)
+                player.replay.replay(player.q_table, player.alpha)
+            return
+        if player.replay is not None:
+            raise ValueError("Replay needs an ArrayQTable, see DenseQTable.from_dict")
+        states = states.tolist()
+        actions = actions.tolist()
+        has_card = has_card.tolist()
+        for game, reward in enumerate(rewards.tolist()):
+            player.state_action_pairs = [
+                (tuple(state), action)
+                for state, action, valid in zip(states[game], actions[game], has_card[game])
+                if valid
+            ]
+            player.update_q_table(reward)
+
+    def play_cards(self, index, choice):
+        """Moves the chosen cards to the played matrix, tracks Wasabi
+
+        index is a seat with a (games,) choice, or slice(None) with a
+        (games, players) choice of every seat.
+        """
+        # A choice of -1 (empty hand) matches no type and scores nothing
+        self.played[:, index] += choice[..., None] == TYPE_IDS
+        nigiri = NIGIRI_VALUES[choice]
+        wasabi = self.open_wasabi[:, index]
+        boosted = (nigiri > 0) & (wasabi > 0)
+        self.nigiri_points[:, index] += np.where(boosted, 3 * nigiri, nigiri)
+        wasabi += (choice == WASABI).astype(np.int64) - boosted
+
+    def play_round(self):
+        """Plays a single round of every game"""
+        for i in range(self.num_cards):
+            # A pick only reads the seat's own hand and played cards, so every
+            # seat picks first and the cards are played in one step
+            choices = [
+                self.choose_cards(index, player) for index, player in enumerate(self.players)
+            ]
+            self.play_cards(slice(None), np.stack(choices, axis=1))
+            if i != self.num_cards - 1:
+                self.hands = self.hands[self.rows[:, None], self.next_player]
+
+    def score_round(self):
+        """Scores each player in every game based on played cards"""
+        played = self.played
+        score = score_counts_batch(played, self.nigiri_points)
+        self.scores += score + self.maki_points(played @ MAKI_VALUES)
+
+        if self.update:
+            rewards = self.scores - self.previous_scores
+            for index, player in enumerate(self.players):
+                if self.state_action_pairs[index]:
+                    self.update_q_table(
+                        player, self.state_action_pairs[index], rewards[:, index]
+                    )
+                    self.state_action_pairs[index] = []
+            # No slots are held past here, so capped tables may evict
+            for player in self.players:
+                if isinstance(player.q_table, ArrayQTable):
+                    player.q_table.maintain()
+        self.played = np.zeros_like(self.played)
+        self.nigiri_points[:] = 0
+        self.open_wasabi[:] = 0
+        self.round += 1
+        self.previous_scores = self.scores.copy()
+
+    def maki_points(self, makis):
+        """6 points split among most maki, 3 among second most"""
+        return maki_points_batch(makis)
+
+    def ending(self):
+        """Returns the scores as an array of shape (num_games, num_players)"""
+        return self.scores
+
+    def winners(self):
+        """Index of the winning player in every game, -1 for a tie"""
+        top_two = -np.partition(-self.scores, 1, axis=1)[:, :2]
+        winners = np.argmax(self.scores, axis=1)
+        return np.where(top_two[:, 0] != top_two[:, 1], winners, -1)
@@ -0,0 +1,490 @@
+"""
+Seeded benchmark suite for simulation, decision and learning throughput
+
+    python bench.py run [--quick] [--out results.json]
+    python bench.py compare baseline.json results.json [--tolerance 0.1]
+    python bench.py learning [--games 200000] [--max-states N] [--replay N] [--out curves.json]
+    python bench.py distill q_table.pkl q_network.npz [--cards 5] [--out results.json]
+
+run prints every case and writes them as JSON. compare lists the cases
+that got worse than the baseline by more than the tolerance and the
+baseline cases missing from the current run (renamed, crashed, or
+--quick against a full run), and exits with status 1 if there are any,
+so it can gate a change to the hot loop. Timings are the best of several
+repeats to reduce noise. learning trains a fresh table in each action
+space and records greedy win rate against the number of training games;
+--max-states adds a run with a CappedQTable and --replay runs with
+uniform and prioritized replay buffers of N picks.
+distill plays a table and the approx.QNetwork distilled from it against
+random opponents and times both per decision and batched.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import argparse
+import io
+import json
+import pickle
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from approx import QNetwork
+from batch_game import BatchGame
+from cards import DECK_COUNTS, NUM_TYPES, new_cards
+from game import Game
+from player import Player
+from policy import ACTION_SPACES, choose_actions, load_table
+from qtable import NUM_ACTIONS, CappedQTable, DenseQTable, StateRanker
+from replay import ReplayBuffer
+from scoring import score_played
+from telemetry import EpsilonSchedule
+
+SEED = 0
+NUM_CARDS = 8
+REPEATS = 3
+STRATEGIES = ["model", "random", "rules", "rules2", "worst"]
+# "rules" can empty other hands, so it only plays against itself
+STRATEGY_MIXES = {
+    "random": ["random"],
+    "model": ["model", "random"],
+    "rules2": ["rules2", "worst", "random"],
+    "rules": ["rules"],
+}
+TABLE_SIZES = [1_000, 10_000, 100_000]
+QUICK_TABLE_SIZES = [1_000, 10_000]
+LEARNING_NUM_CARDS = 5
+LEARNING_BATCH = 1000
+LEARNING_EVAL_GAMES = 20000
+
+
+def seed_all(seed):
+    """Seeds the random and np.random modules"""
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def best_time(function, repeats=REPEATS):
+    """Fastest of `repeats` calls of function, in seconds"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def result(value, unit, higher_is_better=True):
+    """One benchmark result as stored in the JSON output"""
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def make_players(strategies):
+    """Players with fresh tables, model players explore half the time"""
+    return [
+        Player(f"P{i}", strategy, None, epsilon=0.5, q_table_path=None)
+        for i, strategy in enumerate(strategies)
+    ]
+
+
+def random_hands(count, size, seed=SEED):
+    """count sorted hands of `size` cards drawn from the deck"""
+    rng = random.Random(seed)
+    deck = [card for card, copies in enumerate(DECK_COUNTS) for _ in range(copies)]
+    return [sorted(rng.sample(deck, size)) for _ in range(count)]
+
+
+def bench_games(num_games):
+    """Games/sec of Game for every strategy mix and 2-5 players"""
+    results = {}
+    for mix_name, mix in STRATEGY_MIXES.items():
+        for num_players in range(2, 6):
+            strategies = [mix[i % len(mix)] for i in range(num_players)]
+
+            def play():
+                seed_all(SEED)
+                game = Game(NUM_CARDS, make_players(strategies), print_info=False, seed=SEED)
+                for _ in range(num_games):
+                    game.reset()
+                    game.deal_cards()
+                    game.play_round()
+                    game.score_round()
+
+            seconds = best_time(play)
+            results[f"games/{mix_name}/{num_players}p"] = result(
+                num_games / seconds, "games/s"
+            )
+    return results
+
+
+def bench_decisions(num_decisions):
+    """Decisions/sec of Player.choose_card_ai per strategy"""
+    hands = random_hands(num_decisions, NUM_CARDS)
+    states = []
+    for hand in hands:
+        counts = [0] * NUM_TYPES
+        for card in hand:
+            counts[card] += 1
+        states.append((hand, counts))
+    results = {}
+    for strategy in STRATEGIES:
+        player = make_players([strategy])[0]
+
+        def decide(player=player):
+            seed_all(SEED)
+            for hand, counts in states:
+                player.hand = new_cards(hand)
+                player.hand_counts = counts[:]
+                player.choose_card_ai((*player.hand_counts, *player.played_counts))
+
+        seconds = best_time(decide)
+        results[f"decisions/{strategy}"] = result(num_decisions / seconds, "decisions/s")
+    # Every decision in one policy.choose_actions call
+    player = make_players(["model"])[0]
+    matrix = np.array([counts + [0] * NUM_TYPES for _, counts in states])
+    rng = np.random.default_rng(SEED)
+    seconds = best_time(lambda: player.choose_actions(matrix, rng=rng))
+    results["decisions/model_batched"] = result(num_decisions / seconds, "decisions/s")
+    return results
+
+
+def bench_scoring(num_rounds, num_players=3):
+    """Game.score_round calls per second on distinct played sequences
+
+    score_round is the cold case, score_played's cache is cleared before
+    every repeat; score_round_warm scores the same rounds again from the
+    cache, as a long training run mostly does.
+    """
+    hands = random_hands(num_rounds * num_players, NUM_CARDS)
+    rng = random.Random(SEED)
+    for hand in hands:
+        rng.shuffle(hand)
+    players = make_players(["random"] * num_players)
+    game = Game(NUM_CARDS, players, print_info=False, update=False)
+    rounds = [hands[i:i + num_players] for i in range(0, len(hands), num_players)]
+
+    def score():
+        for played in rounds:
+            for player, cards in zip(players, played):
+                player.played_cards = new_cards(cards)
+            game.score_round()
+
+    def score_cold():
+        score_played.cache_clear()
+        score()
+
+    cold = best_time(score_cold)
+    score()
+    warm = best_time(score)
+    return {
+        "score_round": result(num_rounds / cold, "rounds/s"),
+        "score_round_warm": result(num_rounds / warm, "rounds/s"),
+    }
+
+
+def random_states(num_states, seed=SEED):
+    """num_states distinct valid state tuples for NUM_CARDS"""
+    ranker = StateRanker(NUM_CARDS)
+    rng = np.random.default_rng(seed)
+    ranks = rng.choice(ranker.num_states, num_states, replace=False)
+    return [tuple(state) for state in ranker.unrank_many(ranks).tolist()]
+
+
+def build_table(kind, states):
+    """A dict or DenseQTable holding a random row for each state"""
+    rng = np.random.default_rng(SEED)
+    values = rng.random((len(states), NUM_ACTIONS)).tolist()
+    table = dict(zip(states, values))
+    return table if kind == "dict" else DenseQTable.from_dict(table, NUM_CARDS)
+
+
+def table_bytes(kind, states):
+    """Bytes allocated for a table of the states, keys included"""
+    if kind == "dense":
+        return build_table(kind, states).nbytes()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    table = build_table(kind, [tuple(state) for state in states])
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del table
+    return used
+
+
+def bench_tables(sizes, num_lookups):
+    """Lookup/update latency, memory per state and pickle times per table size"""
+    results = {}
+    for size in sizes:
+        states = random_states(size)
+        rng = random.Random(SEED)
+        lookups = [rng.choice(states) for _ in range(num_lookups)]
+        actions = [rng.randrange(NUM_ACTIONS) for _ in range(num_lookups)]
+        for kind in ("dict", "dense"):
+            table = build_table(kind, states)
+            name = f"qtable/{kind}/{size}"
+
+            def lookup(table=table):
+                for state in lookups:
+                    table.setdefault(state, [0.0] * NUM_ACTIONS)
+
+            seconds = best_time(lookup)
+            results[f"{name}/lookup"] = result(
+                1e9 * seconds / num_lookups, "ns", higher_is_better=False
+            )
+
+            player = make_players(["model"])[0]
+            player.q_table = table
+
+            def update(player=player):
+                player.state_action_pairs = list(zip(lookups, actions))
+                player.update_q_table(1.0)
+
+            seconds = best_time(update)
+            results[f"{name}/update"] = result(
+                1e9 * seconds / num_lookups, "ns", higher_is_better=False
+            )
+            results[f"{name}/bytes_per_state"] = result(
+                table_bytes(kind, states) / size, "B", higher_is_better=False
+            )
+
+            buffer = io.BytesIO()
+            seconds = best_time(lambda table=table: pickle.dump(table, io.BytesIO()))
+            pickle.dump(table, buffer)
+            results[f"{name}/pickle_save"] = result(
+                1e3 * seconds, "ms", higher_is_better=False
+            )
+            data = buffer.getvalue()
+            seconds = best_time(lambda data=data: pickle.loads(data))
+            results[f"{name}/pickle_load"] = result(
+                1e3 * seconds, "ms", higher_is_better=False
+            )
+    return results
+
+
+def win_rate(learner, opponents, num_games, seed, num_cards=LEARNING_NUM_CARDS):
+    """Greedy win rate of learner in num_games BatchGames"""
+    epsilon = learner.epsilon
+    learner.epsilon = 0
+    game = BatchGame(num_cards, [learner] + opponents, num_games, update=False, seed=seed)
+    game.deal_cards()
+    game.play_round()
+    game.score_round()
+    learner.epsilon = epsilon
+    return float(np.mean(game.winners() == 0))
+
+
+def learning_curve(action_space, total_games, every, seed=SEED, max_states=None,
+                   replay=None):
+    """[(games, greedy win rate, table size)] while training one table
+
+    Epsilon falls linearly from 0.9 to 0.05 over the run, so short runs
+    still end mostly greedy. max_states trains a CappedQTable instead,
+    replay is a dict of ReplayBuffer settings.
+    """
+    learner = Player("AI1", "model", None, epsilon=0.9, alpha=0.05, gamma=0.9,
+                     q_table_path=None, action_space=action_space)
+    if max_states:
+        learner.q_table = CappedQTable(LEARNING_NUM_CARDS, max_states=max_states)
+    else:
+        learner.q_table = DenseQTable(LEARNING_NUM_CARDS)
+    if replay:
+        learner.replay = ReplayBuffer(**replay, seed=seed)
+    opponents = make_players(["random", "random"])
+    schedule = EpsilonSchedule(0.9, 0.05, "linear", horizon=total_games)
+    game = BatchGame(LEARNING_NUM_CARDS, [learner] + opponents, LEARNING_BATCH, seed=seed)
+    curve = [(0, win_rate(learner, opponents, LEARNING_EVAL_GAMES, (seed, 0)), 0)]
+    for games in range(0, total_games, LEARNING_BATCH):
+        game.reset()
+        learner.epsilon = schedule(games)
+        game.deal_cards()
+        game.play_round()
+        game.score_round()
+        played = games + LEARNING_BATCH
+        if played % every == 0:
+            rate = win_rate(learner, opponents, LEARNING_EVAL_GAMES, (seed, played))
+            curve.append((played, rate, len(learner.q_table)))
+    return curve
+
+
+def run_learning(total_games, every, seed=SEED, max_states=None, replay_capacity=None):
+    """Learning curves of every action space, plus a capped table if max_states
+    and replay buffers of replay_capacity picks"""
+    curves = {
+        space: learning_curve(space, total_games, every, seed) for space in ACTION_SPACES
+    }
+    if max_states:
+        curves["capped"] = learning_curve("position", total_games, every, seed, max_states)
+    if replay_capacity:
+        for name, prioritized in (("replay", False), ("prioritized", True)):
+            curves[name] = learning_curve(
+                "position", total_games, every, seed,
+                replay={"capacity": replay_capacity, "prioritized": prioritized},
+            )
+    return {
+        "meta": {"seed": seed, "num_cards": LEARNING_NUM_CARDS, "games": total_games,
+                 "eval_games": LEARNING_EVAL_GAMES, "max_states": max_states,
+                 "replay_capacity": replay_capacity},
+        "curves": curves,
+    }
+
+
+def run(quick=False):
+    """Every benchmark case, quick uses fewer games and smaller tables"""
+    scale = 1 if quick else 5
+    results = {}
+    results.update(bench_games(200 * scale))
+    results.update(bench_decisions(4000 * scale))
+    results.update(bench_scoring(1000 * scale))
+    results.update(bench_tables(QUICK_TABLE_SIZES if quick else TABLE_SIZES, 4000 * scale))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "seed": SEED,
+            "num_cards": NUM_CARDS,
+            "quick": quick,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def bench_approx(table, network, num_cards=LEARNING_NUM_CARDS, num_games=LEARNING_EVAL_GAMES,
+                 num_decisions=20_000, seed=SEED):
+    """Win rate, decisions/sec and size of a table and its distilled network
+
+    Both play greedily against two random players; the table reads unseen
+    states as zero rows without storing them.
+    """
+    table_player = Player("Table", "model", None, epsilon=0, q_table_path=None,
+                          fallback="zeros", action_space=network.action_space)
+    table_player.q_table = table
+    approx_player = Player("Approx", "approx", network, epsilon=0)
+    opponents = make_players(["random", "random"])
+    states = []
+    for hand in random_hands(num_decisions, num_cards, seed):
+        counts = [0] * NUM_TYPES
+        for card in hand:
+            counts[card] += 1
+        states.append((hand, counts))
+    matrix = np.array([counts + [0] * NUM_TYPES for _, counts in states])
+    results = {}
+    for name, player in (("table", table_player), ("approx", approx_player)):
+        results[f"{name}/win_rate"] = result(
+            100 * win_rate(player, opponents, num_games, seed, num_cards), "%"
+        )
+
+        def decide(player=player):
+            seed_all(seed)
+            for hand, counts in states:
+                player.hand = new_cards(hand)
+                player.hand_counts = counts[:]
+                player.choose_card_ai((*player.hand_counts, *player.played_counts))
+
+        seconds = best_time(decide)
+        results[f"{name}/decisions"] = result(num_decisions / seconds, "decisions/s")
+        seconds = best_time(lambda player=player: choose_actions(
+            player.q_table, matrix, fallback="zeros", action_space=player.action_space
+        ))
+        results[f"{name}/decisions_batched"] = result(num_decisions / seconds, "decisions/s")
+    results["table/bytes"] = result(len(pickle.dumps(table)), "bytes", higher_is_better=False)
+    results["approx/bytes"] = result(network.nbytes, "bytes", higher_is_better=False)
+    return results
+
+
+def compare(baseline, current, tolerance=0.1):
+    """(name, baseline, current, change) of cases worse than tolerance
+
+    change is the relative change in the direction of "better", so a
+    regression has change < -tolerance.
+    """
+    regressions = []
+    for name, old in baseline["results"].items():
+        new = current["results"].get(name)
+        if new is None or not old["value"]:
+            continue  # Missing cases are reported by missing_cases
+        change = new["value"] / old["value"] - 1
+        if not old["higher_is_better"]:
+            change = old["value"] / new["value"] - 1 if new["value"] else float("inf")
+        if change < -tolerance:
+            regressions.append((name, old["value"], new["value"], change))
+    return regressions
+
+
+def missing_cases(baseline, current):
+    """Names of baseline cases the current results do not have"""
+    return [name for name in baseline["results"] if name not in current["results"]]
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run every case")
+    run_parser.add_argument("--quick", action="store_true", help="smaller cases")
+    run_parser.add_argument("--out", help="JSON file to write the results to")
+    compare_parser = commands.add_parser("compare", help="flag regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    learning_parser = commands.add_parser("learning", help="win rate vs games")
+    learning_parser.add_argument("--games", type=int, default=200_000)
+    learning_parser.add_argument("--every", type=int, default=20_000)
+    learning_parser.add_argument("--max-states", type=int, help="also train a capped table")
+    learning_parser.add_argument("--replay", type=int, help="also train with replay buffers")
+    learning_parser.add_argument("--out", help="JSON file to write the curves to")
+    distill_parser = commands.add_parser("distill", help="table vs distilled network")
+    distill_parser.add_argument("table")
+    distill_parser.add_argument("network")
+    distill_parser.add_argument("--cards", type=int, default=LEARNING_NUM_CARDS)
+    distill_parser.add_argument("--games", type=int, default=LEARNING_EVAL_GAMES)
+    distill_parser.add_argument("--out", help="JSON file to write the results to")
+    args = parser.parse_args(argv)
+
+    if args.command == "learning":
+        output = run_learning(args.games, args.every, max_states=args.max_states,
+                              replay_capacity=args.replay)
+        print(f"{'Games':>10}" + "".join(f"{name:>12}" for name in output["curves"]))
+        for points in zip(*output["curves"].values()):
+            print(f"{points[0][0]:>10}" + "".join(f"{rate:>12.4f}" for _, rate, _ in points))
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as file:
+                json.dump(output, file, indent=2)
+        return 0
+
+    if args.command in ("run", "distill"):
+        if args.command == "run":
+            output = run(args.quick)
+        else:
+            output = {"results": bench_approx(
+                load_table(args.table), QNetwork.load(args.network), args.cards, args.games
+            )}
+        for name, case in output["results"].items():
+            print(f"{name:<36}{case['value']:>16,.1f} {case['unit']}")
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as file:
+                json.dump(output, file, indent=2)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.current, encoding="utf-8") as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, args.tolerance)
+    missing = missing_cases(baseline, current)
+    for name, old, new, change in regressions:
+        print(f"REGRESSION {name}: {old:,.1f} -> {new:,.1f} ({100 * change:+.1f}%)")
+    for name in missing:
+        print(f"MISSING {name}: in the baseline but not in {args.current}")
+    if not regressions:
+        print("No regressions beyond", f"{100 * args.tolerance:.0f}%")
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Microbenchmark of decisions/sec for Game.play_round, comparing the
+incrementally maintained state key with the old per-decision encoding
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import random
+import time
+
+import numpy as np
+
+from game import Game
+from player import Player
+
+NUM_CARDS = 8
+NUM_GAMES = 5000
+STRATEGIES = ["model", "random", "random"]
+
+
+class EncodingGame(Game):
+    """Game with the old turn loop: copies the hand and played cards into
+    a dict and re-encodes them with NumPy for every decision"""
+
+    def play_round(self):
+        """Plays a single round of the game"""
+        for i in range(self.num_cards):
+            for player in self.players:
+                game_state = {
+                    "hand": list(player.hand),
+                    "played_cards": list(player.played_cards),
+                }
+                encoded_state = self.encode_game_state(game_state)
+                player.choose_card_ai(encoded_state, self.update)
+            if i != self.num_cards - 1:
+                hands = [(player.hand, player.hand_counts) for player in self.players]
+                for j, player in enumerate(self.players):
+                    player.hand, player.hand_counts = hands[(j + 1) % len(self.players)]
+
+
+def decisions_per_second(game_class, seed=0):
+    """Decisions/sec over NUM_GAMES seeded games of game_class"""
+    random.seed(seed)
+    np.random.seed(seed)
+    players = [
+        Player(f"P{i}", strategy, None, epsilon=0.5, q_table_path=None)
+        for i, strategy in enumerate(STRATEGIES)
+    ]
+    game = game_class(num_cards=NUM_CARDS, players=players, print_info=False, seed=seed)
+    start = time.perf_counter()
+    for _ in range(NUM_GAMES):
+        game.reset()
+        random.shuffle(game.players)
+        game.deal_cards()
+        game.play_round()
+        game.score_round()
+    elapsed = time.perf_counter() - start
+    return NUM_GAMES * NUM_CARDS * len(players) / elapsed
+
+
+if __name__ == "__main__":
+    old = decisions_per_second(EncodingGame)
+    new = decisions_per_second(Game)
+    print(f"Per-decision encoding: {old:,.0f} decisions/sec")
+    print(f"Incremental state key: {new:,.0f} decisions/sec")
+    print(f"Speedup: {new / old:.2f}x")
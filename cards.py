@@ -0,0 +1,66 @@
+"""
+Card ids, the compact card representation used by Game and Player
+
+Cards are small ints in the order of Game.card_type_indices, which is
+alphabetical, so sorting ids sorts a hand the same way as sorting names.
+Names are only used when printing or reading input.
+"""
+
+from array import array
+
+CARD_TYPES = [
+    "Dumpling",
+    "EggNigiri",
+    "Maki1",
+    "Maki2",
+    "Maki3",
+    "SalmonNigiri",
+    "Sashimi",
+    "SquidNigiri",
+    "Tempura",
+    "Wasabi",
+]
+CARD_TYPE_INDICES = {name: card for card, name in enumerate(CARD_TYPES)}
+NUM_TYPES = len(CARD_TYPES)
+
+(
+    DUMPLING,
+    EGG_NIGIRI,
+    MAKI1,
+    MAKI2,
+    MAKI3,
+    SALMON_NIGIRI,
+    SASHIMI,
+    SQUID_NIGIRI,
+    TEMPURA,
+    WASABI,
+) = range(NUM_TYPES)
+NO_CARD = -1  # Played when a hand is already empty
+
+DECK_COUNTS = [14, 5, 6, 12, 8, 10, 14, 5, 14, 6]
+NIGIRI_VALUES = [0, 1, 0, 0, 0, 2, 0, 3, 0, 0]
+MAKI_VALUES = [0, 0, 1, 2, 3, 0, 0, 0, 0, 0]
+
+# Priority lists of the "rules", "rules2" and "worst" strategies
+RULES_PRIORITY = [
+    SQUID_NIGIRI, SASHIMI, WASABI, TEMPURA, SALMON_NIGIRI,
+    MAKI3, DUMPLING, MAKI2, EGG_NIGIRI, MAKI1,
+]
+RULES2_PRIORITY = [
+    DUMPLING, SQUID_NIGIRI, TEMPURA, SALMON_NIGIRI, SASHIMI,
+    MAKI3, MAKI2, EGG_NIGIRI, WASABI, MAKI1,
+]
+WORST_PRIORITY = [
+    WASABI, MAKI1, EGG_NIGIRI, MAKI2, MAKI3,
+    SASHIMI, SALMON_NIGIRI, DUMPLING, TEMPURA, SQUID_NIGIRI,
+]
+
+
+def new_cards(cards=()):
+    """Compact signed-byte array of card ids"""
+    return array("b", cards)
+
+
+def card_names(cards):
+    """Names of card ids, for printing"""
+    return [CARD_TYPES[card] for card in cards if card != NO_CARD]
@@ -0,0 +1,140 @@
+"""
+Incremental checkpoints of a DenseQTable and the training loop around it
+
+A checkpoint directory holds:
+    snapshot.qmap - the whole table at the last compaction (qtable_file format)
+    deltas.log - rows changed since then, appended at every save
+    state.pkl - training state (counters, RNG states, evaluation history)
+state.pkl records how much of deltas.log it belongs to, so a run killed
+halfway through an append resumes from the last complete save.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import os
+import pickle
+import random
+
+import numpy as np
+
+from qtable import NUM_ACTIONS, DenseQTable
+from qtable_file import MappedQTable, table_arrays, write_mapped
+
+SNAPSHOT = "snapshot.qmap"
+DELTAS = "deltas.log"
+STATE = "state.pkl"
+
+
+def rng_states(*generators):
+    """RNG states of the random and np.random modules plus any Generators"""
+    return {
+        "random": random.getstate(),
+        "numpy": np.random.get_state(),
+        "generators": [generator.bit_generator.state for generator in generators],
+    }
+
+
+def restore_rng_states(states, *generators):
+    """Inverse of rng_states"""
+    random.setstate(states["random"])
+    np.random.set_state(states["numpy"])
+    for generator, state in zip(generators, states["generators"]):
+        generator.bit_generator.state = state
+
+
+class Checkpointer:
+    """Appends changed Q rows to a log and compacts it into a snapshot"""
+
+    def __init__(self, directory, compact_every=20):
+        """Initialize variables"""
+        self.directory = directory
+        self.compact_every = compact_every
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        """Path of a file in the checkpoint directory"""
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        """True if there is a checkpoint to resume from"""
+        return os.path.exists(self.path(STATE))
+
+    def read_state(self):
+        """Checkpoint bookkeeping plus the saved training state"""
+        if not self.exists():
+            return {"log_size": 0, "saves": 0, "training": None}
+        with open(self.path(STATE), "rb") as file:
+            return pickle.load(file)
+
+    def write_state(self, state):
+        """Atomically replaces state.pkl"""
+        temp = self.path(STATE + ".tmp")
+        with open(temp, "wb") as file:
+            pickle.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path(STATE))
+
+    def save(self, table, training):
+        """Appends the rows changed since the last save, then the state
+
+        Every compact_every saves the log is folded into a new snapshot.
+        """
+        state = self.read_state()
+        slots = np.flatnonzero(table.dirty[:table.size])
+        with open(self.path(DELTAS), "ab") as file:
+            file.truncate(state["log_size"])  # drop a torn append
+            file.seek(state["log_size"])
+            file.write(np.array([len(slots)], dtype=np.int64).tobytes())
+            file.write(table.state_ranks[slots].tobytes())
+            file.write(table.q_values[slots].tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+            state["log_size"] = file.tell()
+        table.mark_clean()
+        state["saves"] += 1
+        state["num_cards"] = table.num_cards
+        state["training"] = training
+        self.write_state(state)
+        if state["saves"] % self.compact_every == 0 or not os.path.exists(
+            self.path(SNAPSHOT)
+        ):
+            self.compact(table, state)
+
+    def compact(self, table, state=None):
+        """Writes the whole table as the snapshot and empties the log
+
+        Replaying the old log over the new snapshot is harmless, so a run
+        killed between these steps still resumes correctly.
+        """
+        state = state or self.read_state()
+        ranks, values = table_arrays(table, table.num_cards)
+        temp = self.path(SNAPSHOT + ".tmp")
+        write_mapped(temp, ranks, values, table.num_cards)
+        os.replace(temp, self.path(SNAPSHOT))
+        state["log_size"] = 0
+        self.write_state(state)
+        with open(self.path(DELTAS), "wb"):
+            pass
+
+    def load(self):
+        """Rebuilds the table and returns (table, training state)"""
+        state = self.read_state()
+        snapshot = MappedQTable(self.path(SNAPSHOT))
+        table = DenseQTable.from_arrays(
+            np.array(snapshot.state_ranks), np.array(snapshot.q_values), state["num_cards"]
+        )
+        del snapshot
+        if state["log_size"]:
+            log = np.fromfile(self.path(DELTAS), dtype=np.uint8, count=state["log_size"])
+            position = 0
+            while position < len(log):
+                count = int(log[position:position + 8].view(np.int64)[0])
+                position += 8
+                ranks = log[position:position + 8 * count].view(np.int64)
+                position += 8 * count
+                size = 4 * NUM_ACTIONS * count
+                values = log[position:position + size].view(np.float32)
+                position += size
+                table.set_rows(ranks, values.reshape(count, NUM_ACTIONS))
+        table.mark_clean()
+        return table, state["training"]
@@ -0,0 +1,161 @@
+"""
+Deals hands straight from counts of the cards left, no deck is built
+
+A hand of n cards from a deck holding counts[t] cards of each type is a
+multivariate hypergeometric draw. deal_hands samples it one type at a
+time for many games at once: the number of type t cards is hypergeometric
+given the cards of the later types and the cards still to draw, read off
+a precomputed CDF table so every step is a few vectorized operations.
+Dealer hands out batches of deal_hands one game at a time for Game, and
+deal_hand_counts draws later rounds of a single game card by card in
+plain Python, which is cheaper than NumPy calls for one game.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+from functools import lru_cache
+
+import numpy as np
+
+from cards import DECK_COUNTS, NUM_TYPES
+
+MAX_TYPE_COUNT = max(DECK_COUNTS)
+DECK_SIZE = sum(DECK_COUNTS)
+DEAL_BATCH = 1024  # Games a Dealer deals at once
+FIRST_DEAL_BATCH = 32
+
+
+def new_decks(num_games):
+    """Cards left of each type for num_games fresh decks, (num_games, 10)"""
+    return np.tile(np.array(DECK_COUNTS, dtype=np.int64), (num_games, 1))
+
+
+@lru_cache(maxsize=None)
+def hypergeometric_cdf(num_cards):
+    """P(X <= x) of drawing x of `good` cards in n draws from good + bad
+
+    Returned as a (num_cards + 1, rows) array whose column
+    (good * (DECK_SIZE + 1) + bad) * (num_cards + 1) + n holds the CDF
+    over x, so one np.take gathers it for many games.
+    """
+    # Binomial coefficients, exact in float64 at these sizes
+    choose = np.zeros((MAX_TYPE_COUNT + DECK_SIZE + 1, num_cards + 1))
+    choose[:, 0] = 1
+    for total in range(1, len(choose)):
+        choose[total, 1:] = choose[total - 1, 1:] + choose[total - 1, :-1]
+    good = np.arange(MAX_TYPE_COUNT + 1)[:, None, None, None]
+    bad = np.arange(DECK_SIZE + 1)[None, :, None, None]
+    draws = np.arange(num_cards + 1)[None, None, :, None]
+    drawn = np.arange(num_cards + 1)[None, None, None, :]
+    rest = draws - drawn
+    pmf = choose[good, drawn] * np.where(rest >= 0, choose[bad, np.maximum(rest, 0)], 0)
+    ways = choose[good + bad, draws]
+    pmf = np.divide(pmf, ways, out=np.zeros(pmf.shape), where=ways > 0)
+    cdf = np.cumsum(pmf, axis=-1).reshape(-1, num_cards + 1)
+    return np.ascontiguousarray(cdf.T)
+
+
+def deal_hands(decks, num_players, num_cards, rng):
+    """(games, players, 10) hand counts drawn from (games, 10) decks
+
+    The dealt cards are removed from decks in place. rng is a
+    np.random.Generator.
+    """
+    num_games = len(decks)
+    # The last row, P(X <= num_cards), is always 1
+    cdf = hypergeometric_cdf(num_cards)[:num_cards]
+    hands = np.zeros((num_players, NUM_TYPES, num_games), dtype=np.int64)
+    left_of_type = np.ascontiguousarray(decks.T)
+    uniforms = rng.random((num_players, NUM_TYPES - 1, num_games))
+    for player in range(num_players):
+        hand = hands[player]
+        to_draw = np.full(num_games, num_cards, dtype=np.int64)
+        later = left_of_type.sum(axis=0)
+        for card in range(NUM_TYPES - 1):
+            good = left_of_type[card]
+            later -= good
+            rows = np.take(cdf, (good * (DECK_SIZE + 1) + later) * (num_cards + 1) + to_draw,
+                           axis=1)
+            # Inverse CDF: the number of x with P(X <= x) <= u
+            drawn = (uniforms[player, card] >= rows).view(np.uint8).sum(axis=0, dtype=np.uint8)
+            # Only float rounding can push past the cards there are
+            drawn = np.minimum(drawn, good)
+            hand[card] = drawn
+            good -= drawn
+            to_draw -= drawn
+        hand[NUM_TYPES - 1] = to_draw
+        left_of_type[NUM_TYPES - 1] -= to_draw
+    decks[:] = left_of_type.T
+    return hands.transpose(2, 0, 1).astype(np.int8)
+
+
+def deal_hand_counts(deck, num_players, num_cards, rng):
+    """One game's hands as lists of counts, drawn from a list of counts
+
+    Cards are drawn one at a time without replacement; deck is updated in
+    place.
+    """
+    draws = rng.random(num_players * num_cards).tolist()
+    total = sum(deck)
+    hands = []
+    for player in range(num_players):
+        counts = [0] * NUM_TYPES
+        for draw in draws[player * num_cards:(player + 1) * num_cards]:
+            position = int(draw * total)
+            card = 0
+            while position >= deck[card]:
+                position -= deck[card]
+                card += 1
+            deck[card] -= 1
+            counts[card] += 1
+            total -= 1
+        hands.append(counts)
+    return hands
+
+
+class Dealer:
+    """Deals fresh games in batches and hands them out one at a time
+
+    Game takes its first round from here, so dealing a game costs a few
+    list operations. Batches start small and double up to batch_size, so a
+    Game that plays once does not deal a thousand games.
+    """
+
+    def __init__(self, num_players, num_cards, rng, batch_size=DEAL_BATCH):
+        """Initialize variables"""
+        self.num_players = num_players
+        self.num_cards = num_cards
+        self.rng = rng
+        self.batch_size = batch_size
+        self.next_size = min(FIRST_DEAL_BATCH, batch_size)
+        self.decks = []
+        self.counts = []
+        self.cards = b""
+        self.position = 0
+
+    def refill(self):
+        """Deals the next batch of games"""
+        size = self.next_size
+        self.next_size = min(2 * size, self.batch_size)
+        decks = new_decks(size)
+        hands = deal_hands(decks, self.num_players, self.num_cards, self.rng)
+        # Card ids of every hand in sorted order, as one block of bytes
+        bounds = np.cumsum(hands, axis=2)
+        cards = (bounds[..., None, :] <= np.arange(self.num_cards)[:, None]).sum(axis=3)
+        self.decks = decks.tolist()
+        self.counts = hands.tolist()
+        self.cards = cards.astype(np.int8).tobytes()
+        self.position = 0
+
+    def next_game(self):
+        """(deck counts left, [(hand card ids, hand counts)] per player)"""
+        if self.position == len(self.decks):
+            self.refill()
+        game = self.position
+        self.position += 1
+        start = game * self.num_players * self.num_cards
+        hands = [
+            (self.cards[start + player * self.num_cards:start + (player + 1) * self.num_cards],
+             counts)
+            for player, counts in enumerate(self.counts[game])
+        ]
+        return self.decks[game], hands
@@ -0,0 +1,322 @@
+"""
+Endgame search and tablebase for the last few picks of a round
+
+Hands rotate deterministically, so once every hand is down to a few cards
+nothing about the rest of the round is hidden. A position is a count
+vector seen from the seat to move: for every seat in passing order, its
+hand counts followed by what still matters of its played cards for
+scoring (tempura mod 2, sashimi mod 3, dumplings up to 5, unused wasabi,
+maki ahead of the lowest seat). Scoring matches score_played and
+maki_points at the end of the round.
+
+The search is an approximation. In the game every seat picks at once,
+but here seats pick one after another in passing order, the seat to move
+first. Each seat maximizes its own points for the rest of the round
+(max^n), so later seats answer the cards of earlier ones, a
+leader-follower model of each turn. Picks are best replies under that
+model, not an equilibrium of the simultaneous game. Solved positions go
+into a transposition table that saves to disk, so a model player in Game
+looks its last picks up instead of reading the Q-table.
+
+`python endgame.py build tablebase.pkl` precomputes the positions random
+games reach, `python endgame.py check q_table.pkl tablebase.pkl` measures
+how often the learned table's greedy pick agrees with the tablebase.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import pickle
+import random
+import sys
+
+import numpy as np
+
+from cards import DUMPLING, MAKI_VALUES, NIGIRI_VALUES, NUM_TYPES, SASHIMI, TEMPURA, WASABI
+from game import Game
+from player import Player
+from policy import action_cards, choose_actions, load_table
+from scoring import maki_points, score_played
+
+PICKS = 3  # Picks left in a hand when the tablebase takes over
+TABLEBASE_PATH = "tablebase.pkl"
+BUILD_GAMES = 2000
+SEAT_SIZE = NUM_TYPES + 5  # Hand counts, then tempura, sashimi, dumplings, wasabi, maki
+MAX_DUMPLINGS = 5  # More score nothing
+
+
+def play_card(summary, card):
+    """(points, new summary) of playing card on a seat's scoring summary"""
+    tempura, sashimi, dumplings, wasabi, maki = summary
+    value = NIGIRI_VALUES[card]
+    if value:
+        if wasabi:
+            return 3 * value, (tempura, sashimi, dumplings, wasabi - 1, maki)
+        return value, summary
+    if card == TEMPURA:
+        return (6 if tempura else -1), (1 - tempura, sashimi, dumplings, wasabi, maki)
+    if card == SASHIMI:
+        return (12 if sashimi == 2 else -1), (tempura, (sashimi + 1) % 3, dumplings, wasabi, maki)
+    if card == DUMPLING:
+        if dumplings < MAX_DUMPLINGS:
+            return dumplings + 1, (tempura, sashimi, dumplings + 1, wasabi, maki)
+        return 0, summary
+    if card == WASABI:
+        return 0, (tempura, sashimi, dumplings, wasabi + 1, maki)
+    return 0, (tempura, sashimi, dumplings, wasabi, maki + MAKI_VALUES[card])
+
+
+def normalize(position, left):
+    """Drops what cannot change the rest of the round
+
+    Wasabi past the picks left can never be used and only maki
+    differences decide the maki bonus.
+    """
+    position = list(position)
+    lowest = min(position[SEAT_SIZE - 1::SEAT_SIZE])
+    for start in range(NUM_TYPES, len(position), SEAT_SIZE):
+        position[start + 3] = min(position[start + 3], left)
+        position[start + 4] -= lowest
+    return tuple(position)
+
+
+def player_position(players, seat):
+    """Position of a Game's players as seen by players[seat]"""
+    left = len(players[seat].hand)
+    position = []
+    for player in players[seat:] + players[:seat]:
+        _, makis, counts = score_played(player.played_cards.tobytes())
+        played = player.played_counts
+        position += player.hand_counts
+        position += (
+            played[TEMPURA] % 2,
+            played[SASHIMI] % 3,
+            min(played[DUMPLING], MAX_DUMPLINGS),
+            counts[WASABI],  # Unused, score_played spends them on nigiri
+            makis,
+        )
+    return normalize(position, left)
+
+
+class Tablebase:
+    """First-seat card of endgame positions, solved on demand
+
+    Cards are best replies under the seat-order model of the module
+    docstring, where the first seat picks before the others. best maps
+    the bytes of a position to its card and is what gets saved; values
+    keeps the future points of every seat for the search and is rebuilt
+    as needed. Positions of any number of players share a table.
+    """
+
+    def __init__(self, picks=PICKS):
+        """Initialize variables"""
+        self.picks = picks
+        self.best = {}
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def solve(self, position):
+        """(best card of the first seat, future points of every seat)"""
+        key = bytes(position)
+        values = self.values.get(key)
+        if values is None:
+            card, values = self.respond(position, 0, [])
+            self.best[key] = card
+            self.values[key] = values
+        return self.best[key], values
+
+    def respond(self, position, seat, moves):
+        """Best card of seat given the cards of the seats before it"""
+        start = seat * SEAT_SIZE
+        if start == len(position):
+            return None, self.after_turn(position, moves)
+        summary = position[start + NUM_TYPES:start + SEAT_SIZE]
+        best_card, best_values = None, None
+        for card in range(NUM_TYPES):
+            if position[start + card]:
+                moves.append((card, *play_card(summary, card)))
+                _, values = self.respond(position, seat + 1, moves)
+                moves.pop()
+                # Ties go to the lowest card type
+                if best_values is None or values[seat] > best_values[seat]:
+                    best_card, best_values = card, values
+        return best_card, best_values
+
+    def after_turn(self, position, moves):
+        """Points of every seat from this turn to the end of the round"""
+        left = sum(position[:NUM_TYPES]) - 1
+        gains = [points for _, points, _ in moves]
+        if not left:
+            rest = maki_points([summary[4] for _, _, summary in moves])
+            return tuple(gain + points for gain, points in zip(gains, rest))
+        hands = []
+        for seat, (card, _, _) in enumerate(moves):
+            hand = list(position[seat * SEAT_SIZE:seat * SEAT_SIZE + NUM_TYPES])
+            hand[card] -= 1
+            hands.append(hand)
+        # Every seat takes the hand of the next one, like Game.pass_hands
+        hands = hands[1:] + hands[:1]
+        if left == 1:
+            # The last pick is forced, score it without storing the position
+            last = [
+                play_card(summary, hand.index(1)) for hand, (_, _, summary) in zip(hands, moves)
+            ]
+            rest = maki_points([summary[4] for _, summary in last])
+            return tuple(
+                gain + points + bonus for gain, (points, _), bonus in zip(gains, last, rest)
+            )
+        passed = []
+        for hand, (_, _, summary) in zip(hands, moves):
+            passed += hand
+            passed += summary
+        _, rest = self.solve(normalize(passed, left))
+        return tuple(gain + points for gain, points in zip(gains, rest))
+
+    def option_values(self, position):
+        """Points the first seat gets for the rest of the round, by card"""
+        summary = position[NUM_TYPES:SEAT_SIZE]
+        return {
+            card: self.respond(position, 1, [(card, *play_card(summary, card))])[1][0]
+            for card in range(NUM_TYPES)
+            if position[card]
+        }
+
+    def best_card(self, players, seat):
+        """Card type players[seat] should play, O(1) once solved"""
+        position = player_position(players, seat)
+        card = self.best.get(bytes(position))
+        if card is None:
+            self.misses += 1
+            card, _ = self.solve(position)
+        else:
+            self.hits += 1
+        return card
+
+    def picks_for(self, players):
+        """Tablebase card of every model or approx seat, None for the other seats"""
+        return [
+            self.best_card(players, seat) if player.strategy in ("model", "approx") else None
+            for seat, player in enumerate(players)
+        ]
+
+    def save(self, path):
+        """Pickles the solved positions"""
+        with open(path, "wb") as file:
+            pickle.dump({"picks": self.picks, "best": self.best}, file)
+
+    @classmethod
+    def load(cls, path):
+        """Tablebase saved by save"""
+        with open(path, "rb") as file:
+            saved = pickle.load(file)
+        tablebase = cls(saved["picks"])
+        tablebase.best = saved["best"]
+        return tablebase
+
+
+def walk(game, num_games, rounds, picks, visit):
+    """Plays games, calling visit(players) at every turn with picks or fewer left"""
+    num_cards = game.num_cards
+    for _ in range(num_games):
+        game.reset()
+        for _ in range(rounds):
+            game.deal_cards()
+            for turn in range(num_cards):
+                if num_cards - turn <= picks:
+                    visit(game.players)
+                for player in game.players:
+                    player.choose_card_ai(game.state_key(player), False)
+                if turn != num_cards - 1:
+                    game.pass_hands()
+            game.score_round()
+
+
+def build(num_players, num_cards=8, picks=PICKS, num_games=BUILD_GAMES, rounds=1, seed=0):
+    """Tablebase of every position random games reach in their last picks"""
+    random.seed(seed)
+    players = [Player(f"Random{i + 1}", "random", None) for i in range(num_players)]
+    game = Game(num_cards, players, print_info=False, update=False, seed=seed)
+    tablebase = Tablebase(picks)
+
+    def visit(players):
+        for seat in range(num_players):
+            tablebase.best_card(players, seat)
+
+    walk(game, num_games, rounds, picks, visit)
+    return tablebase
+
+
+def compare(q_table, tablebase, num_players=3, num_cards=8, num_games=BUILD_GAMES, rounds=1,
+            seed=0, action_space="position"):
+    """How often the greedy pick of a Q-table agrees with the tablebase
+
+    A model player using q_table plays random opponents; at every endgame
+    turn with a real choice its pick is scored against the tablebase.
+    Regret is the points its pick gives up for the rest of the round, with
+    the other seats answering it as in the tablebase's seat-order model,
+    so it is a reference for comparison, not a true game-theoretic loss.
+    """
+    random.seed(seed)
+    learner = Player("Model", "model", None, epsilon=0.0, q_table_path=None,
+                     fallback="zeros", action_space=getattr(q_table, "action_space", action_space))
+    learner.q_table = q_table
+    players = [learner] + [
+        Player(f"Random{i + 1}", "random", None) for i in range(num_players - 1)
+    ]
+    game = Game(num_cards, players, print_info=False, update=False, seed=seed)
+    decisions = agreements = 0
+    regrets = []
+
+    def visit(players):
+        nonlocal decisions, agreements
+        seat = players.index(learner)
+        if sum(1 for count in learner.hand_counts if count) < 2:
+            return
+        state = np.array([game.state_key(learner)])
+        action = choose_actions(q_table, state, fallback="zeros",
+                                action_space=learner.action_space)
+        card = int(action_cards(state[:, :NUM_TYPES], action, learner.action_space)[0])
+        tablebase.best_card(players, seat)
+        values = tablebase.option_values(player_position(players, seat))
+        regret = max(values.values()) - values[card]
+        decisions += 1
+        agreements += regret == 0
+        regrets.append(regret)
+
+    walk(game, num_games, rounds, tablebase.picks, visit)
+    return {
+        "decisions": decisions,
+        "agreement": agreements / max(decisions, 1),
+        "mean_regret": float(np.mean(regrets)) if regrets else 0.0,
+        "positions": len(tablebase.best),
+    }
+
+
+if __name__ == "__main__":
+    COMMAND = sys.argv[1] if len(sys.argv) > 1 else None
+    if COMMAND == "build" and len(sys.argv) > 2:
+        # python endgame.py build tablebase.pkl [NUM_PLAYERS] [NUM_CARDS] [PICKS] [GAMES]
+        built = build(
+            int(sys.argv[3]) if len(sys.argv) > 3 else 3,
+            int(sys.argv[4]) if len(sys.argv) > 4 else 8,
+            int(sys.argv[5]) if len(sys.argv) > 5 else PICKS,
+            int(sys.argv[6]) if len(sys.argv) > 6 else BUILD_GAMES,
+        )
+        built.save(sys.argv[2])
+        print("Solved", len(built.best), "positions of the last", built.picks, "picks")
+    elif COMMAND == "check" and len(sys.argv) > 3:
+        # python endgame.py check q_table.pkl tablebase.pkl [NUM_PLAYERS] [NUM_CARDS] [GAMES]
+        report = compare(
+            load_table(sys.argv[2]),
+            Tablebase.load(sys.argv[3]),
+            int(sys.argv[4]) if len(sys.argv) > 4 else 3,
+            int(sys.argv[5]) if len(sys.argv) > 5 else 8,
+            int(sys.argv[6]) if len(sys.argv) > 6 else BUILD_GAMES,
+        )
+        print(f"{report['decisions']} endgame decisions, "
+              f"{100 * report['agreement']:.1f}% agree with the tablebase, "
+              f"mean regret {report['mean_regret']:.3f} points "
+              f"(seat-order model, picks are simultaneous in play)")
+    else:
+        print("Usage: python endgame.py build TABLEBASE [NUM_PLAYERS] [NUM_CARDS] [PICKS] [GAMES]")
+        print("       python endgame.py check TABLE TABLEBASE [NUM_PLAYERS] [NUM_CARDS] [GAMES]")
+        sys.exit(1)
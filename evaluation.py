@@ -0,0 +1,261 @@
+"""
+Evaluation games on frozen Q-table snapshots, played in a process pool
+while training continues
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+from batch_game import BatchGame
+from player import Player
+from qtable_file import MappedQTable, export_mapped
+
+
+def evaluate_snapshot(path, player_specs, num_cards, num_games, seed, num_rounds=1,
+                      action_space="position"):
+    """Wins per player name (and ties) for games against a .qmap snapshot
+
+    player_specs is a list of (name, strategy); model players play the
+    snapshot greedily and never add states to it.
+    """
+    players = []
+    for name, strategy in player_specs:
+        player = Player(name, strategy, None, epsilon=0, q_table_path=None,
+                        action_space=action_space)
+        if strategy == "model":
+            player.q_table = MappedQTable(path)
+        players.append(player)
+    game = BatchGame(
+        num_cards=num_cards, players=players, num_games=num_games, update=False, seed=seed
+    )
+    for _ in range(num_rounds):
+        game.deal_cards()
+        game.play_round()
+        game.score_round()
+    won_players = game.winners()
+    wins = {name: int(np.sum(won_players == i)) for i, (name, _) in enumerate(player_specs)}
+    wins["Ties"] = int(np.sum(won_players == -1))
+    return wins
+
+
+def wilson_interval(successes, trials, z):
+    """Wilson score interval of a binomial rate for a normal quantile z"""
+    if trials == 0:
+        return 0.0, 1.0
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    center = (rate + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials))
+    return max(0.0, center - margin / denominator), min(1.0, center + margin / denominator)
+
+
+def bonferroni_z(confidence, max_games, batch_size):
+    """z of a two-sided interval at confidence / number of possible looks"""
+    looks = max(1, -(-max_games // batch_size))
+    return NormalDist().inv_cdf(1 - (1 - confidence) / (2 * looks))
+
+
+def stopping_reason(successes, trials, z, width, threshold=None):
+    """"width" or "threshold" once a win rate is resolved, else None"""
+    low, high = wilson_interval(successes, trials, z)
+    if high - low <= width:
+        return "width"
+    if threshold is not None and (low > threshold or high < threshold):
+        return "threshold"
+    return None
+
+
+def sequential_evaluate(learner, opponents, num_cards, confidence=0.95, width=0.02,
+                        threshold=None, batch_size=1000, min_games=1000,
+                        max_games=100000, seed=0, num_rounds=1):
+    """Plays greedy evaluation games in batches until the win rate is resolved
+
+    Stops once the learner's win-rate interval is narrower than `width`,
+    or, when threshold is given (e.g. 1 / number of players), once the
+    interval lies entirely above or below it. Intervals are Wilson
+    intervals at confidence / number of possible looks (Bonferroni), so
+    stopping early keeps the stated confidence.
+
+    Returns {"games": games played, "stopped": reason, "rates": {name or
+    "Ties": (rate, low, high)}} with the learner listed first.
+    """
+    players = [learner] + list(opponents)
+    names = [player.name for player in players] + ["Ties"]
+    z = bonferroni_z(confidence, max_games, batch_size)
+    counts = np.zeros(len(names), dtype=np.int64)
+    games = 0
+    stopped = "max_games"
+    epsilon = learner.epsilon
+    learner.epsilon = 0
+    try:
+        while games < max_games:
+            game = BatchGame(
+                num_cards=num_cards,
+                players=players,
+                num_games=min(batch_size, max_games - games),
+                update=False,
+                seed=(seed, games),
+            )
+            for _ in range(num_rounds):
+                game.deal_cards()
+                game.play_round()
+                game.score_round()
+            # A tie (-1) lands in the last column
+            counts += np.bincount(game.winners() % len(names), minlength=len(names))
+            games += game.num_games
+            if games < min_games:
+                continue
+            reason = stopping_reason(counts[0], games, z, width, threshold)
+            if reason:
+                stopped = reason
+                break
+    finally:
+        learner.epsilon = epsilon
+    rates = {
+        name: (count / games,) + wilson_interval(count, games, z)
+        for name, count in zip(names, counts.tolist())
+    }
+    return {"games": games, "stopped": stopped, "rates": rates}
+
+
+class Evaluator:
+    """Schedules evaluations of Q-table snapshots and merges their results
+
+    Every snapshot is written as a .qmap file so pool workers share it
+    through the page cache instead of receiving a pickled copy. A merged
+    snapshot is kept until remove_merged, since the last checkpoint may
+    still list it as pending.
+
+    A snapshot is played in waves of batch_size games, split over the
+    workers, with the stopping rule of sequential_evaluate: it is done
+    once the first player's win-rate interval is narrower than width (or
+    clear of threshold), or after num_games games. With width 0 every
+    evaluation plays all num_games.
+    """
+
+    def __init__(self, player_specs, num_cards, num_games, directory="evaluation",
+                 max_workers=None, seed=0, num_rounds=1, action_space="position",
+                 confidence=0.95, width=0.0, threshold=None, batch_size=None, min_games=1000):
+        """Initialize variables"""
+        self.player_specs = player_specs
+        self.action_space = action_space
+        self.num_rounds = num_rounds
+        self.num_cards = num_cards
+        self.num_games = num_games
+        self.directory = directory
+        self.seed = seed
+        self.width = width
+        self.threshold = threshold
+        self.batch_size = min(batch_size or num_games, num_games)
+        self.min_games = min_games
+        self.z = bonferroni_z(confidence, num_games, self.batch_size)
+        self.max_workers = max_workers or os.cpu_count()
+        # Forked workers do not re-run the calling script, which matters for
+        # train.py since it has no __main__ guard
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        self.pending = []  # One dict per snapshot, in submission order
+        self.merged = []  # Snapshot paths merged since the last remove_merged
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, table, games):
+        """Freezes the table after `games` training games and evaluates it"""
+        path = os.path.join(self.directory, f"snapshot_{games}.qmap")
+        temp = path + ".tmp"
+        export_mapped(table, temp, self.num_cards)
+        os.replace(temp, path)
+        self.submit_snapshot(games, path)
+
+    def submit_snapshot(self, games, path):
+        """Evaluates an existing snapshot, starting with its first wave"""
+        wins = {name: 0 for name, _ in self.player_specs}
+        wins["Ties"] = 0
+        evaluation = {
+            "games": games,
+            "path": path,
+            "wins": wins,
+            "played": 0,
+            "waves": 0,
+            "futures": [],
+            "done": False,
+        }
+        self.submit_wave(evaluation)
+        self.pending.append(evaluation)
+
+    def submit_wave(self, evaluation):
+        """Submits the next batch of games of an evaluation, one chunk per worker"""
+        size = min(self.batch_size, self.num_games - evaluation["played"])
+        chunks = np.array_split(np.arange(size), self.max_workers)
+        evaluation["futures"] = [
+            self.pool.submit(
+                evaluate_snapshot,
+                evaluation["path"],
+                self.player_specs,
+                self.num_cards,
+                len(chunk),
+                (self.seed, evaluation["games"], evaluation["waves"], i),
+                self.num_rounds,
+                self.action_space,
+            )
+            for i, chunk in enumerate(chunks)
+            if len(chunk)
+        ]
+        evaluation["waves"] += 1
+
+    def advance(self, evaluation, wait):
+        """Adds finished waves and submits more until the evaluation is done"""
+        while not evaluation["done"]:
+            futures = evaluation["futures"]
+            if not wait and not all(future.done() for future in futures):
+                return
+            for future in futures:
+                for name, count in future.result().items():
+                    evaluation["wins"][name] += count
+            played = evaluation["played"] = sum(evaluation["wins"].values())
+            learner = evaluation["wins"][self.player_specs[0][0]]
+            evaluation["done"] = played >= self.num_games or (
+                played >= self.min_games
+                and stopping_reason(learner, played, self.z, self.width, self.threshold)
+                is not None
+            )
+            if not evaluation["done"]:
+                self.submit_wave(evaluation)
+
+    def pending_snapshots(self):
+        """(games, path) of evaluations not merged yet, for checkpoints"""
+        return [(evaluation["games"], evaluation["path"]) for evaluation in self.pending]
+
+    def collect(self, evaluation_wins, wait=False):
+        """Merges finished evaluations into evaluation_wins in submission order
+
+        Returns a list of (games, wins) for the evaluations merged; wins
+        add up to the number of games each evaluation played.
+        """
+        for evaluation in self.pending:
+            self.advance(evaluation, wait)
+        merged = []
+        while self.pending and self.pending[0]["done"]:
+            evaluation = self.pending.pop(0)
+            for name, count in evaluation["wins"].items():
+                evaluation_wins[name].append(count)
+            self.merged.append(evaluation["path"])
+            merged.append((evaluation["games"], evaluation["wins"]))
+        return merged
+
+    def remove_merged(self):
+        """Deletes merged snapshots, call once a checkpoint without them is saved"""
+        for path in self.merged:
+            if os.path.exists(path):
+                os.remove(path)
+        self.merged.clear()
+
+    def close(self):
+        """Shuts the pool down, pending evaluations are abandoned"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
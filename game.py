@@ -5,14 +5,24 @@ Game file for all the game logic
 
 import numpy as np
 
-dumplingPoints = [0, 1, 3, 6, 10, 15, 15, 15, 15, 15, 15, 15]
+from cards import CARD_TYPE_INDICES, CARD_TYPES, NUM_TYPES, new_cards
+from dealing import Dealer, deal_hand_counts
+from scoring import maki_points, score_played
+
 
 class Game:
     """Game logic for playing 1 round of the SushiGo game"""
-    def __init__(self, num_cards, players, print_info, update=True):
-        """Initialize variables"""
+    def __init__(self, num_cards, players, print_info, update=True, seed=None, endgame=None):
+        """Initialize variables, seed is anything np.random.default_rng takes
+
+        endgame is an endgame.Tablebase that model players follow instead
+        of their Q-table once their hand is down to its picks.
+        """
         self.num_cards = num_cards
         self.num_players = len(players)
+        self.rng = np.random.default_rng(seed)
+        self.dealer = Dealer(self.num_players, num_cards, self.rng)
+        self.first_hands = None
         self.deck = self.create_deck()
         self.round = 1
         self.players = players
@@ -21,18 +31,8 @@ class Game:
         self.previous_scores = [0 for _ in range(self.num_players)]
         self.print_info = print_info
         self.update = update
-        self.card_type_indices = {
-            "Wasabi": 9,
-            "Tempura": 8,
-            "SquidNigiri": 7,
-            "Sashimi": 6,
-            "SalmonNigiri": 5,
-            "Maki3": 4,
-            "Maki2": 3,
-            "Maki1": 2,
-            "EggNigiri": 1,
-            "Dumpling": 0,
-        }
+        self.card_type_indices = CARD_TYPE_INDICES
+        self.endgame = endgame
 
     def reset(self):
         """Resets variables before next game"""
@@ -48,122 +48,89 @@ class Game:
         played_encoded = self.encode_cards_as_number(game_state["played_cards"])
         return tuple(np.concatenate([hand_encoded, played_encoded]).tolist())
 
+    def state_key(self, player):
+        """Same tuple as encode_game_state, built from the player's counts
+
+        Game keeps hand_counts and played_counts in sync as cards move, so
+        no lists or arrays are built per decision.
+        """
+        return (*player.hand_counts, *player.played_counts)
+
     def encode_cards_as_number(self, cards):
         """Smaller function to turn cards into list of integers"""
-        encoding = [0] * 10
+        encoding = [0] * NUM_TYPES
         for card in cards:
-            if card in self.card_type_indices:
-                encoding[self.card_type_indices[card]] += 1
+            if card >= 0:
+                encoding[card] += 1
         return encoding
 
     def create_deck(self):
-        """Generates a deck of cards, randomly shuffles"""
-        card_types = {
-            "Tempura": 14,
-            "Sashimi": 14,
-            "Dumpling": 14,
-            "Maki1": 6,
-            "Maki2": 12,
-            "Maki3": 8,
-            "SalmonNigiri": 10,
-            "SquidNigiri": 5,
-            "EggNigiri": 5,
-            "Wasabi": 6,
-        }
-        cards = [name for name, count in card_types.items() for _ in range(count)]
-        np.random.shuffle(cards)
-        return cards
+        """Cards left of each type once the first round is dealt
+
+        The first round's hands come from a batch of games dealt at once,
+        see dealing.py.
+        """
+        deck, self.first_hands = self.dealer.next_game()
+        return deck
 
     def deal_cards(self):
         """Deals out cards from deck to players' hands"""
-        for player in self.players:
-            player.hand = [self.deck.pop() for _ in range(self.num_cards)]
-            player.hand.sort()
+        hands = self.first_hands
+        self.first_hands = None
+        if hands is None:
+            hands = [
+                # Built in type order, so the hand is already sorted
+                (bytes(card for card, count in enumerate(counts) for _ in range(count)), counts)
+                for counts in deal_hand_counts(
+                    self.deck, self.num_players, self.num_cards, self.rng
+                )
+            ]
+        for player, (cards, counts) in zip(self.players, hands):
+            player.hand = new_cards(cards)
+            player.hand_counts = counts
 
     def play_round(self):
         """Plays a single round of the game"""
+        players = self.players
+        endgame = self.endgame
         for i in range(self.num_cards):
-            for player in self.players:
-                game_state = {
-                    "hand": list(player.hand),
-                    "played_cards": list(player.played_cards),
-                }
-                encoded_state = self.encode_game_state(game_state)
-                if self.update:
-                    player.choose_card_ai(encoded_state, True)
-                else:
-                    player.choose_card_ai(encoded_state)
+            if endgame is not None and self.num_cards - i <= endgame.picks:
+                # Picked before anyone plays, every seat sees the same hands
+                for player, card in zip(players, endgame.picks_for(players)):
+                    if card is None:
+                        player.choose_card_ai(self.state_key(player), self.update)
+                    else:
+                        player.play_card(player.pop_card(sum(player.hand_counts[:card])))
+            else:
+                for player in players:
+                    player.choose_card_ai(self.state_key(player), self.update)
             if i != self.num_cards - 1:
-                hands = [player.hand for player in self.players]
-                for j, player in enumerate(self.players):
-                    player.hand = hands[(j + 1) % len(self.players)]
+                self.pass_hands()
+
+    def pass_hands(self):
+        """Passes hands (and their counts) on by rotating references"""
+        players = self.players
+        last = len(players) - 1
+        first = players[0]
+        hand, hand_counts = first.hand, first.hand_counts
+        for j in range(last):
+            players[j].hand = players[j + 1].hand
+            players[j].hand_counts = players[j + 1].hand_counts
+        players[last].hand = hand
+        players[last].hand_counts = hand_counts
 
     def score_round(self):
         """Scores each player based on players' hand"""
         makis = [0 for x in range(len(self.players))]
-        counter = 0
-        for player in self.players:
-            score = 0
-            mydict = {
-                "Tempura": 0,
-                "Sashimi": 0,
-                "Dumpling": 0,
-                "Maki2": 0,
-                "Maki3": 0,
-                "Maki1": 0,
-                "SalmonNigiri": 0,
-                "SquidNigiri": 0,
-                "EggNigiri": 0,
-                "Wasabi": 0,
-            }
-            for card in player.played_cards:
-                if (card in ["Tempura", "Sashimi", "Dumpling",
-                             "Maki1", "Maki2", "Maki3", "Wasabi"]):
-                    mydict[card] += 1
-                elif (card in ["SalmonNigiri", "SquidNigiri", "EggNigiri"]):
-                    if mydict["Wasabi"] > 0:
-                        mydict[card] += 3
-                        mydict["Wasabi"] -= 1
-                        # score += 2
-                    else:
-                        mydict[card] += 1
-            # score -= mydict["Wasabi"] #Penalize leftover Wasabi
-            score += (int(mydict["Tempura"] / 2) * 5) - (mydict["Tempura"] % 2)
-            score += (int(mydict["Sashimi"] / 3) * 10) - (mydict["Sashimi"] % 3)
-
-            score += mydict["EggNigiri"]
-            score += 2 * mydict["SalmonNigiri"]
-            score += 3 * mydict["SquidNigiri"]
-            score += dumplingPoints[mydict["Dumpling"]]
-
-            makiscore = 1 * mydict["Maki1"] + 2 * mydict["Maki2"] + 3 * mydict["Maki3"]
-            makis[counter] = makiscore
+        for counter, player in enumerate(self.players):
+            # NO_CARD is 255 as a byte, which score_played skips
+            score, makis[counter], mydict = score_played(player.played_cards.tobytes())
             self.scores[counter] += score
-            player.played_cards = []
-            counter += 1
             if self.print_info:
-                print("Player", player.name, "played:", mydict)
-        maki_points = [0 for x in range(len(self.players))]
-        sorted_scores = sorted(enumerate(makis), key=lambda x: x[1], reverse=True)
-        first_place_score = sorted_scores[0][1]
-        first_place_indices = [
-            idx for idx, score in sorted_scores if score == first_place_score
-        ]
-        points_first = 6 // len(first_place_indices)
-        for idx in first_place_indices:
-            maki_points[idx] += points_first
-        second_place_scores = [
-            score for idx, score in sorted_scores if score != first_place_score
-        ]
-        if second_place_scores:
-            second_place_score = second_place_scores[0]
-            second_place_indices = [
-                idx for idx, score in sorted_scores if score == second_place_score
-            ]
-            points_second = 3 // len(second_place_indices)
-            for idx in second_place_indices:
-                maki_points[idx] += points_second
-        for i, points in enumerate(maki_points):
+                print("Player", player.name, "played:", dict(zip(CARD_TYPES, mydict)))
+            player.played_cards = new_cards()
+            player.played_counts = [0] * NUM_TYPES
+        for i, points in enumerate(maki_points(makis)):
             self.scores[i] += points
         if self.update:
             for i, player in enumerate(self.players):
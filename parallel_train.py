@@ -0,0 +1,156 @@
+"""
+Parallel training, worker processes play BatchGames against one Q-table
+in shared memory and update it without locks (Hogwild)
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import multiprocessing
+import os
+import pickle
+import time
+
+import numpy as np
+
+from batch_game import BatchGame
+from player import Player
+from qtable import SharedQTable
+from telemetry import EpsilonSchedule
+
+NUM_CARDS = 5
+NUM_ROUNDS = 1_000_000
+NUM_WORKERS = os.cpu_count()
+BATCH_SIZE = 1000
+NUM_SIMULATION_GAMES = 10000
+EPSILON = 0.90
+ALPHA = 0.05
+GAMMA = 0.9
+SEED = 0
+REPORT_SECONDS = 5
+OPPONENTS = [("Random1", "random"), ("Random2", "random")]
+
+# Columns of the shared progress array, one row per worker
+GAMES, UPDATE_SUM, UPDATE_COUNT = range(3)
+
+
+def worker_epsilon(worker_id, games, num_workers):
+    """Epsilon for a worker that has played `games` games
+
+    Workers decay like train.py as a function of the games played by all
+    workers together. Floors are spread between 0.05 and 0.2 so some
+    workers keep exploring late in the run.
+    """
+    floor = 0.05 + 0.15 * worker_id / max(num_workers - 1, 1)
+    return EpsilonSchedule(EPSILON, floor)(games * num_workers)
+
+
+def make_players(q_table, opponents):
+    """Learner followed by the opponents, the learner uses q_table"""
+    learner = Player("AI1", "model", None, epsilon=EPSILON, alpha=ALPHA, gamma=GAMMA,
+                     q_table_path=None)
+    learner.q_table = q_table
+    return [learner] + [Player(name, strategy, None) for name, strategy in opponents]
+
+
+def train_worker(worker_id, num_workers, q_table, num_games, seed, progress, opponents):
+    """Plays num_games training games, reports into its row of progress"""
+    progress = np.frombuffer(progress, dtype=np.float64).reshape(num_workers, 3)
+    players = make_players(q_table, opponents)
+    learner = players[0]
+    game = BatchGame(
+        num_cards=q_table.num_cards, players=players, num_games=BATCH_SIZE, seed=seed
+    )
+    for games in range(0, num_games, BATCH_SIZE):
+        game.reset()
+        learner.epsilon = worker_epsilon(worker_id, games, num_workers)
+        game.deal_cards()
+        game.play_round()
+        game.score_round()
+        # Only this worker writes its row, so no lock is needed
+        progress[worker_id, GAMES] = games + BATCH_SIZE
+        learner.q_updates.flush()
+        progress[worker_id, UPDATE_SUM] += learner.q_updates.total
+        progress[worker_id, UPDATE_COUNT] += learner.q_updates.count
+        learner.q_updates.reset()
+    q_table.close()
+
+
+def train_parallel(q_table, num_games, num_workers=NUM_WORKERS, seed=SEED,
+                   opponents=OPPONENTS):
+    """Runs num_games training games split across num_workers processes
+
+    Each worker gets its own RNG stream spawned from seed, so the games a
+    worker deals are reproducible; the order of Hogwild updates is not.
+    """
+    per_worker = -(-num_games // (num_workers * BATCH_SIZE)) * BATCH_SIZE
+    seeds = np.random.SeedSequence(seed).spawn(num_workers)
+    progress = multiprocessing.RawArray("d", num_workers * 3)
+    counters = np.frombuffer(progress, dtype=np.float64).reshape(num_workers, 3)
+    workers = [
+        multiprocessing.Process(
+            target=train_worker,
+            args=(i, num_workers, q_table, per_worker, seeds[i], progress, opponents),
+        )
+        for i in range(num_workers)
+    ]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    while any(worker.is_alive() for worker in workers):
+        time.sleep(REPORT_SECONDS)
+        games = counters[:, GAMES].sum()
+        updates = counters[:, UPDATE_COUNT].sum()
+        average_update = counters[:, UPDATE_SUM].sum() / updates if updates else 0.0
+        print(
+            f"Games: {int(games)}/{per_worker * num_workers}",
+            f"Games/sec: {games / (time.time() - start):.0f}",
+            f"Average Q-table update: {average_update:.4f}",
+            f"Q-table size: {len(q_table)}",
+        )
+    for worker in workers:
+        worker.join()
+        if worker.exitcode != 0:
+            raise RuntimeError(f"Training worker exited with code {worker.exitcode}")
+    return counters
+
+
+def evaluate(q_table, num_games, opponents=OPPONENTS, seed=SEED):
+    """Wins per player (and ties) with the learner playing greedily"""
+    players = make_players(q_table, opponents)
+    players[0].epsilon = 0
+    game = BatchGame(
+        num_cards=q_table.num_cards,
+        players=players,
+        num_games=num_games,
+        update=False,
+        seed=seed,
+    )
+    game.deal_cards()
+    game.play_round()
+    game.score_round()
+    won_players = game.winners()
+    wins = {player.name: int(np.sum(won_players == i)) for i, player in enumerate(players)}
+    wins["Ties"] = int(np.sum(won_players == -1))
+    return wins
+
+
+if __name__ == "__main__":
+    print("Number of Cards:", NUM_CARDS, "Rounds:", NUM_ROUNDS, "Workers:", NUM_WORKERS)
+    table = SharedQTable(NUM_CARDS)
+    try:
+        try:
+            with open("q_table.pkl", "rb") as file:
+                table.load(pickle.load(file))
+            print("Successfully loaded in Q Table")
+        except (EOFError, FileNotFoundError):
+            print("Unsuccessfully loaded in Q Table")
+        begin = time.time()
+        train_parallel(table, NUM_ROUNDS)
+        print("Time taken:", time.time() - begin)
+        dense = table.to_dense()
+        print("WINS:", evaluate(dense, NUM_SIMULATION_GAMES))
+        with open("q_table.pkl", "wb") as file:
+            pickle.dump(dense, file)
+        print("\nDone Saving\n")
+    finally:
+        table.close()
+        table.unlink()
@@ -1,21 +1,38 @@
 """
 Logic to play 1 round against the AI, which makes what it thinks are optimal moves
+
+For many players at once, run `python server.py serve` and connect with
+`python server.py client` instead.
 """
+import os
 import random
 
+from endgame import TABLEBASE_PATH, Tablebase
 from game import Game
 from player import Player
 
 NUM_CARDS = 8
+# Export with: python policy.py export q_table.pkl q_table.qpol (greedy play
+# only) or python qtable_file.py export q_table.pkl q_table.qmap 8
+Q_TABLE_PATH = next(
+    (path for path in ("q_table.qpol", "q_table.qmap") if os.path.exists(path)), "q_table.pkl"
+)
+# Tablebase last picks, build with: python endgame.py build tablebase.pkl 2
+ENDGAME = Tablebase.load(TABLEBASE_PATH) if os.path.exists(TABLEBASE_PATH) else None
 
-AI1 = Player("AI1", "model", None, epsilon=0.01, alpha=0.05, gamma=0.9)  # Should be best
+AI1 = Player(
+    "AI1", "model", None, epsilon=0.01, alpha=0.05, gamma=0.9, q_table_path=Q_TABLE_PATH,
+    read_only=True,
+)  # Should be best
 AI2 = Player("Human", "player", None)
 players = [AI1, AI2]
 evaluation_wins = {}
 for player in players:
     evaluation_wins[player.name] = []
 evaluation_wins["Ties"] = []
-game = Game(num_cards=NUM_CARDS, players=players, print_info=True)
+# The table is shared read-only, so the AI does not learn during play
+game = Game(num_cards=NUM_CARDS, players=players, print_info=True, update=False,
+            endgame=ENDGAME)
 random.shuffle(game.players)
 game.deal_cards()
 game.play_round()
@@ -3,24 +3,88 @@
 import pickle
 import random
 
+from approx import NETWORK_PATH, QNetwork, load_network
+from cards import (
+    CARD_TYPES,
+    NO_CARD,
+    NUM_TYPES,
+    RULES2_PRIORITY,
+    RULES_PRIORITY,
+    WORST_PRIORITY,
+    new_cards,
+)
+from policy import choose_actions
+from qtable_file import MAPPED_SUFFIX, POLICY_SUFFIX
+from registry import REGISTRY
+from telemetry import StreamingStats
+
 
 class Player:
     """Player class for each player in the game"""
 
-    def __init__(self, name, strategy, model, epsilon=0.9, alpha=0.3, gamma=0.8):
+    __slots__ = (
+        "name",
+        "hand",
+        "hand_counts",
+        "played_cards",
+        "played_counts",
+        "strategy",
+        "ai_model",
+        "epsilon",
+        "alpha",
+        "gamma",
+        "q_updates",
+        "q_table",
+        "state_action_pairs",
+        "cumulative_reward",
+        "fallback",
+        "action_space",
+        "replay",
+        "read_only",
+    )
+
+    def __init__(self, name, strategy, model, epsilon=0.9, alpha=0.3, gamma=0.8,
+                 q_table_path="q_table.pkl", fallback="insert", action_space="position",
+                 read_only=False):
         self.name = name
-        self.hand = []
-        self.played_cards = []
+        self.hand = new_cards()
+        self.played_cards = new_cards()
+        # Per-type counts of hand and played_cards, kept in sync by
+        # pop_card and choose_card_ai for Game.state_key
+        self.hand_counts = [0] * NUM_TYPES
+        self.played_counts = [0] * NUM_TYPES
         self.strategy = strategy
         self.ai_model = model
         self.epsilon = epsilon  # Exploration rate
         self.alpha = alpha  # Learning rate
         self.gamma = gamma  # Discount factor
-        self.q_updates = []
-        if strategy == "model":
+        self.q_updates = StreamingStats()  # Update magnitudes, bounded memory
+        # Unseen states, see policy.FALLBACKS; "zeros" keeps a served table fixed
+        self.fallback = fallback
+        # What a Q row is indexed by, see policy.ACTION_SPACES
+        self.action_space = action_space
+        # Tables opened read-only (and networks) never record picks to update
+        self.read_only = False
+        if strategy == "approx":
+            # approx.QNetwork, `model` or the path of one; read-only, it
+            # predicts a row for every state, see approx.py
+            self.q_table = model if isinstance(model, QNetwork) else load_network(
+                NETWORK_PATH if model is None else model
+            )
+            self.action_space = self.q_table.action_space
+            self.fallback = "zeros"
+            self.read_only = True
+        elif strategy == "model" and q_table_path is not None:
             try:
-                with open("q_table.pkl", "rb") as file:
-                    self.q_table = pickle.load(file)
+                if read_only or q_table_path.endswith((MAPPED_SUFFIX, POLICY_SUFFIX)):
+                    # One copy per process shared by every read-only player,
+                    # see registry.py; a .qpol sets its action space
+                    self.q_table = REGISTRY.view(q_table_path)
+                    self.action_space = getattr(self.q_table, "action_space", action_space)
+                    self.read_only = True
+                else:
+                    with open(q_table_path, "rb") as file:
+                        self.q_table = pickle.load(file)
                 print("Successfully loaded in Q Table")
             except EOFError:
                 self.q_table = {}
@@ -32,121 +96,129 @@ class Player:
             self.q_table = {}
         self.state_action_pairs = []
         self.cumulative_reward = 0
+        # Optional replay.ReplayBuffer, BatchGame replays it after each round
+        self.replay = None
+
+    def pop_card(self, index):
+        """Removes and returns the card at index of the hand"""
+        card = self.hand.pop(index)
+        self.hand_counts[card] -= 1
+        return card
 
     def choose_card_ai(self, game_state, update=False):
         """Algorithm for choosing a card, based on strategy"""
-        chosen_card = ""
-        if self.strategy == "model":
+        chosen_card = NO_CARD
+        if self.strategy in ("model", "approx"):
             # Convert encoded NumPy array into hashable tuple
             state = tuple(game_state)
 
-            # Collect first occurrence index of each unique card
-            indices = {}
-            for i, card in enumerate(self.hand):
-                if card not in indices:
-                    indices[card] = i
-            index_values = list(indices.values())
+            # Collect first occurrence index of each unique card, the hand
+            # is sorted so that is the number of cards of lower types
+            index_values = []
+            types = []
+            position = 0
+            for card, count in enumerate(self.hand_counts):
+                if count:
+                    index_values.append(position)
+                    types.append(card)
+                    position += count
+            actions = types if self.action_space == "type" else index_values
 
             # Get Q-values (initialize if state not present)
-            q_vals = self.q_table.setdefault(state, [0.0] * 10)
+            unseen = False
+            if self.fallback == "insert":
+                q_vals = self.q_table.setdefault(state, [0.0] * 10)
+            else:
+                q_vals = self.q_table.get(state)
+                if q_vals is None:
+                    q_vals = [0.0] * 10
+                    unseen = self.fallback == "random"
+            if not isinstance(q_vals, list):
+                q_vals = q_vals.tolist()  # Array rows, one conversion beats 10 scalar reads
 
             # Choose action: exploration or exploitation
-            if random.random() < self.epsilon:
-                chosen_card_index = random.choice(index_values)
+            if unseen or random.random() < self.epsilon:
+                action = random.choice(actions)
             else:
                 # Select best action from available indices only
-                chosen_card_index = max(index_values, key=lambda i: q_vals[i])
+                action = max(actions, key=lambda i: q_vals[i])
             # Remove and record chosen card
-            chosen_card = self.hand.pop(chosen_card_index)
+            if self.action_space == "type":
+                chosen_card_index = index_values[types.index(action)]
+            else:
+                chosen_card_index = action
+            chosen_card = self.pop_card(chosen_card_index)
 
-            # Store state-action pair for update
-            if update:
-                self.state_action_pairs.append((state, chosen_card_index))
+            # Store state-action pair for update, read-only tables are never updated
+            if update and not self.read_only:
+                self.state_action_pairs.append((state, action))
 
         elif self.strategy == "random":
             chosen_card_index = random.randrange(len(self.hand))
-            chosen_card = self.hand.pop(chosen_card_index)
+            chosen_card = self.pop_card(chosen_card_index)
 
         elif self.strategy == "rules":
-            priority_list = [
-                "SquidNigiri",
-                "Sashimi",
-                "Wasabi",
-                "Tempura",
-                "SalmonNigiri",
-                "Maki3",
-                "Dumpling",
-                "Maki2",
-                "EggNigiri",
-                "Maki1",
-            ]
-            for card in priority_list:
+            for card in RULES_PRIORITY:
                 if card in self.hand:
                     self.hand.remove(card)
+                    self.hand_counts[card] -= 1
                     chosen_card = card
         elif self.strategy == "rules2":
-            priority_list = [
-                "Dumpling",
-                "SquidNigiri",
-                "Tempura",
-                "SalmonNigiri",
-                "Sashimi",
-                "Maki3",
-                "Maki2",
-                "EggNigiri",
-                "Wasabi",
-                "Maki1",
-            ]
             chosen_card_index = next(
                 (
                     index
                     for index, card in enumerate(self.hand)
-                    if card in priority_list
+                    if card in RULES2_PRIORITY
                 ),
                 0,
             )
-            chosen_card = self.hand.pop(chosen_card_index)
+            chosen_card = self.pop_card(chosen_card_index)
 
         elif self.strategy == "worst":
-            priority_list = [
-                "Wasabi",
-                "Maki1",
-                "EggNigiri",
-                "Maki2",
-                "Maki3",
-                "Sashimi",
-                "SalmonNigiri",
-                "Dumpling",
-                "Tempura",
-                "SquidNigiri",
-            ]
             chosen_card_index = next(
                 (
                     index
                     for index, card in enumerate(self.hand)
-                    if card in priority_list
+                    if card in WORST_PRIORITY
                 ),
                 0,
             )
-            chosen_card = self.hand.pop(chosen_card_index)
+            chosen_card = self.pop_card(chosen_card_index)
 
         elif self.strategy in ("human", "player"):
             print("You've played:")
             print("Hand:")
             for _ in range(len(self.hand)):
-                print(str(_) + ") " + str(self.hand[_]))
+                print(str(_) + ") " + CARD_TYPES[self.hand[_]])
             print("Which card would you like to play?: ")
             chosen_card_index = int(input())
-            chosen_card = self.hand.pop(chosen_card_index)
+            chosen_card = self.pop_card(chosen_card_index)
+
+        self.play_card(chosen_card)
+
+    def play_card(self, card):
+        """Adds a card taken from the hand to the played cards"""
+        self.played_cards.append(card)
+        if card != NO_CARD:
+            self.played_counts[card] += 1
+
+    def choose_actions(self, states, masks=None, rng=None):
+        """Model actions for an (n, 20) array of states in one call
 
-        self.played_cards.append(chosen_card)
+        Uses this player's Q-table, epsilon and fallback, see
+        policy.choose_actions. Hands are not changed.
+        """
+        return choose_actions(
+            self.q_table, states, masks, self.epsilon, rng, self.fallback, self.action_space
+        )
 
     def update_q_table(self, reward):
         """Add states to q_table, update rewards"""
         for state, action in self.state_action_pairs:
             q_values = self.q_table.setdefault(state, [0.0] * 10)
-            current_q = q_values[action]
-            max_future_q = max(q_values)
+            values = q_values if isinstance(q_values, list) else q_values.tolist()
+            current_q = values[action]
+            max_future_q = max(values)
             new_q = current_q + self.alpha * (
                 reward + self.gamma * max_future_q - current_q
             )
@@ -0,0 +1,351 @@
+"""
+Batched model policy, one vectorized call picks actions for many states
+
+States are rows of the 20 counts Game.state_key builds. Q rows are read
+in one of two action spaces:
+    position - the action is the index of a card in the sorted hand, and
+               only the first index of each card type is valid (the
+               original encoding, and the default)
+    type - the action is the card type id, valid if the hand holds it
+Works with a dict, DenseQTable, SharedQTable, a read-only MappedQTable
+or PolicyTable, or an approx.QNetwork.
+`python policy.py convert q_table.pkl q_table_type.pkl type` migrates a
+saved table (.pkl or .qmap) from one action space to the other.
+`python policy.py export q_table.pkl q_table.qpol` writes the greedy
+policy alone for serving, `python policy.py check q_table.pkl q_table.qpol`
+reports how often it disagrees with the float table.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from cards import NUM_TYPES
+from qtable import NUM_ACTIONS, ROW_BYTES, ArrayQTable, DenseQTable, StateRanker
+from qtable_file import (
+    HEADER_SIZE,
+    MAPPED_SUFFIX,
+    NO_ACTION,
+    POLICY_SUFFIX,
+    MappedQTable,
+    PolicyTable,
+    export_mapped,
+    table_arrays,
+    write_policy,
+)
+
+ACTION_SPACES = ("position", "type")
+
+# What to do with a state that is not in the table:
+#   insert - add a zero row, like setdefault, for training
+#   zeros - act as if it had a zero row without adding it
+#   random - play a uniformly random valid action
+FALLBACKS = ("insert", "zeros", "random")
+EXPORT_CHUNK = 1 << 16  # States unranked at a time by export_policy
+TYPE_IDS = np.arange(NUM_TYPES)
+# counts @ EXCLUSIVE_SUM sums the counts of the lower types, exact in float32
+# and several times faster than np.cumsum along short rows
+EXCLUSIVE_SUM = np.triu(np.ones((NUM_TYPES, NUM_TYPES), dtype=np.float32), 1)
+
+
+def action_offsets(hand_counts):
+    """Index of the first card of every type in the sorted hand, (n, 10)"""
+    hand_counts = np.asarray(hand_counts, dtype=np.float32)
+    return (hand_counts @ EXCLUSIVE_SUM).astype(np.int64)
+
+
+def action_masks(hand_counts, action_space="position"):
+    """Boolean (n, NUM_ACTIONS) masks of the valid actions of each hand"""
+    hand_counts = np.asarray(hand_counts)
+    if action_space == "type":
+        return hand_counts > 0
+    offsets = np.minimum(action_offsets(hand_counts), NUM_ACTIONS - 1)
+    masks = np.zeros((len(hand_counts), NUM_ACTIONS), dtype=bool)
+    rows, types = np.nonzero(hand_counts > 0)
+    masks[rows, offsets[rows, types]] = True
+    return masks
+
+
+def action_cards(hand_counts, actions, action_space="position"):
+    """Card type of every action, -1 where the action is -1"""
+    if action_space == "type":
+        return actions
+    hand_counts = np.asarray(hand_counts)
+    matches = (action_offsets(hand_counts) == actions[:, None]) & (hand_counts > 0)
+    return np.where(actions >= 0, np.argmax(matches, axis=1), -1)
+
+
+def action_positions(hand_counts, actions, action_space="position"):
+    """Index in the sorted hand of every action, -1 where the action is -1"""
+    if action_space == "position":
+        return actions
+    offsets = action_offsets(hand_counts)
+    return np.where(
+        actions >= 0, offsets[np.arange(len(actions)), np.maximum(actions, 0)], -1
+    )
+
+
+def lookup(q_table, states, fallback="insert"):
+    """Q-value rows of an (n, 20) array of states
+
+    Returns (q_values, slots, found): slots are the table rows for an
+    ArrayQTable with fallback "insert" (what update_many takes), else
+    None. Missing states read as zero rows; a MappedQTable is read-only
+    and never inserts.
+    """
+    if fallback not in FALLBACKS:
+        raise ValueError(f"Unknown fallback: {fallback}")
+    states = np.asarray(states)
+    if hasattr(q_table, "predict"):
+        # A function approximation has a row for every state
+        return q_table.predict(states), None, np.ones(len(states), dtype=bool)
+    if fallback == "insert" and isinstance(q_table, ArrayQTable):
+        slots = q_table.setdefault_many(states)
+        return q_table.q_values[slots], slots, np.ones(len(states), dtype=bool)
+    if hasattr(q_table, "find_many"):
+        # States with more cards than the table was built for are unseen
+        fits = states.sum(axis=1) <= q_table.num_cards
+        positions = np.full(len(states), -1, dtype=np.int64)
+        if fits.any():
+            positions[fits] = q_table.find_many(states[fits])
+        found = positions >= 0
+        q_values = np.zeros((len(states), NUM_ACTIONS))
+        q_values[found] = q_table.q_values[positions[found]]
+        return q_values, None, found
+    q_values = np.zeros((len(states), NUM_ACTIONS))
+    found = np.ones(len(states), dtype=bool)
+    for i, state in enumerate(states.tolist()):
+        if fallback == "insert":
+            row = q_table.setdefault(tuple(state), [0.0] * NUM_ACTIONS)
+        else:
+            row = q_table.get(tuple(state))
+        if row is None:
+            found[i] = False
+        else:
+            q_values[i] = row
+    return q_values, None, found
+
+
+def select_actions(q_values, masks, epsilon=0.0, rng=None, explore=None):
+    """Epsilon-greedy valid actions of Q-value rows, -1 for empty masks
+
+    Greedy ties go to the lowest action like Player.choose_card_ai.
+    Rows where explore is True play a random valid action regardless of
+    epsilon. rng is a np.random.Generator, or the np.random module.
+    """
+    rng = np.random if rng is None else rng
+    actions = np.argmax(np.where(masks, q_values, -np.inf), axis=1)
+    if epsilon > 0 or explore is not None:
+        explored = rng.random(len(masks)) < epsilon
+        if explore is not None:
+            explored |= explore
+        random_actions = np.argmax(np.where(masks, rng.random(masks.shape), -1.0), axis=1)
+        actions = np.where(explored, random_actions, actions)
+    return np.where(masks.any(axis=1), actions, -1)
+
+
+def select_cards(q_values, hand_counts, epsilon=0.0, rng=None, explore=None,
+                 action_space="position"):
+    """(actions, card types) of select_actions on the valid actions of hands
+
+    The same picks and random draws as select_actions on action_masks
+    followed by action_cards, but worked out per card type: every type in
+    a hand has exactly one valid action, so one gather replaces the masks.
+    Both are -1 for an empty hand.
+    """
+    rng = np.random if rng is None else rng
+    hand_counts = np.asarray(hand_counts)
+    present = hand_counts > 0
+    rows = np.arange(len(hand_counts))
+    if action_space == "type":
+        columns = np.broadcast_to(TYPE_IDS, hand_counts.shape)
+    else:
+        columns = np.minimum(action_offsets(hand_counts), NUM_ACTIONS - 1)
+    # Row-major positions of every type's action in (n, NUM_ACTIONS) arrays
+    flat = columns + (rows * NUM_ACTIONS)[:, None]
+    values = np.asarray(q_values).ravel()[flat]
+    if epsilon > 0 or explore is not None:
+        explored = rng.random(len(rows)) < epsilon
+        if explore is not None:
+            explored |= explore
+        draws = rng.random((len(rows), NUM_ACTIONS)).ravel()
+        # Uniform draws in place of Q-values pick a random valid action
+        values = np.where(explored[:, None], draws[flat], values)
+    cards = np.argmax(np.where(present, values, -np.inf), axis=1)
+    # An empty hand's argmax lands on a type it does not hold
+    has_card = present[rows, cards]
+    actions = np.where(has_card, columns[rows, cards], -1)
+    return actions, np.where(has_card, cards, -1)
+
+
+def choose_actions(q_table, states, masks=None, epsilon=0.0, rng=None, fallback="insert",
+                   action_space="position"):
+    """Epsilon-greedy action for every row of an (n, 20) array of states
+
+    masks defaults to the valid actions of the hands in states[:, :10].
+    """
+    states = np.asarray(states)
+    if masks is None:
+        masks = action_masks(states[:, :NUM_TYPES], action_space)
+    q_values, _, found = lookup(q_table, states, fallback)
+    explore = ~found if fallback == "random" else None
+    return select_actions(q_values, masks, epsilon, rng, explore)
+
+
+def convert_rows(states, rows, source, target):
+    """Q rows of an (n, 20) state array moved from one action space to another
+
+    Only valid actions carry over; the rest of every row is zero.
+    """
+    hand_counts = np.asarray(states)[:, :NUM_TYPES]
+    rows = np.asarray(rows)
+    if source == target:
+        return rows.copy()
+    offsets = np.minimum(action_offsets(hand_counts), NUM_ACTIONS - 1)
+    present = hand_counts > 0
+    line, types = np.nonzero(present)
+    converted = np.zeros_like(rows)
+    if target == "type":
+        converted[line, types] = rows[line, offsets[line, types]]
+    else:
+        converted[line, offsets[line, types]] = rows[line, types]
+    return converted
+
+
+def convert_table(table, source, target, num_cards=None):
+    """Copy of a dict or array Q-table in the target action space
+
+    A dict stays a dict; DenseQTable, SharedQTable and MappedQTable
+    become a DenseQTable.
+    """
+    if source not in ACTION_SPACES or target not in ACTION_SPACES:
+        raise ValueError(f"Action spaces are {ACTION_SPACES}")
+    if isinstance(table, dict):
+        if not table:
+            return {}
+        states = np.array(list(table.keys()))
+        rows = convert_rows(states, np.array(list(table.values())), source, target)
+        return {state: row for state, row in zip(table.keys(), rows.tolist())}
+    if isinstance(table, MappedQTable):
+        ranks, rows = np.asarray(table.state_ranks), np.asarray(table.q_values)
+    else:
+        ranks, rows = table.rows()
+    ranker = StateRanker(num_cards or table.num_cards)
+    rows = convert_rows(ranker.unrank_many(ranks), rows, source, target)
+    return DenseQTable.from_arrays(ranks, rows, ranker.num_cards)
+
+
+def load_table(path):
+    """A pickled table, or a .qmap or .qpol opened read-only"""
+    if path.endswith(MAPPED_SUFFIX):
+        return MappedQTable(path)
+    if path.endswith(POLICY_SUFFIX):
+        return PolicyTable(path)
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def convert_file(source_path, destination_path, target, num_cards=8):
+    """Migrates a saved position-space table to `target` (or back)
+
+    Both paths may be a pickle or a .qmap file.
+    """
+    source = "type" if target == "position" else "position"
+    table = load_table(source_path)
+    converted = convert_table(table, source, target, getattr(table, "num_cards", None))
+    if destination_path.endswith(MAPPED_SUFFIX):
+        export_mapped(converted, destination_path, num_cards)
+    else:
+        with open(destination_path, "wb") as file:
+            pickle.dump(converted, file)
+    return converted
+
+
+def export_policy(table, path, action_space="position", num_cards=8):
+    """Writes the best valid action of every stored state as a .qpol file
+
+    Ties go to the lowest action like select_actions, so greedy play
+    from the file matches the table exactly. Returns the action array.
+    """
+    if hasattr(table, "num_cards"):
+        num_cards = table.num_cards
+    elif table:
+        num_cards = max(num_cards, max(sum(state) for state in table))
+    ranks, rows = table_arrays(table, num_cards)
+    ranker = StateRanker(num_cards)
+    actions = np.full(ranker.num_states, NO_ACTION, dtype=np.uint8)
+    for start in range(0, len(ranks), EXPORT_CHUNK):
+        chunk = ranks[start:start + EXPORT_CHUNK]
+        hands = ranker.unrank_many(chunk)[:, :NUM_TYPES]
+        best = select_actions(rows[start:start + EXPORT_CHUNK], action_masks(hands, action_space))
+        actions[chunk] = np.where(best >= 0, best, NO_ACTION)
+    write_policy(path, actions, num_cards, action_space)
+    return actions
+
+
+def policy_fidelity(table, served, action_space="position", num_cards=8):
+    """How often greedy play from `served` differs from the float table
+
+    Compares the greedy action of every state stored in `table`; states
+    missing from both fall back to the same zero row.
+    """
+    if hasattr(table, "num_cards"):
+        num_cards = table.num_cards
+    elif table:
+        num_cards = max(num_cards, max(sum(state) for state in table))
+    ranks, _ = table_arrays(table, num_cards)
+    ranker = StateRanker(num_cards)
+    mismatches = 0
+    for start in range(0, len(ranks), EXPORT_CHUNK):
+        states = ranker.unrank_many(ranks[start:start + EXPORT_CHUNK])
+        masks = action_masks(states[:, :NUM_TYPES], action_space)
+        expected = choose_actions(table, states, masks, fallback="zeros")
+        mismatches += int(np.count_nonzero(
+            choose_actions(served, states, masks, fallback="zeros") != expected
+        ))
+    return {
+        "states": len(ranks),
+        "mismatches": mismatches,
+        "mismatch_rate": mismatches / max(len(ranks), 1),
+    }
+
+
+if __name__ == "__main__":
+    COMMAND = sys.argv[1] if len(sys.argv) > 1 else None
+    if COMMAND == "convert" and len(sys.argv) > 4 and sys.argv[4] in ACTION_SPACES:
+        # python policy.py convert q_table.pkl q_table_type.pkl type [NUM_CARDS]
+        migrated = convert_file(
+            sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]) if len(sys.argv) > 5 else 8
+        )
+        print("Converted", len(migrated), "states to the", sys.argv[4], "action space")
+    elif COMMAND == "export" and len(sys.argv) > 3:
+        # python policy.py export q_table.pkl q_table.qpol [position|type] [NUM_CARDS]
+        exported = export_policy(
+            load_table(sys.argv[2]),
+            sys.argv[3],
+            sys.argv[4] if len(sys.argv) > 4 else "position",
+            int(sys.argv[5]) if len(sys.argv) > 5 else 8,
+        )
+        print("Exported", np.count_nonzero(exported != NO_ACTION), "states,",
+              os.path.getsize(sys.argv[3]), "bytes")
+    elif COMMAND == "check" and len(sys.argv) > 3:
+        # python policy.py check q_table.pkl q_table.qpol [NUM_CARDS]
+        policy_table = PolicyTable(sys.argv[3])
+        report = policy_fidelity(
+            load_table(sys.argv[2]),
+            policy_table,
+            policy_table.action_space,
+            int(sys.argv[4]) if len(sys.argv) > 4 else 8,
+        )
+        print(f"{report['mismatches']} of {report['states']} greedy actions differ "
+              f"({100 * report['mismatch_rate']:.3f}%)")
+        float_bytes = HEADER_SIZE + report["states"] * ROW_BYTES
+        print(f"Float .qmap {float_bytes} bytes, policy {os.path.getsize(sys.argv[3])} bytes")
+    else:
+        print("Usage: python policy.py convert SOURCE DESTINATION type|position [NUM_CARDS]")
+        print("       python policy.py export TABLE POLICY.qpol [position|type] [NUM_CARDS]")
+        print("       python policy.py check TABLE POLICY.qpol [NUM_CARDS]")
+        sys.exit(1)
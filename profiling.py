@@ -0,0 +1,238 @@
+"""
+Opt-in per-phase timing of Game, BatchGame and Player
+
+Profiler.instrument swaps an object's class for a subclass whose phase
+methods are timed, so objects that are not instrumented run exactly the
+same code as before. With sample_every=N only every Nth call of a phase
+is timed and totals are scaled up, which keeps the overhead small while
+training. Reports print as text, and export to cProfile's pstats format
+(`python -m pstats profile.prof`, snakeviz) or to speedscope JSON.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import json
+import marshal
+import time
+
+GAME_PHASES = (
+    "reset",
+    "deal_cards",
+    "play_round",
+    "score_round",
+    "encode_game_state",
+    "state_key",
+)
+BATCH_GAME_PHASES = (
+    "reset",
+    "deal_cards",
+    "play_round",
+    "score_round",
+    "encode_game_states",
+    "choose_cards",
+    "choose_cards_model",
+    "play_cards",
+    "update_q_table",
+)
+PLAYER_PHASES = ("choose_card_ai", "update_q_table")
+
+
+def player_lookups(player, _args):
+    """Q-table and lookups of one Player.choose_card_ai call"""
+    return (player.q_table, 1) if player.strategy == "model" else None
+
+
+def batch_lookups(game, args):
+    """Q-table and lookups of one BatchGame.choose_cards_model call"""
+    return args[1].q_table, game.num_games
+
+
+TABLE_PROBES = {"choose_card_ai": player_lookups, "choose_cards_model": batch_lookups}
+
+
+class Profiler:
+    """Cumulative timers and call counters per call path of phases
+
+    Timings are keyed by the path of instrumented phases leading to the
+    call, e.g. ("Game.play_round", "Player.choose_card_ai"), so self time
+    can be told apart from time spent in nested phases. Q-table misses are the states
+    a lookup had to create, measured as growth of len(q_table).
+    """
+
+    def __init__(self, sample_every=1):
+        """Initialize variables"""
+        self.sample_every = sample_every
+        self.stack = []
+        self.paths = {}  # path -> [calls, timed calls, timed seconds]
+        self.functions = {}  # phase label -> code object, for pstats
+        self.lookups = 0
+        self.misses = 0
+        self.classes = {}
+
+    def timed(self, label, method):
+        """Wraps method so its calls are counted and sampled for timing"""
+        probe = TABLE_PROBES.get(method.__name__)
+        stack = self.stack
+        paths = self.paths
+        every = self.sample_every
+        clock = time.perf_counter
+        profiler = self
+        self.functions.setdefault(label, method.__code__)
+
+        def wrapper(obj, *args, **kwargs):
+            stack.append(label)
+            path = tuple(stack)
+            stat = paths.get(path)
+            if stat is None:
+                stat = paths[path] = [0, 0, 0.0]
+            stat[0] += 1
+            table = probe(obj, args) if probe is not None else None
+            if table is not None:
+                size = len(table[0])
+            try:
+                if stat[0] % every:
+                    return method(obj, *args, **kwargs)
+                start = clock()
+                try:
+                    return method(obj, *args, **kwargs)
+                finally:
+                    stat[1] += 1
+                    stat[2] += clock() - start
+            finally:
+                stack.pop()
+                if table is not None:
+                    profiler.lookups += table[1]
+                    profiler.misses += len(table[0]) - size
+
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    def instrument(self, obj, phases):
+        """Times the given methods of obj from now on"""
+        cls = type(obj)
+        key = (cls, phases)
+        if key not in self.classes:
+            namespace = {
+                name: self.timed(f"{cls.__name__}.{name}", getattr(cls, name))
+                for name in phases
+            }
+            if hasattr(cls, "__slots__"):
+                namespace["__slots__"] = ()
+            self.classes[key] = type(f"Profiled{cls.__name__}", (cls,), namespace)
+        obj.__class__ = self.classes[key]
+        return obj
+
+    def instrument_game(self, game):
+        """Instruments a Game or BatchGame and all of its players"""
+        phases = BATCH_GAME_PHASES if hasattr(game, "num_games") else GAME_PHASES
+        self.instrument(game, phases)
+        for player in game.players:
+            self.instrument(player, PLAYER_PHASES)
+        return game
+
+    @staticmethod
+    def uninstrument(obj):
+        """Restores the original class of an instrumented object"""
+        if obj.__class__.__name__.startswith("Profiled"):
+            obj.__class__ = obj.__class__.__bases__[0]
+        return obj
+
+    def reset(self):
+        """Zeroes every counter"""
+        self.paths.clear()
+        self.lookups = 0
+        self.misses = 0
+
+    def totals(self):
+        """path -> (calls, estimated total seconds, estimated self seconds)"""
+        total = {
+            path: seconds * calls / timed if timed else 0.0
+            for path, (calls, timed, seconds) in self.paths.items()
+        }
+        own = dict(total)
+        for path, seconds in total.items():
+            if len(path) > 1 and path[:-1] in own:
+                own[path[:-1]] -= seconds
+        return {
+            path: (self.paths[path][0], total[path], max(own[path], 0.0))
+            for path in total
+        }
+
+    def report(self):
+        """Text report of the call tree and Q-table hit rate"""
+        totals = self.totals()
+        root = sum(seconds for path, (_, seconds, _) in totals.items() if len(path) == 1)
+        lines = [
+            f"{'Phase':<40}{'Calls':>12}{'Total s':>11}{'Self s':>11}"
+            f"{'us/call':>10}{'%':>7}"
+        ]
+        for path in sorted(totals):
+            calls, seconds, own = totals[path]
+            name = "  " * (len(path) - 1) + path[-1]
+            lines.append(
+                f"{name:<40}{calls:>12}{seconds:>11.3f}{own:>11.3f}"
+                f"{1e6 * seconds / calls:>10.2f}{100 * seconds / (root or 1):>7.1f}"
+            )
+        hits = self.lookups - self.misses
+        rate = hits / self.lookups if self.lookups else 0.0
+        lines.append(
+            f"Q-table lookups: {self.lookups} hits: {hits} misses: {self.misses}"
+            f" hit rate: {rate:.4f}"
+        )
+        if self.sample_every > 1:
+            lines.append(f"Times sampled 1 in {self.sample_every} calls, totals scaled")
+        return "\n".join(lines)
+
+    def pstats_dict(self):
+        """Timings in the dict layout pstats.Stats reads from a file"""
+
+        def label(phase):
+            code = self.functions[phase]
+            return code.co_filename, code.co_firstlineno, phase
+
+        stats = {}
+        for path, (calls, seconds, own) in self.totals().items():
+            func = label(path[-1])
+            cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+            if len(path) > 1:
+                caller = label(path[-2])
+                old = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (
+                    old[0] + calls, old[1] + calls, old[2] + own, old[3] + seconds
+                )
+            stats[func] = (cc + calls, nc + calls, tt + own, ct + seconds, callers)
+        return stats
+
+    def export_pstats(self, path):
+        """Writes a file for pstats.Stats / `python -m pstats` / snakeviz"""
+        with open(path, "wb") as file:
+            marshal.dump(self.pstats_dict(), file)
+
+    def export_speedscope(self, path, name="Sushi Go training"):
+        """Writes speedscope JSON, one weighted sample per call path"""
+        frames = sorted({phase for path_ in self.paths for phase in path_})
+        index = {phase: i for i, phase in enumerate(frames)}
+        samples = []
+        weights = []
+        for path_, (_, _, own) in sorted(self.totals().items()):
+            samples.append([index[phase] for phase in path_])
+            weights.append(own)
+        profile = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": phase} for phase in frames]},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+            "name": name,
+            "exporter": "profiling.py",
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(profile, file)
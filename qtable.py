@@ -0,0 +1,726 @@
+"""
+Array-backed Q-table, ranks encoded game states into a dense integer index
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import pickle
+import sys
+from math import comb
+from multiprocessing import shared_memory
+
+import numpy as np
+
+STATE_LENGTH = 20  # 10 hand counts + 10 played counts
+NUM_ACTIONS = 10
+ROW_BYTES = 8 + 4 * NUM_ACTIONS  # int64 rank + float32 row in a .qmap file
+COVERAGE_THRESHOLDS = (1, 2, 4, 8, 16, 32, 64, 128)
+RANK_CACHE_SIZE = 1 << 16  # State tuples whose rank a StateRanker remembers
+ROW_CACHE_SIZE = 1 << 16  # Row views a DenseQTable keeps for scalar setdefault
+
+
+def rank_offsets(num_cards, length=STATE_LENGTH):
+    """Table for ranking count vectors of a given length with sum <= num_cards
+
+    offsets[i, r, x] is the number of vectors that come before any vector
+    whose element i is x, given r cards are left for elements i onwards.
+    Entries with x > r + 1 are never valid and hold a sentinel.
+    """
+    sentinel = np.iinfo(np.int64).max
+    offsets = np.full((length, num_cards + 1, num_cards + 2), sentinel, dtype=np.int64)
+    for i in range(length):
+        rest = length - i - 1
+        for remaining in range(num_cards + 1):
+            total = 0
+            for count in range(remaining + 2):
+                offsets[i, remaining, count] = total
+                if count <= remaining:
+                    total += comb(remaining - count + rest, rest)
+    return offsets
+
+
+class StateRanker:
+    """Ranks encoded game states into a dense integer index
+
+    Every state whose 20 counts sum to at most num_cards gets a unique rank
+    in [0, num_states), in lexicographic order of the counts. rank keeps
+    the ranks of recent state tuples, since ranking one in Python costs
+    about ten dict lookups; batches should use rank_many.
+    """
+
+    def __init__(self, num_cards):
+        """Initialize variables"""
+        self.num_cards = num_cards
+        self.offsets = rank_offsets(num_cards)
+        self.offset_lists = self.offsets.tolist()
+        self.flat_offsets = self.offsets.ravel()
+        self.position_starts = np.arange(STATE_LENGTH, dtype=np.int32) * (
+            (num_cards + 1) * (num_cards + 2)
+        )
+        self.num_states = comb(num_cards + STATE_LENGTH, STATE_LENGTH)
+        self.rank_cache = {}  # Ranks never change, so this is only bounded, not invalidated
+
+    def rank(self, state):
+        """Dense index of a single state tuple"""
+        try:
+            return self.rank_cache[state]
+        except (KeyError, TypeError):  # TypeError for unhashable lists
+            pass
+        remaining = self.num_cards
+        rank = 0
+        for table, count in zip(self.offset_lists, state):
+            if not 0 <= count <= remaining:
+                raise KeyError(state)
+            rank += table[remaining][count]
+            remaining -= count
+        if isinstance(state, tuple):
+            if len(self.rank_cache) >= RANK_CACHE_SIZE:
+                self.rank_cache.clear()
+            self.rank_cache[state] = rank
+        return rank
+
+    def rank_many(self, states):
+        """Dense indices of an (n, 20) array of states"""
+        states = np.asarray(states, dtype=np.int32)
+        remaining = self.num_cards - np.cumsum(states, axis=1, dtype=np.int32) + states
+        if np.any(states < 0) or np.any(states > remaining):
+            raise KeyError("State has more cards than the table was built for")
+        width = self.num_cards + 2
+        flat = remaining * width + states
+        flat += self.position_starts
+        return self.flat_offsets[flat].sum(axis=1)
+
+    def unrank_many(self, ranks, length=STATE_LENGTH):
+        """States of an array of dense indices, inverse of rank_many
+
+        Only the first length counts are decoded, e.g. 10 for the hands.
+        """
+        ranks = np.array(ranks, dtype=np.int64)
+        states = np.zeros((length, len(ranks)), dtype=np.int64)
+        remaining = np.full(len(ranks), self.num_cards)
+        for i in range(length):
+            offsets = self.offsets[i]
+            # One flat gather and compare per count beats an (n, counts) block
+            count = states[i]
+            for value in range(1, self.num_cards + 1):
+                count += offsets[remaining, value] <= ranks
+            ranks -= offsets[remaining, count]
+            remaining -= count
+        return np.ascontiguousarray(states.T)
+
+
+class ArrayQTable(StateRanker):
+    """Q-table whose rows live in a float32 matrix, self.q_values
+
+    Subclasses map ranks to row slots and list the stored rows.
+    """
+
+    def rows(self):
+        """(ranks, Q-value rows) of every stored state"""
+        raise NotImplementedError
+
+    def slot_ranks(self, slots):
+        """Ranks of the states in an array of slots"""
+        raise NotImplementedError
+
+    def slots_of_ranks(self, ranks):
+        """Slots of an array of ranks, adding zero rows if missing"""
+        raise NotImplementedError
+
+    def touch(self, slots):
+        """Called with the slots update_many changed"""
+
+    def maintain(self):
+        """Called once no caller holds slots, e.g. after a round's updates"""
+
+    def update_many(self, slots, actions, rewards, alpha, gamma, weights=None):
+        """Player.update_q_table's rule for many (slot, action, reward) triples
+
+        Triples are applied in order. Only repeats of the same state depend
+        on each other, so the k-th visit of every state is updated in one
+        vectorized wave. weights scale alpha per triple (importance weights
+        of a prioritized replay). Returns the absolute size of every update.
+        """
+        # slot * n + position is unique, so a plain sort orders triples by
+        # slot and then position, several times faster than a stable argsort
+        positions = np.arange(len(slots))
+        keys = np.sort(np.asarray(slots, dtype=np.int64) * len(slots) + positions)
+        sorted_slots, order = np.divmod(keys, len(slots))
+        starts = np.r_[True, sorted_slots[1:] != sorted_slots[:-1]]
+        group_starts = np.maximum.accumulate(np.where(starts, positions, 0))
+        occurrence = np.empty(len(slots), dtype=np.int64)
+        occurrence[order] = positions - group_starts
+        waves = np.argsort(occurrence, kind="stable")
+        bounds = np.searchsorted(occurrence[waves], np.arange(occurrence.max(initial=-1) + 2))
+        deltas = np.zeros(len(slots), dtype=np.float32)
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            index = waves[begin:end]
+            wave_slots = slots[index]
+            wave_actions = actions[index]
+            rows = self.q_values[wave_slots]
+            current = rows[np.arange(len(index)), wave_actions]
+            step = alpha if weights is None else alpha * weights[index]
+            # max along short float32 rows is over ten times slower than down columns
+            best = np.ascontiguousarray(rows.T).max(axis=0)
+            new = current + step * (rewards[index] + gamma * best - current)
+            self.q_values[wave_slots, wave_actions] = new
+            self.touch(wave_slots)
+            deltas[index] = np.abs(new - current)
+        return deltas
+
+    def __getitem__(self, state):
+        row = self.get(state)
+        if row is None:
+            raise KeyError(state)
+        return row
+
+    def __contains__(self, state):
+        return self.get(state) is not None
+
+    def keys(self):
+        """State tuples of every stored state"""
+        ranks, _ = self.rows()
+        return [tuple(state) for state in self.unrank_many(ranks).tolist()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        """(state tuple, Q-value row) pairs"""
+        _, q_values = self.rows()
+        return zip(self.keys(), q_values)
+
+    def to_dict(self):
+        """Converts back to the dict format of q_table.pkl"""
+        return {state: row.tolist() for state, row in self.items()}
+
+
+class DenseQTable(ArrayQTable):
+    """Q-table with the same setdefault/get semantics as the dict it replaces
+
+    A state's rank maps to a row of a growable float32 matrix, so an entry
+    costs 40 bytes of values plus 12 bytes of bookkeeping instead of a
+    tuple and a list of Python floats. setdefault also keeps the views of
+    recently used state tuples, so a repeated scalar lookup is one dict
+    lookup like the dict table's; batches should use setdefault_many.
+    """
+
+    def __init__(self, num_cards, capacity=1024):
+        """Initialize variables"""
+        super().__init__(num_cards)
+        self.slots = np.full(self.num_states, -1, dtype=np.int32)
+        self.q_values = np.zeros((capacity, NUM_ACTIONS), dtype=np.float32)
+        self.state_ranks = np.zeros(capacity, dtype=np.int64)
+        # Rows changed since the last checkpoint, see checkpoint.py
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        # State tuple -> row view from setdefault, every cached row is dirty
+        self.row_cache = {}
+
+    @classmethod
+    def from_dict(cls, table, num_cards):
+        """Builds a dense table from a dict Q-table, such as q_table.pkl"""
+        if table:
+            num_cards = max(num_cards, max(sum(state) for state in table))
+        dense = cls(num_cards, capacity=max(len(table), 1))
+        if table:
+            slots = dense.setdefault_many(np.array(list(table.keys())))
+            dense.q_values[slots] = np.array(list(table.values()))
+        return dense
+
+    @classmethod
+    def from_arrays(cls, ranks, q_values, num_cards):
+        """Builds a dense table from state ranks and their Q-values"""
+        dense = cls(num_cards, capacity=max(len(ranks), 1))
+        dense.set_rows(ranks, q_values)
+        dense.mark_clean()
+        return dense
+
+    def grow(self, needed):
+        """Makes room for at least `needed` rows"""
+        capacity = len(self.q_values)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.resize(capacity)
+
+    def resize(self, capacity):
+        """Reallocates the row arrays to hold `capacity` rows"""
+        q_values = np.zeros((capacity, NUM_ACTIONS), dtype=np.float32)
+        q_values[:self.size] = self.q_values[:self.size]
+        state_ranks = np.zeros(capacity, dtype=np.int64)
+        state_ranks[:self.size] = self.state_ranks[:self.size]
+        dirty = np.zeros(capacity, dtype=bool)
+        dirty[:self.size] = self.dirty[:self.size]
+        self.q_values = q_values
+        self.state_ranks = state_ranks
+        self.dirty = dirty
+        self.row_cache.clear()
+
+    def add_rank(self, rank, default=None):
+        """Adds a new row for a rank, returns its slot"""
+        self.grow(self.size + 1)
+        slot = self.size
+        self.slots[rank] = slot
+        self.state_ranks[slot] = rank
+        if default is not None:
+            self.q_values[slot] = default
+        self.dirty[slot] = True
+        self.size += 1
+        return slot
+
+    def setdefault(self, state, default=None):
+        """Row of Q-values for a state, created from default if missing
+
+        The row is a view into the table, so item assignment updates it in
+        place. Views are only valid until the next new state is added.
+        """
+        try:
+            return self.row_cache[state]
+        except (KeyError, TypeError):  # TypeError for unhashable lists
+            pass
+        rank = self.rank(state)
+        slot = self.slots[rank]
+        if slot < 0:
+            slot = self.add_rank(rank, default)
+        # The caller may write through the view
+        self.dirty[slot] = True
+        row = self.q_values[slot]
+        if isinstance(state, tuple):
+            if len(self.row_cache) >= ROW_CACHE_SIZE:
+                self.row_cache.clear()
+            self.row_cache[state] = row
+        return row
+
+    def setdefault_many(self, states):
+        """Slots of an (n, 20) array of states, adding zero rows if missing"""
+        return self.slots_of_ranks(self.rank_many(states))
+
+    def find_many(self, states):
+        """Slots of an (n, 20) array of states, -1 where missing"""
+        return self.slots[self.rank_many(states)]
+
+    def slot_ranks(self, slots):
+        """Ranks of the states in an array of slots"""
+        return self.state_ranks[slots]
+
+    def slots_of_ranks(self, ranks):
+        """Slots of an array of ranks, adding zero rows if missing"""
+        slots = self.slots[ranks]
+        missing = slots < 0
+        if missing.any():
+            new_ranks = np.unique(ranks[missing])
+            start = self.size
+            self.grow(start + len(new_ranks))
+            new_slots = np.arange(start, start + len(new_ranks), dtype=np.int32)
+            self.slots[new_ranks] = new_slots
+            self.state_ranks[new_slots] = new_ranks
+            self.q_values[new_slots] = 0.0
+            self.dirty[new_slots] = True
+            self.size += len(new_ranks)
+            slots = self.slots[ranks]
+        return slots
+
+    def set_rows(self, ranks, q_values):
+        """Overwrites the Q-values of an array of ranks, adding missing rows"""
+        slots = self.slots_of_ranks(np.asarray(ranks, dtype=np.int64))
+        self.q_values[slots] = q_values
+        self.dirty[slots] = True
+
+    def get(self, state, default=None):
+        """Row of Q-values for a state, or default if missing"""
+        try:
+            return self.row_cache[state]
+        except (KeyError, TypeError):
+            pass
+        try:
+            slot = self.slots[self.rank(state)]
+        except KeyError:
+            return default
+        return self.q_values[slot] if slot >= 0 else default
+
+    def __setitem__(self, state, q_values):
+        self.setdefault(state)[:] = q_values
+
+    def __len__(self):
+        return self.size
+
+    def rows(self):
+        """(ranks, Q-value rows) in insertion order"""
+        return self.state_ranks[:self.size], self.q_values[:self.size]
+
+    def touch(self, slots):
+        """Marks updated rows for the next checkpoint"""
+        self.dirty[slots] = True
+
+    def mark_clean(self):
+        """Marks every row as saved, cached views must go since they skip dirty"""
+        self.dirty[:] = False
+        self.row_cache.clear()
+
+    def nbytes(self):
+        """Bytes used by the arrays backing the table"""
+        return (
+            self.slots.nbytes
+            + self.q_values.nbytes
+            + self.state_ranks.nbytes
+            + self.dirty.nbytes
+        )
+
+    def __getstate__(self):
+        """Only pickles the used rows, the slot index is rebuilt on load"""
+        return {
+            "num_cards": self.num_cards,
+            "q_values": self.q_values[:self.size].copy(),
+            "state_ranks": self.state_ranks[:self.size].copy(),
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["num_cards"], capacity=max(len(state["q_values"]), 1))
+        self.size = len(state["q_values"])
+        self.q_values[:self.size] = state["q_values"]
+        self.state_ranks[:self.size] = state["state_ranks"]
+        self.slots[state["state_ranks"]] = np.arange(self.size, dtype=np.int32)
+
+
+class CappedQTable(DenseQTable):
+    """DenseQTable that counts visits and evicts cold states past a cap
+
+    Every lookup (setdefault or setdefault_many) counts as a visit and
+    stamps the row with the table's lookup clock. Once more than max_states
+    rows are stored, the coldest evict_fraction of them are dropped. A row's
+    heat is log2(visits) minus its age in half-lives, so a state needs a
+    steady stream of visits to stay: LFU with LRU decay.
+
+    setdefault evicts before adding a row, like growing invalidates views.
+    Slots from setdefault_many stay valid until maintain(), which BatchGame
+    calls after every round. Rows evicted between checkpoints come back on
+    resume until the next eviction.
+    """
+
+    def __init__(self, num_cards, capacity=1024, max_states=None, half_life=None,
+                 evict_fraction=0.1):
+        """Initialize variables, half_life is in lookups (default 10 * max_states)"""
+        self.max_states = max_states
+        self.half_life = half_life
+        self.evict_fraction = evict_fraction
+        self.visits = np.zeros(capacity, dtype=np.uint32)
+        self.last_touch = np.zeros(capacity, dtype=np.int64)
+        self.clock = 0
+        self.evicted = 0
+        super().__init__(num_cards, capacity)
+
+    @classmethod
+    def from_table(cls, table, num_cards, max_states=None, **settings):
+        """Capped table from a dict or array Q-table
+
+        A CappedQTable is reconfigured in place and keeps its visits; rows
+        of any other table start with one visit.
+        """
+        if isinstance(table, cls):
+            capped = table
+        else:
+            if not isinstance(table, ArrayQTable):
+                table = DenseQTable.from_dict(table, num_cards)
+            ranks, q_values = table.rows()
+            capped = cls(max(num_cards, table.num_cards), max(len(ranks), max_states or 0, 1))
+            capped.set_rows(ranks, q_values)
+            capped.visits[:capped.size] = 1
+            capped.mark_clean()
+        capped.max_states = max_states
+        for name, value in settings.items():
+            setattr(capped, name, value)
+        return capped
+
+    def grow(self, needed):
+        """Doubles like DenseQTable.grow, but stops at max_states"""
+        capacity = len(self.q_values)
+        if self.max_states is None or needed <= capacity:
+            super().grow(needed)
+        elif needed <= self.max_states:
+            self.resize(max(needed, min(2 * capacity, self.max_states)))
+        else:
+            # Room for a round of new states before maintain() evicts
+            self.resize(needed + self.max_states // 8)
+
+    def resize(self, capacity):
+        """Reallocates the row arrays, visit counts included"""
+        super().resize(capacity)
+        visits = np.zeros(capacity, dtype=np.uint32)
+        visits[:self.size] = self.visits[:self.size]
+        last_touch = np.zeros(capacity, dtype=np.int64)
+        last_touch[:self.size] = self.last_touch[:self.size]
+        self.visits = visits
+        self.last_touch = last_touch
+
+    def add_rank(self, rank, default=None):
+        """Adds a new row for a rank, evicting cold rows first if full"""
+        if self.max_states is not None and self.size >= self.max_states:
+            self.evict()
+        return super().add_rank(rank, default)
+
+    def setdefault(self, state, default=None):
+        """DenseQTable.setdefault that counts a visit, without the row cache"""
+        rank = self.rank(state)
+        slot = self.slots[rank]
+        if slot < 0:
+            slot = self.add_rank(rank, default)
+        self.dirty[slot] = True
+        self.clock += 1
+        self.visits[slot] += 1
+        self.last_touch[slot] = self.clock
+        return self.q_values[slot]
+
+    def setdefault_many(self, states):
+        """DenseQTable.setdefault_many that counts a visit per row"""
+        slots = super().setdefault_many(states)
+        self.clock += len(slots)
+        np.add.at(self.visits, slots, 1)
+        self.last_touch[slots] = self.clock
+        return slots
+
+    def maintain(self):
+        """Evicts cold rows if setdefault_many went past max_states"""
+        if self.max_states is not None and self.size > self.max_states:
+            self.evict()
+
+    def evict(self, count=None):
+        """Drops the `count` coldest rows, returns how many were dropped
+
+        By default the table shrinks to (1 - evict_fraction) * max_states.
+        """
+        if count is None:
+            count = self.size - int(self.max_states * (1 - self.evict_fraction))
+        count = min(count, self.size)
+        if count <= 0:
+            return 0
+        ages = self.clock - self.last_touch[:self.size]
+        half_life = self.half_life or 10 * (self.max_states or self.size)
+        heat = np.log2(np.maximum(self.visits[:self.size], 1)) - ages / half_life
+        keep = np.ones(self.size, dtype=bool)
+        keep[np.argpartition(heat, count - 1)[:count]] = False
+        self.keep_rows(keep)
+        self.evicted += count
+        return count
+
+    def prune(self, min_visits):
+        """Drops every row with fewer than min_visits visits, e.g. before export"""
+        before = self.size
+        self.keep_rows(self.visits[:self.size] >= min_visits)
+        return before - self.size
+
+    def keep_rows(self, keep):
+        """Moves the rows where keep is True to the front, drops the rest"""
+        self.row_cache.clear()
+        self.slots[self.state_ranks[:self.size][~keep]] = -1
+        kept = np.flatnonzero(keep)
+        size = len(kept)
+        for array in (self.q_values, self.state_ranks, self.dirty, self.visits, self.last_touch):
+            array[:size] = array[kept]
+            array[size:self.size] = 0
+        self.slots[self.state_ranks[:size]] = np.arange(size, dtype=np.int32)
+        self.size = size
+
+    def coverage(self, thresholds=COVERAGE_THRESHOLDS):
+        """coverage_report of the stored rows"""
+        return coverage_report(self.visits[:self.size], thresholds)
+
+    def nbytes(self):
+        """Bytes used by the arrays backing the table"""
+        return super().nbytes() + self.visits.nbytes + self.last_touch.nbytes
+
+    def __getstate__(self):
+        """DenseQTable's state plus the visit counts and settings"""
+        state = super().__getstate__()
+        state.update(
+            visits=self.visits[:self.size].copy(),
+            last_touch=self.last_touch[:self.size].copy(),
+            clock=self.clock,
+            evicted=self.evicted,
+            max_states=self.max_states,
+            half_life=self.half_life,
+            evict_fraction=self.evict_fraction,
+        )
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.visits[:self.size] = state["visits"]
+        self.last_touch[:self.size] = state["last_touch"]
+        self.clock = state["clock"]
+        self.evicted = state["evicted"]
+        self.max_states = state["max_states"]
+        self.half_life = state["half_life"]
+        self.evict_fraction = state["evict_fraction"]
+
+
+def coverage_report(visits, thresholds=COVERAGE_THRESHOLDS):
+    """Size vs coverage of pruning below each visit threshold
+
+    visit_share is the share of all recorded visits that hit a kept row,
+    an estimate of how often a lookup would still find its state.
+    export_bytes is the size of the rows in a .qmap file.
+    """
+    visits = np.asarray(visits, dtype=np.int64)
+    total = max(int(visits.sum()), 1)
+    report = []
+    for min_visits in thresholds:
+        kept = visits >= min_visits
+        states = int(np.count_nonzero(kept))
+        report.append(
+            {
+                "min_visits": min_visits,
+                "states": states,
+                "state_share": states / max(len(visits), 1),
+                "visit_share": int(visits[kept].sum()) / total,
+                "export_bytes": states * ROW_BYTES,
+            }
+        )
+    return report
+
+
+def format_coverage(report):
+    """Lines of a coverage_report for printing"""
+    lines = ["min_visits\tstates\t% states\t% visits\tMB"]
+    for row in report:
+        lines.append(
+            f"{row['min_visits']}\t\t{row['states']}\t{100 * row['state_share']:.1f}\t\t"
+            f"{100 * row['visit_share']:.1f}\t\t{row['export_bytes'] / 1e6:.1f}"
+        )
+    return "\n".join(lines)
+
+
+class SharedQTable(ArrayQTable):
+    """Q-table in multiprocessing shared memory, addressed directly by rank
+
+    Every possible state has a row, so nothing is ever resized and worker
+    processes can update rows Hogwild-style, without locks. That costs
+    41 bytes per possible state: about 130 MB for 8 cards.
+    Pickling only sends the name of the shared block.
+    """
+
+    def __init__(self, num_cards, name=None):
+        """Creates a zeroed shared block, or attaches to an existing one"""
+        super().__init__(num_cards)
+        values_size = self.num_states * NUM_ACTIONS * 4
+        self.memory = shared_memory.SharedMemory(
+            name=name, create=name is None, size=values_size + self.num_states
+        )
+        self.q_values = np.ndarray(
+            (self.num_states, NUM_ACTIONS), dtype=np.float32, buffer=self.memory.buf
+        )
+        self.visited = np.ndarray(
+            (self.num_states,), dtype=bool, buffer=self.memory.buf, offset=values_size
+        )
+
+    def load(self, table):
+        """Copies a dict or DenseQTable into the shared block"""
+        if isinstance(table, ArrayQTable):
+            ranks, q_values = table.rows()
+        elif table:
+            ranks = self.rank_many(np.array(list(table.keys())))
+            q_values = np.array(list(table.values()), dtype=np.float32)
+        else:
+            return
+        self.q_values[ranks] = q_values
+        self.visited[ranks] = True
+
+    def setdefault(self, state, default=None):
+        """Row of Q-values for a state, created from default if missing"""
+        rank = self.rank(state)
+        if not self.visited[rank]:
+            if default is not None:
+                self.q_values[rank] = default
+            self.visited[rank] = True
+        return self.q_values[rank]
+
+    def setdefault_many(self, states):
+        """Slots (here the ranks) of an (n, 20) array of states"""
+        ranks = self.rank_many(states)
+        self.visited[ranks] = True
+        return ranks
+
+    def slot_ranks(self, slots):
+        """Slots are ranks"""
+        return slots
+
+    def slots_of_ranks(self, ranks):
+        """Marks an array of ranks visited, they are their own slots"""
+        self.visited[ranks] = True
+        return ranks
+
+    def find_many(self, states):
+        """Ranks of an (n, 20) array of states, -1 where not visited"""
+        ranks = self.rank_many(states)
+        return np.where(self.visited[ranks], ranks, -1)
+
+    def get(self, state, default=None):
+        """Row of Q-values for a state, or default if missing"""
+        try:
+            rank = self.rank(state)
+        except KeyError:
+            return default
+        return self.q_values[rank] if self.visited[rank] else default
+
+    def __len__(self):
+        return int(np.count_nonzero(self.visited))
+
+    def rows(self):
+        """(ranks, Q-value rows) of visited states in rank order"""
+        ranks = np.flatnonzero(self.visited)
+        return ranks, self.q_values[ranks]
+
+    def to_dense(self):
+        """Private DenseQTable copy of the visited states"""
+        ranks, q_values = self.rows()
+        return DenseQTable.from_arrays(ranks, q_values, self.num_cards)
+
+    def close(self):
+        """Detaches this process from the shared block"""
+        self.q_values = self.visited = None
+        self.memory.close()
+
+    def unlink(self):
+        """Frees the shared block, call once from the creating process"""
+        self.memory.unlink()
+
+    def __getstate__(self):
+        return {"num_cards": self.num_cards, "name": self.memory.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["num_cards"], name=state["name"])
+
+
+def convert_pickle(source, destination, num_cards):
+    """Converts a dict q_table.pkl into a pickled DenseQTable"""
+    with open(source, "rb") as file:
+        table = pickle.load(file)
+    dense = DenseQTable.from_dict(table, num_cards)
+    with open(destination, "wb") as file:
+        pickle.dump(dense, file)
+    return dense
+
+
+def prune_pickle(source, destination, min_visits):
+    """Drops rows of a pickled CappedQTable visited fewer than min_visits times"""
+    with open(source, "rb") as file:
+        table = pickle.load(file)
+    removed = table.prune(min_visits)
+    with open(destination, "wb") as file:
+        pickle.dump(table, file)
+    return table, removed
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "coverage":
+        # python qtable.py coverage q_table.pkl
+        with open(sys.argv[2], "rb") as file:
+            print(format_coverage(pickle.load(file).coverage()))
+    elif sys.argv[1] == "prune":
+        # python qtable.py prune q_table.pkl q_table_pruned.pkl 4
+        pruned, dropped = prune_pickle(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        print("Dropped", dropped, "states, kept", len(pruned))
+    else:
+        # python qtable.py q_table.pkl q_table_dense.pkl 8
+        converted = convert_pickle(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+        print("Converted", len(converted), "states,", converted.nbytes(), "bytes")
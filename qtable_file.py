@@ -0,0 +1,279 @@
+"""
+On-disk Q-table format that is opened with np.memmap instead of unpickled
+
+Layout of a .qmap file:
+    64 byte header: magic, num_cards, number of states, number of actions
+    int64[count] sorted state ranks (see qtable.StateRanker)
+    float32[count, actions] Q-values in the same order
+Only the pages touched by a lookup are read, and processes that open the
+same file share them through the page cache.
+
+A .qpol file is a serving-only policy, the greedy action of every state:
+    64 byte header: magic, num_cards, number of states, stored states,
+                    action space name
+    uint8[number of states] best valid action by rank, 255 if not stored
+About 1 byte per possible state instead of 48 per stored state, written
+by `python policy.py export`.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import pickle
+import sys
+
+import numpy as np
+
+from qtable import NUM_ACTIONS, StateRanker
+
+MAGIC = b"SGQMAP1\0"
+HEADER_SIZE = 64
+MAPPED_SUFFIX = ".qmap"
+POLICY_MAGIC = b"SGQPOL1\0"
+POLICY_SUFFIX = ".qpol"
+NO_ACTION = 255
+
+
+def table_arrays(table, num_cards):
+    """Sorted (ranks, values) arrays of a dict or DenseQTable"""
+    ranker = StateRanker(num_cards)
+    if hasattr(table, "state_ranks"):
+        ranks = table.state_ranks[:table.size]
+        values = table.q_values[:table.size]
+    elif table:
+        ranks = ranker.rank_many(np.array(list(table.keys())))
+        values = np.array(list(table.values()), dtype=np.float32)
+    else:
+        ranks = np.zeros(0, dtype=np.int64)
+        values = np.zeros((0, NUM_ACTIONS), dtype=np.float32)
+    order = np.argsort(ranks)
+    return ranks[order], values[order]
+
+
+def write_mapped(path, ranks, values, num_cards):
+    """Writes sorted ranks and their Q-values as a .qmap file"""
+    header = np.zeros(HEADER_SIZE // 8, dtype=np.int64)
+    header[1:4] = (num_cards, len(ranks), values.shape[1])
+    header = bytearray(header.tobytes())
+    header[:8] = MAGIC
+    with open(path, "wb") as file:
+        file.write(header)
+        file.write(np.ascontiguousarray(ranks, dtype=np.int64).tobytes())
+        file.write(np.ascontiguousarray(values, dtype=np.float32).tobytes())
+
+
+def export_mapped(table, path, num_cards):
+    """Writes a dict or DenseQTable as a .qmap file"""
+    if hasattr(table, "num_cards"):
+        num_cards = table.num_cards
+    elif table:
+        num_cards = max(num_cards, max(sum(state) for state in table))
+    ranks, values = table_arrays(table, num_cards)
+    write_mapped(path, ranks, values, num_cards)
+
+
+class MappedQTable(StateRanker):
+    """Read-only Q-table backed by a memory-mapped .qmap file
+
+    setdefault returns the default without storing it, so a serving table
+    never grows. Rows are views into the file.
+    """
+
+    def __init__(self, path):
+        """Initialize variables"""
+        with open(path, "rb") as file:
+            header = file.read(HEADER_SIZE)
+        if header[:8] != MAGIC:
+            raise ValueError(f"{path} is not a .qmap Q-table")
+        num_cards, count, num_actions = np.frombuffer(header, dtype=np.int64)[1:4]
+        super().__init__(int(num_cards))
+        self.path = path
+        self.size = int(count)
+        self.state_ranks = np.memmap(
+            path, dtype=np.int64, mode="r", offset=HEADER_SIZE, shape=(self.size,)
+        ) if self.size else np.zeros(0, dtype=np.int64)
+        self.q_values = np.memmap(
+            path,
+            dtype=np.float32,
+            mode="r",
+            offset=HEADER_SIZE + 8 * self.size,
+            shape=(self.size, int(num_actions)),
+        ) if self.size else np.zeros((0, int(num_actions)), dtype=np.float32)
+
+    @classmethod
+    def from_arrays(cls, ranks, values, num_cards):
+        """Read-only table over sorted in-memory arrays, e.g. a loaded pickle
+
+        The arrays are marked read-only, and forked processes share their
+        pages copy-on-write.
+        """
+        table = cls.__new__(cls)
+        StateRanker.__init__(table, num_cards)
+        table.path = None
+        table.size = len(ranks)
+        table.state_ranks = np.ascontiguousarray(ranks, dtype=np.int64)
+        table.q_values = np.ascontiguousarray(values, dtype=np.float32)
+        table.state_ranks.flags.writeable = False
+        table.q_values.flags.writeable = False
+        return table
+
+    def find(self, state):
+        """Row index of a state, or -1 if missing"""
+        try:
+            rank = self.rank(state)
+        except KeyError:
+            return -1
+        position = int(np.searchsorted(self.state_ranks, rank))
+        if position < self.size and self.state_ranks[position] == rank:
+            return position
+        return -1
+
+    def find_many(self, states):
+        """Row indices of an (n, 20) array of states, -1 where missing"""
+        ranks = self.rank_many(states)
+        if not self.size:
+            return np.full(len(ranks), -1)
+        positions = np.searchsorted(self.state_ranks, ranks)
+        clipped = np.minimum(positions, self.size - 1)
+        found = (positions < self.size) & (self.state_ranks[clipped] == ranks)
+        return np.where(found, positions, -1)
+
+    def get(self, state, default=None):
+        """Row of Q-values for a state, or default if missing"""
+        position = self.find(state)
+        return self.q_values[position] if position >= 0 else default
+
+    def setdefault(self, state, default=None):
+        """Same as get, the table is read-only"""
+        return self.get(state, default)
+
+    def __getitem__(self, state):
+        row = self.get(state)
+        if row is None:
+            raise KeyError(state)
+        return row
+
+    def __contains__(self, state):
+        return self.find(state) >= 0
+
+    def __len__(self):
+        return self.size
+
+    def keys(self):
+        """State tuples in rank order"""
+        return [tuple(state) for state in self.unrank_many(self.state_ranks).tolist()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        """(state tuple, Q-value row) pairs in rank order"""
+        return zip(self.keys(), self.q_values)
+
+    def to_dict(self):
+        """Converts back to the dict format of q_table.pkl"""
+        return {state: row.tolist() for state, row in self.items()}
+
+
+def write_policy(path, actions, num_cards, action_space):
+    """Writes the best action of every rank as a .qpol file"""
+    header = np.zeros(HEADER_SIZE // 8, dtype=np.int64)
+    header[1:4] = (num_cards, len(actions), np.count_nonzero(actions != NO_ACTION))
+    header = bytearray(header.tobytes())
+    header[:8] = POLICY_MAGIC
+    header[32:48] = action_space.encode().ljust(16, b"\0")
+    with open(path, "wb") as file:
+        file.write(header)
+        file.write(np.ascontiguousarray(actions, dtype=np.uint8).tobytes())
+
+
+class PolicyTable(StateRanker):
+    """Read-only greedy policy backed by a memory-mapped .qpol file
+
+    Rows read as one-hot Q-values, 1.0 on the stored best action, so the
+    greedy choice of Player, policy.lookup and the server is unchanged.
+    Missing states get the default like a MappedQTable.
+    """
+
+    def __init__(self, path):
+        """Initialize variables"""
+        with open(path, "rb") as file:
+            header = file.read(HEADER_SIZE)
+        if header[:8] != POLICY_MAGIC:
+            raise ValueError(f"{path} is not a .qpol policy")
+        num_cards, num_states, count = np.frombuffer(header, dtype=np.int64)[1:4]
+        super().__init__(int(num_cards))
+        if num_states != self.num_states:
+            raise ValueError(f"{path} has {num_states} states, expected {self.num_states}")
+        self.path = path
+        self.size = int(count)
+        self.action_space = header[32:48].rstrip(b"\0").decode()
+        self.actions = np.memmap(
+            path, dtype=np.uint8, mode="r", offset=HEADER_SIZE, shape=(self.num_states,)
+        )
+        self.q_values = OneHotRows(self.actions)
+
+    def find(self, state):
+        """Rank of a state, or -1 if missing"""
+        try:
+            rank = self.rank(state)
+        except KeyError:
+            return -1
+        return rank if self.actions[rank] != NO_ACTION else -1
+
+    def find_many(self, states):
+        """Ranks of an (n, 20) array of states, -1 where missing"""
+        ranks = self.rank_many(states)
+        return np.where(self.actions[ranks] != NO_ACTION, ranks, -1)
+
+    def get(self, state, default=None):
+        """One-hot row of a state's best action, or default if missing"""
+        rank = self.find(state)
+        return self.q_values[rank] if rank >= 0 else default
+
+    def setdefault(self, state, default=None):
+        """Same as get, the table is read-only"""
+        return self.get(state, default)
+
+    def __contains__(self, state):
+        return self.find(state) >= 0
+
+    def __len__(self):
+        return self.size
+
+
+class OneHotRows:
+    """q_values of a PolicyTable, indexing builds one-hot float32 rows"""
+
+    def __init__(self, actions):
+        """Initialize variables"""
+        self.actions = actions
+        self.rows = np.eye(NUM_ACTIONS, dtype=np.float32)
+        # Rows are views of this shared matrix, updates must fail like a .qmap's
+        self.rows.flags.writeable = False
+
+    def __getitem__(self, index):
+        return self.rows[self.actions[index]]
+
+    def __len__(self):
+        return len(self.actions)
+
+
+def export_pickle(source, destination, num_cards):
+    """Converts a pickled Q-table (dict or DenseQTable) into a .qmap file"""
+    with open(source, "rb") as file:
+        table = pickle.load(file)
+    export_mapped(table, destination, num_cards)
+
+
+def import_pickle(source, destination):
+    """Converts a .qmap file back into a dict q_table.pkl"""
+    with open(destination, "wb") as file:
+        pickle.dump(MappedQTable(source).to_dict(), file)
+
+
+if __name__ == "__main__":
+    # python qtable_file.py export q_table.pkl q_table.qmap 8
+    # python qtable_file.py import q_table.qmap q_table.pkl
+    if sys.argv[1] == "export":
+        export_pickle(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        import_pickle(sys.argv[2], sys.argv[3])
@@ -0,0 +1,142 @@
+"""
+Process-wide registry of read-only Q-tables, keyed by path and version
+
+A model player that only plays (not trains) gets a QTableView from
+REGISTRY instead of loading its own copy, so every seat, table and game in
+a process reads one table and memory stays the same as seats are added.
+    .qmap / .qpol - memory-mapped, pages are shared through the page cache
+    pickles - loaded once into sorted read-only arrays (like a .qmap in
+              memory), which forked workers share copy-on-write
+A view pickles as its path, so a worker forked after loading finds the
+table already in its inherited registry and nothing is copied.
+
+The version of a file is its inode, size and modification time.
+REGISTRY.refresh() reloads files that changed and points every view at the
+new table, so long-lived processes pick up a newer checkpoint without a
+restart. Publish new versions with os.replace so readers never see a half
+written file, and call refresh from the thread that plays: tables are
+swapped between lookups, never during one.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import os
+import pickle
+
+from qtable_file import MAPPED_SUFFIX, POLICY_SUFFIX, MappedQTable, PolicyTable, table_arrays
+
+
+def file_version(path):
+    """(inode, size, modification time) of a file, changes on every write"""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def load_read_only(path):
+    """A .qmap or .qpol mapped from disk, or a pickled table as frozen arrays"""
+    if path.endswith(MAPPED_SUFFIX):
+        return MappedQTable(path)
+    if path.endswith(POLICY_SUFFIX):
+        return PolicyTable(path)
+    with open(path, "rb") as file:
+        table = pickle.load(file)
+    if hasattr(table, "num_cards"):
+        num_cards = table.num_cards
+    else:
+        num_cards = max((sum(state) for state in table), default=0)
+    ranks, values = table_arrays(table, num_cards)
+    return MappedQTable.from_arrays(ranks, values, num_cards)
+
+
+class QTableRegistry:
+    """Loads each table once and hands out views of its newest version"""
+
+    def __init__(self):
+        """Initialize variables"""
+        self.loaded = {}  # Absolute path -> (version, table)
+        self.reloads = 0
+
+    def table(self, path):
+        """Current table of a path, loaded on first use"""
+        path = os.path.abspath(path)
+        entry = self.loaded.get(path)
+        if entry is None:
+            version = file_version(path)
+            entry = self.loaded[path] = (version, load_read_only(path))
+        return entry[1]
+
+    def view(self, path):
+        """Read-only view of a path's table, raises like open() if missing"""
+        self.table(path)
+        return QTableView(self, os.path.abspath(path))
+
+    def refresh(self):
+        """Reloads every table whose file changed, returns their paths
+
+        A file that is missing or cannot be read yet keeps its old table.
+        """
+        reloaded = []
+        for path, (version, _) in list(self.loaded.items()):
+            try:
+                new_version = file_version(path)
+                if new_version == version:
+                    continue
+                table = load_read_only(path)
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                continue
+            self.loaded[path] = (new_version, table)
+            self.reloads += 1
+            reloaded.append(path)
+        return reloaded
+
+    def version(self, path):
+        """Version of the loaded table of a path"""
+        return self.loaded[os.path.abspath(path)][0]
+
+    def clear(self):
+        """Forgets every table, views must not be used afterwards"""
+        self.loaded.clear()
+
+
+REGISTRY = QTableRegistry()
+
+
+def shared_view(path):
+    """REGISTRY.view, what an unpickled QTableView calls"""
+    return REGISTRY.view(path)
+
+
+class QTableView:
+    """Read-only Q-table that always reads its registry's newest version
+
+    Everything is forwarded to the table (get, setdefault without storing,
+    find_many, q_values, action_space of a .qpol...). Holds no data, so
+    any number of players can share one.
+    """
+
+    __slots__ = ("registry", "path")
+
+    def __init__(self, registry, path):
+        """Initialize variables"""
+        self.registry = registry
+        self.path = path
+
+    @property
+    def table(self):
+        """The table this view reads right now"""
+        return self.registry.loaded[self.path][1]
+
+    def __getattr__(self, name):
+        return getattr(self.registry.loaded[self.path][1], name)
+
+    def __getitem__(self, state):
+        return self.table[state]
+
+    def __contains__(self, state):
+        return state in self.table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __reduce__(self):
+        # Only the path is sent, the receiving process uses its own registry
+        return shared_view, (self.path,)
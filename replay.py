@@ -0,0 +1,124 @@
+"""
+Fixed-size experience replay for Q-table training
+
+Player.update_q_table applies a round's reward to that round's picks once
+and forgets them. A ReplayBuffer keeps the most recent `capacity` picks as
+(state rank, action, reward, priority) records in one structured NumPy
+ring buffer, 17 bytes a pick, and BatchGame replays a minibatch of them
+after every round's own updates with update_many. A stored pick keeps no
+next state, so by default (gamma 0) a replay moves Q toward the pick's
+round reward; gamma = the player's gamma replays Player.update_q_table's
+rule exactly, which inflates rows that are replayed often. States are
+stored as ranks (see qtable.StateRanker), which stay valid when a
+CappedQTable moves or evicts rows.
+
+Sampling is uniform, or prioritized by the size of each pick's last TD
+error: a pick is drawn with probability proportional to priority ** alpha
+and its step is scaled by the importance weight (n * P) ** -beta, divided
+by the largest weight of the batch. New picks get the highest priority
+seen so they are replayed at least once.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import numpy as np
+
+TRANSITION = np.dtype([
+    ("rank", np.int64),
+    ("action", np.int8),
+    ("reward", np.float32),
+    ("priority", np.float32),
+])
+REPLAY_BATCH = 20000  # Picks replayed per round
+PRIORITY_EPSILON = 1e-3  # Keeps picks with no TD error drawable
+
+
+class ReplayBuffer:
+    """Ring buffer of recent picks and uniform or prioritized sampling"""
+
+    def __init__(self, capacity, batch_size=REPLAY_BATCH, prioritized=False, alpha=0.6,
+                 beta=0.4, gamma=0.0, seed=None):
+        """Initialize variables, alpha and beta only matter when prioritized"""
+        self.transitions = np.zeros(capacity, dtype=TRANSITION)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.rng = np.random.default_rng(seed)
+        self.position = 0  # Where the next pick is written
+        self.size = 0
+        self.added = 0
+        self.replayed = 0
+        self.max_priority = 1.0
+
+    def add(self, ranks, actions, rewards):
+        """Stores picks, overwriting the oldest once full"""
+        if len(ranks) > self.capacity:
+            ranks, actions, rewards = (
+                array[-self.capacity:] for array in (ranks, actions, rewards)
+            )
+        count = len(ranks)
+        index = (self.position + np.arange(count)) % self.capacity
+        transitions = self.transitions
+        transitions["rank"][index] = ranks
+        transitions["action"][index] = actions
+        transitions["reward"][index] = rewards
+        transitions["priority"][index] = self.max_priority
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+        self.added += count
+
+    def sample(self, count):
+        """(indices, importance weights) of count stored picks
+
+        Weights are None for uniform sampling.
+        """
+        if not self.prioritized:
+            return self.rng.integers(0, self.size, count), None
+        priorities = self.transitions["priority"][:self.size].astype(np.float64) ** self.alpha
+        cumulative = np.cumsum(priorities)
+        indices = np.searchsorted(cumulative, self.rng.random(count) * cumulative[-1],
+                                  side="right")
+        indices = np.minimum(indices, self.size - 1)
+        weights = (self.size * priorities[indices] / cumulative[-1]) ** -self.beta
+        return indices, (weights / weights.max()).astype(np.float32)
+
+    def replay(self, table, alpha):
+        """Applies one minibatch to an ArrayQTable, returns the update sizes"""
+        if not self.size:
+            return np.zeros(0, dtype=np.float32)
+        indices, weights = self.sample(self.batch_size)
+        picks = self.transitions[indices]
+        deltas = table.update_many(
+            table.slots_of_ranks(picks["rank"]),
+            picks["action"].astype(np.int64),
+            picks["reward"],
+            alpha,
+            self.gamma,
+            weights,
+        )
+        if self.prioritized:
+            # The step was alpha * weight times the TD error
+            errors = deltas / (alpha * weights) + PRIORITY_EPSILON
+            self.transitions["priority"][indices] = errors
+            self.max_priority = max(self.max_priority, float(errors.max()))
+        self.replayed += len(indices)
+        return deltas
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        """Bytes of the ring buffer, fixed by capacity"""
+        return self.transitions.nbytes
+
+    def summary(self):
+        """Size and memory counters for the metrics log"""
+        return {
+            "replay_size": self.size,
+            "replay_bytes": self.nbytes,
+            "replay_added": self.added,
+            "replay_replayed": self.replayed,
+        }
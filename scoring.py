@@ -0,0 +1,206 @@
+"""
+Table-driven round scoring shared by Game and BatchGame
+
+A player's points only depend on per-type counts, except that Wasabi
+triples the next nigiri played after it. Played sequences are reduced to
+counts plus tripled-nigiri points in one pass, cached per sequence, and
+looked up in precomputed tables.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import random
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from cards import (
+    DUMPLING,
+    MAKI_VALUES,
+    NIGIRI_VALUES,
+    NUM_TYPES,
+    SASHIMI,
+    TEMPURA,
+    WASABI,
+)
+
+dumplingPoints = [0, 1, 3, 6, 10, 15, 15, 15, 15, 15, 15, 15]
+
+MAX_COUNT = 95  # More than a whole deck, so any count can be looked up
+TEMPURA_POINTS = [(count // 2) * 5 - count % 2 for count in range(MAX_COUNT)]
+SASHIMI_POINTS = [(count // 3) * 10 - count % 3 for count in range(MAX_COUNT)]
+DUMPLING_POINTS = [dumplingPoints[min(count, len(dumplingPoints) - 1)]
+                   for count in range(MAX_COUNT)]
+
+TEMPURA_TABLE = np.array(TEMPURA_POINTS)
+SASHIMI_TABLE = np.array(SASHIMI_POINTS)
+DUMPLING_TABLE = np.array(DUMPLING_POINTS)
+NIGIRI_TABLE = np.array(NIGIRI_VALUES)
+MAKI_TABLE = np.array(MAKI_VALUES)
+
+
+@lru_cache(maxsize=1 << 16)
+def score_played(played):
+    """(points without maki, maki count, counts) of a played sequence
+
+    played is the bytes of a player's played card ids. counts matches the
+    dict score_round used to print: a nigiri on Wasabi counts 3 times.
+    """
+    counts = [0] * NUM_TYPES
+    for card in played:
+        if card >= NUM_TYPES:  # NO_CARD as an unsigned byte
+            continue
+        if NIGIRI_VALUES[card] and counts[WASABI] > 0:
+            counts[card] += 3
+            counts[WASABI] -= 1
+        else:
+            counts[card] += 1
+    points = (
+        TEMPURA_POINTS[counts[TEMPURA]]
+        + SASHIMI_POINTS[counts[SASHIMI]]
+        + DUMPLING_POINTS[counts[DUMPLING]]
+    )
+    for card, value in enumerate(NIGIRI_VALUES):
+        points += value * counts[card]
+    makis = sum(value * count for value, count in zip(MAKI_VALUES, counts))
+    return points, makis, tuple(counts)
+
+
+def maki_points(makis):
+    """6 points split among most maki, 3 among second most, as a list"""
+    points = [0] * len(makis)
+    first_place_score = max(makis)
+    first_place_indices = [i for i, score in enumerate(makis) if score == first_place_score]
+    for idx in first_place_indices:
+        points[idx] += 6 // len(first_place_indices)
+    second_place_scores = [score for score in makis if score != first_place_score]
+    if second_place_scores:
+        second_place_score = max(second_place_scores)
+        second_place_indices = [
+            i for i, score in enumerate(makis) if score == second_place_score
+        ]
+        for idx in second_place_indices:
+            points[idx] += 3 // len(second_place_indices)
+    return points
+
+
+def score_counts_batch(played, nigiri_points):
+    """Points without maki for count arrays of shape (..., 10)
+
+    nigiri_points holds the nigiri points of each player with Wasabi
+    already applied, as tracked while the cards were played.
+    """
+    return (
+        TEMPURA_TABLE[played[..., TEMPURA]]
+        + SASHIMI_TABLE[played[..., SASHIMI]]
+        + DUMPLING_TABLE[played[..., DUMPLING]]
+        + nigiri_points
+    )
+
+
+def maki_points_batch(makis):
+    """maki_points for every row of an (n, num_players) array"""
+    first = makis == makis.max(axis=1, keepdims=True)
+    points = np.where(first, 6 // first.sum(axis=1, keepdims=True), 0)
+    rest = np.where(first, -1, makis)
+    second = (rest == rest.max(axis=1, keepdims=True)) & ~first
+    points += np.where(second, 3 // np.maximum(second.sum(axis=1, keepdims=True), 1), 0)
+    return points
+
+
+def round_scores_batch(played, nigiri_points):
+    """Round points for count arrays of shape (n, num_players, 10)"""
+    return score_counts_batch(played, nigiri_points) + maki_points_batch(
+        played @ MAKI_TABLE
+    )
+
+
+def reference_round_scores(played_lists):
+    """Round points per player, written out the way score_round first was
+
+    Kept only to check the table-driven kernels against.
+    """
+    makis = []
+    scores = []
+    for played in played_lists:
+        mydict = [0] * NUM_TYPES
+        for card in played:
+            if card < 0:
+                continue
+            if NIGIRI_VALUES[card]:
+                if mydict[WASABI] > 0:
+                    mydict[card] += 3
+                    mydict[WASABI] -= 1
+                else:
+                    mydict[card] += 1
+            else:
+                mydict[card] += 1
+        score = (int(mydict[TEMPURA] / 2) * 5) - (mydict[TEMPURA] % 2)
+        score += (int(mydict[SASHIMI] / 3) * 10) - (mydict[SASHIMI] % 3)
+        for card, value in enumerate(NIGIRI_VALUES):
+            score += value * mydict[card]
+        score += dumplingPoints[mydict[DUMPLING]]
+        scores.append(score)
+        makis.append(sum(value * count for value, count in zip(MAKI_VALUES, mydict)))
+    sorted_scores = sorted(enumerate(makis), key=lambda x: x[1], reverse=True)
+    first_place_score = sorted_scores[0][1]
+    first = [idx for idx, score in sorted_scores if score == first_place_score]
+    for idx in first:
+        scores[idx] += 6 // len(first)
+    rest = [score for idx, score in sorted_scores if score != first_place_score]
+    if rest:
+        second = [idx for idx, score in sorted_scores if score == rest[0]]
+        for idx in second:
+            scores[idx] += 3 // len(second)
+    return scores
+
+
+def check_scoring(num_trials=20000, seed=0):
+    """Randomized differential check of the kernels against the reference
+
+    The batched half takes its nigiri points from score_played, so it only
+    checks the count tables; test_scoring.py plays the same kind of rounds
+    through BatchGame to check its Wasabi tracking. Returns the number of
+    mismatching rounds, 0 if everything agrees.
+    """
+    rng = random.Random(seed)
+    mismatches = 0
+    rounds = []
+    for _ in range(num_trials):
+        num_players = rng.randint(2, 5)
+        num_cards = rng.randint(1, 10)
+        played_lists = [
+            [rng.randrange(-1, NUM_TYPES) for _ in range(num_cards)]
+            for _ in range(num_players)
+        ]
+        expected = reference_round_scores(played_lists)
+        results = [score_played(bytes(card % 256 for card in played))
+                   for played in played_lists]
+        table_scores = [points for points, _, _ in results]
+        bonus = maki_points([makis for _, makis, _ in results])
+        if [a + b for a, b in zip(table_scores, bonus)] != expected:
+            mismatches += 1
+        rounds.append((played_lists, expected))
+    # Batched kernel, one batch per player count
+    for num_players in range(2, 6):
+        batch = [(lists, exp) for lists, exp in rounds if len(lists) == num_players]
+        played = np.zeros((len(batch), num_players, NUM_TYPES), dtype=np.int64)
+        nigiri = np.zeros((len(batch), num_players), dtype=np.int64)
+        for game, (played_lists, _) in enumerate(batch):
+            for player, cards in enumerate(played_lists):
+                points, _, counts = score_played(bytes(card % 256 for card in cards))
+                for card in cards:
+                    if card >= 0:
+                        played[game, player, card] += 1
+                nigiri[game, player] = sum(
+                    value * count for value, count in zip(NIGIRI_VALUES, counts)
+                )
+        expected = np.array([exp for _, exp in batch])
+        mismatches += int(np.sum(np.any(round_scores_batch(played, nigiri) != expected, axis=1)))
+    return mismatches
+
+
+if __name__ == "__main__":
+    failures = check_scoring()
+    print("Scoring mismatches:", failures)
+    sys.exit(1 if failures else 0)
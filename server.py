@@ -0,0 +1,544 @@
+"""
+Asyncio game server, hosts many Game tables at once over TCP
+
+Every connection plays at its own table: one human seat and model bots.
+Messages are JSON objects, one per line:
+    client: {"type": "join", "name": "Ann", "bots": 1, "num_cards": 8,
+             "rounds": 1, "timeout": 60}
+            {"type": "play", "index": 2, "round": 1, "turn": 3}
+                index into the sorted hand, round and turn of the "turn" message
+            {"type": "stats"}
+            {"type": "quit"}
+    server: joined, turn (hand, played cards, seconds left), timeout,
+            round (played cards and scores), end, stats, error
+Bots at every table share one read-only Q-table, and their decisions are
+grouped into micro-batches across tables (policy.choose_actions). A human
+who does not answer within the table's timeout gets the bot's move.
+A "play" is only accepted while the table waits for the human's move,
+and one tagged with another round or turn is rejected as stale.
+With a tablebase (python endgame.py build tablebase.pkl) bots play their
+last picks from its search instead, see endgame.py for its assumptions.
+
+    python server.py serve [--port 8765]
+    python server.py client [--port 8765]           play from a terminal
+    python server.py simulate 300                   local load test
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from cards import NUM_TYPES, card_names
+from endgame import TABLEBASE_PATH, Tablebase
+from game import Game
+from player import Player
+from policy import action_positions, choose_actions
+from registry import REGISTRY
+from telemetry import StreamingStats
+
+HOST = "127.0.0.1"
+PORT = 8765
+NUM_CARDS = 8
+NUM_BOTS = 1
+MAX_BOTS = 4
+MAX_ROUNDS = 3
+MOVE_TIMEOUT = 60.0  # Seconds a human seat has per move
+MAX_MOVE_TIMEOUT = 600.0
+BOT_EPSILON = 0.01
+ACTION_SPACE = "position"  # Of the served Q-table, see policy.ACTION_SPACES
+MAX_BATCH = 256  # Bot decisions per Q-table lookup
+MAX_DELAY = 0.002  # Seconds a decision waits for others to batch with
+DECK_SIZE = 94
+Q_TABLE_PATH = next(
+    (path for path in ("q_table.qpol", "q_table.qmap") if os.path.exists(path)), "q_table.pkl"
+)
+
+
+def load_q_table(path):
+    """Registry view of the shared table, see registry.py
+
+    A .qmap or .qpol is mapped read-only, a pickle is loaded once. A newer
+    file replacing it is picked up when the next table starts.
+    """
+    try:
+        return REGISTRY.view(path)
+    except (EOFError, FileNotFoundError) as error:
+        print("Unsuccessfully loaded in Q Table -", type(error).__name__)
+        return {}
+
+
+def encode(message):
+    """One protocol line"""
+    return (json.dumps(message) + "\n").encode()
+
+
+class DecisionBatcher:
+    """Collects bot decisions from all tables, answers them in batches
+
+    A batch is looked up when MAX_BATCH decisions are waiting or MAX_DELAY
+    after the first one arrived, whichever comes first. Unseen states are
+    never added, so the shared table stays read-only.
+    """
+
+    def __init__(self, q_table, epsilon=BOT_EPSILON, max_batch=MAX_BATCH,
+                 max_delay=MAX_DELAY, seed=None, action_space=ACTION_SPACE):
+        """Initialize variables"""
+        self.q_table = q_table
+        self.action_space = action_space
+        self.epsilon = epsilon
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.rng = np.random.default_rng(seed)
+        self.pending = []
+        self.timer = None
+        self.batches = 0
+        self.decisions = 0
+        self.latency = StreamingStats(buffer_size=1024)
+
+    async def decide(self, state):
+        """Action index (position in the sorted hand) for one state tuple"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((state, future, time.perf_counter()))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        """Answers every waiting decision with one vectorized lookup"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        states = np.array([state for state, _, _ in pending])
+        actions = choose_actions(
+            self.q_table,
+            states,
+            epsilon=self.epsilon,
+            rng=self.rng,
+            fallback="zeros",
+            action_space=self.action_space,
+        )
+        actions = action_positions(states[:, :NUM_TYPES], actions, self.action_space)
+        now = time.perf_counter()
+        for (_, future, _), action in zip(pending, actions.tolist()):
+            if not future.done():
+                future.set_result(action)
+        self.latency.extend([now - start for _, _, start in pending])
+        self.batches += 1
+        self.decisions += len(pending)
+
+
+class Table:
+    """One game between a connected human and bots"""
+
+    def __init__(self, table_id, server, writer, name, num_bots, num_cards, rounds,
+                 timeout):
+        """Initialize variables"""
+        self.table_id = table_id
+        self.server = server
+        self.writer = writer
+        self.num_cards = num_cards
+        self.rounds = rounds
+        self.timeout = timeout
+        self.moves = asyncio.Queue()
+        self.pending = None  # (round, turn) of the move the human owes, if any
+        self.human = Player(name, "human", None)
+        bots = []
+        for i in range(num_bots):
+            bot = Player(f"Bot{i + 1}", "model", None, epsilon=BOT_EPSILON,
+                         q_table_path=None, fallback="zeros",
+                         action_space=server.batcher.action_space)
+            bot.q_table = server.q_table
+            bots.append(bot)
+        # Deals from the server's RNG, so a seeded server is reproducible
+        self.game = Game(num_cards, [self.human] + bots, print_info=False, update=False,
+                         seed=server.batcher.rng)
+        self.game.rng.shuffle(self.game.players)
+
+    async def send(self, **message):
+        """Sends one message to the human"""
+        self.writer.write(encode(message))
+        await self.writer.drain()
+
+    async def run(self):
+        """Plays every round, then reports the final scores"""
+        game = self.game
+        await self.send(
+            type="joined",
+            table=self.table_id,
+            players=[player.name for player in game.players],
+            num_cards=self.num_cards,
+            rounds=self.rounds,
+            timeout=self.timeout,
+        )
+        for round_number in range(1, self.rounds + 1):
+            game.deal_cards()
+            await self.play_round(round_number)
+            played = {player.name: card_names(player.played_cards) for player in game.players}
+            game.score_round()
+            await self.send(type="round", round=round_number, played=played,
+                            scores=self.scores())
+        scores = self.scores()
+        best = max(scores.values())
+        winners = [name for name, score in scores.items() if score == best]
+        await self.send(type="end", scores=scores, winners=winners)
+
+    def scores(self):
+        """Scores by player name"""
+        players = self.game.players
+        return {player.name: score for player, score in zip(players, self.game.ending())}
+
+    async def play_round(self, round_number):
+        """Every seat picks at once, then the cards are played and hands passed"""
+        game = self.game
+        endgame = self.server.endgame
+        for turn in range(self.num_cards):
+            cards = [None] * len(game.players)
+            if endgame is not None and self.num_cards - turn <= endgame.picks:
+                cards = endgame.picks_for(game.players)
+            choices = await asyncio.gather(
+                *(self.choose(player, round_number, turn, card)
+                  for player, card in zip(game.players, cards))
+            )
+            for player, index in zip(game.players, choices):
+                player.play_card(player.pop_card(index))
+            self.server.moves += len(choices)
+            if turn != self.num_cards - 1:
+                game.pass_hands()
+
+    async def choose(self, player, round_number, turn, card=None):
+        """Index of the card a seat plays this turn, card is a tablebase pick"""
+        if player is not self.human:
+            if card is not None:
+                return sum(player.hand_counts[:card])
+            return await self.server.batcher.decide(self.game.state_key(player))
+        # Plays sent before this turn or after an earlier timeout are dropped
+        while not self.moves.empty():
+            self.moves.get_nowait()
+        self.pending = (round_number, turn + 1)
+        await self.send(
+            type="turn",
+            round=round_number,
+            turn=turn + 1,
+            hand=card_names(player.hand),
+            played=card_names(player.played_cards),
+            timeout=self.timeout,
+        )
+        start = time.perf_counter()
+        try:
+            index = await asyncio.wait_for(self.next_move(len(player.hand)), self.timeout)
+        except asyncio.TimeoutError:
+            self.pending = None
+            index = await self.server.batcher.decide(self.game.state_key(player))
+            self.server.timeouts += 1
+            await self.send(type="timeout", played=card_names([player.hand[index]])[0])
+        finally:
+            self.pending = None
+        self.server.human_latency.append(time.perf_counter() - start)
+        return index
+
+    def offer_move(self, message):
+        """Queues a "play" for the pending move, else returns why it was rejected"""
+        if self.pending is None:
+            return "No move is pending"
+        current = message.get("round", self.pending[0]), message.get("turn", self.pending[1])
+        if current != self.pending:
+            return f"Stale play, round {self.pending[0]} turn {self.pending[1]} is pending"
+        self.moves.put_nowait(message.get("index"))
+        return None
+
+    async def next_move(self, hand_size):
+        """Waits for a valid card index from the human"""
+        while True:
+            index = await self.moves.get()
+            if isinstance(index, int) and 0 <= index < hand_size:
+                return index
+            await self.send(type="error", message=f"Index must be 0 to {hand_size - 1}")
+
+
+class GameServer:
+    """Accepts connections and runs a Table for every joined client"""
+
+    def __init__(self, q_table, seed=None, action_space=ACTION_SPACE, endgame=None):
+        """Initialize variables, endgame is an optional endgame.Tablebase"""
+        self.q_table = q_table
+        self.endgame = endgame
+        # A .qpol policy is only valid in the action space it was exported in
+        action_space = getattr(q_table, "action_space", action_space)
+        self.batcher = DecisionBatcher(q_table, seed=seed, action_space=action_space)
+        self.table_ids = itertools.count(1)
+        self.started = time.time()
+        self.tables_started = 0
+        self.tables_finished = 0
+        self.tables_aborted = 0
+        self.active_tables = 0
+        self.moves = 0
+        self.timeouts = 0
+        self.human_latency = StreamingStats(buffer_size=1024)
+        self.connections = set()  # Handler tasks of connected clients
+
+    def stats(self):
+        """Latency and throughput counters"""
+        uptime = time.time() - self.started
+        batcher = self.batcher
+        return {
+            "uptime": round(uptime, 3),
+            "tables_active": self.active_tables,
+            "tables_started": self.tables_started,
+            "tables_finished": self.tables_finished,
+            "tables_aborted": self.tables_aborted,
+            "moves": self.moves,
+            "moves_per_sec": self.moves / uptime if uptime else 0.0,
+            "timeouts": self.timeouts,
+            "q_table_reloads": REGISTRY.reloads,
+            "bot_decisions": batcher.decisions,
+            "bot_batches": batcher.batches,
+            "mean_batch_size": batcher.decisions / batcher.batches if batcher.batches else 0.0,
+            **batcher.latency.summary("bot_latency"),
+            **self.human_latency.summary("human_latency"),
+        }
+
+    def new_table(self, message, writer):
+        """Table for a join message, raises ValueError for bad settings"""
+        num_bots = int(message.get("bots", NUM_BOTS))
+        num_cards = int(message.get("num_cards", NUM_CARDS))
+        rounds = int(message.get("rounds", 1))
+        timeout = float(message.get("timeout", MOVE_TIMEOUT))
+        if not 1 <= num_bots <= MAX_BOTS:
+            raise ValueError(f"bots must be 1 to {MAX_BOTS}")
+        if not 1 <= rounds <= MAX_ROUNDS:
+            raise ValueError(f"rounds must be 1 to {MAX_ROUNDS}")
+        if num_cards < 1 or num_cards * (num_bots + 1) * rounds > DECK_SIZE:
+            raise ValueError("Not enough cards in the deck for that table")
+        if not 0 < timeout <= MAX_MOVE_TIMEOUT:
+            raise ValueError(f"timeout must be at most {MAX_MOVE_TIMEOUT} seconds")
+        name = str(message.get("name", "Human"))[:32]
+        # Swaps in a newer Q-table file for every bot, see registry.py
+        REGISTRY.refresh()
+        return Table(next(self.table_ids), self, writer, name, num_bots, num_cards,
+                     rounds, timeout)
+
+    async def run_table(self, table):
+        """Runs a table and keeps the table counters"""
+        self.tables_started += 1
+        self.active_tables += 1
+        try:
+            await table.run()
+            self.tables_finished += 1
+        except (asyncio.CancelledError, ConnectionError):
+            self.tables_aborted += 1
+            raise
+        finally:
+            self.active_tables -= 1
+
+    async def handle(self, reader, writer):
+        """Reads one client's messages until it disconnects"""
+        task = None
+        connection = asyncio.current_task()
+        self.connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    kind = message["type"]
+                except (ValueError, KeyError, TypeError):
+                    writer.write(encode({"type": "error", "message": "Bad message"}))
+                    continue
+                if kind == "join":
+                    if task is not None and not task.done():
+                        writer.write(encode({"type": "error", "message": "Already playing"}))
+                        continue
+                    try:
+                        table = self.new_table(message, writer)
+                    except ValueError as error:
+                        writer.write(encode({"type": "error", "message": str(error)}))
+                        continue
+                    task = asyncio.create_task(self.run_table(table))
+                elif kind == "play" and task is not None and not task.done():
+                    error = table.offer_move(message)
+                    if error:
+                        writer.write(encode({"type": "error", "message": error}))
+                elif kind == "stats":
+                    writer.write(encode({"type": "stats", **self.stats()}))
+                elif kind == "quit":
+                    break
+                else:
+                    writer.write(encode({"type": "error", "message": f"Unexpected {kind}"}))
+        except ConnectionError:
+            pass
+        finally:
+            if task is not None and not task.done():
+                task.cancel()
+            writer.close()
+            self.connections.discard(connection)
+
+    async def serve(self, host=HOST, port=PORT):
+        """asyncio.Server listening for clients"""
+        return await asyncio.start_server(self.handle, host, port, limit=1 << 16)
+
+
+async def read_message(reader):
+    """Next message from the server, None when it disconnected"""
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+async def bot_client(host, port, name, settings, rng):
+    """Stand-in for a human that plays random cards, returns its final scores"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"type": "join", "name": name, **settings}))
+    try:
+        while True:
+            message = await read_message(reader)
+            if message is None or message["type"] == "error":
+                raise RuntimeError(f"{name}: {message}")
+            if message["type"] == "turn":
+                await asyncio.sleep(rng.random() * 0.005)
+                writer.write(encode({
+                    "type": "play",
+                    "index": rng.randrange(len(message["hand"])),
+                    "round": message["round"],
+                    "turn": message["turn"],
+                }))
+            elif message["type"] == "end":
+                return message["scores"]
+    finally:
+        writer.close()
+
+
+async def fetch_stats(host, port):
+    """Server counters over a fresh connection"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"type": "stats"}) + encode({"type": "quit"}))
+    stats = await read_message(reader)
+    writer.close()
+    return stats
+
+
+async def simulate(num_clients, q_table_path=Q_TABLE_PATH, port=0, seed=0,
+                   action_space=ACTION_SPACE, endgame=None, **settings):
+    """Runs a server and num_clients concurrent random clients, returns its stats"""
+    server = GameServer(load_q_table(q_table_path), seed=seed, action_space=action_space,
+                        endgame=endgame)
+    listener = await server.serve(HOST, port)
+    port = listener.sockets[0].getsockname()[1]
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    async with listener:
+        await asyncio.gather(
+            *(bot_client(HOST, port, f"Client{i}", settings, random.Random(rng.random()))
+              for i in range(num_clients))
+        )
+        elapsed = time.perf_counter() - start
+        stats = await fetch_stats(HOST, port)
+        # Let the handlers see their clients hang up before the loop stops
+        await asyncio.gather(*server.connections)
+    stats["wall_seconds"] = round(elapsed, 3)
+    return stats
+
+
+async def human_client(host, port, name, settings):
+    """Terminal client, the blocking input() runs in a thread"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"type": "join", "name": name, **settings}))
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await read_message(reader)
+        if message is None:
+            print("Server closed the connection")
+            return
+        kind = message["type"]
+        if kind == "joined":
+            print("Table", message["table"], "players:", ", ".join(message["players"]))
+        elif kind == "turn":
+            print(f"\nRound {message['round']} turn {message['turn']}")
+            print("You've played:", ", ".join(message["played"]))
+            print("Hand:")
+            for i, card in enumerate(message["hand"]):
+                print(f"{i}) {card}")
+            print(f"Which card would you like to play? ({message['timeout']:.0f}s): ")
+            answer = await loop.run_in_executor(None, input)
+            try:
+                index = int(answer)
+            except ValueError:
+                index = -1
+            writer.write(encode({"type": "play", "index": index, "round": message["round"],
+                                 "turn": message["turn"]}))
+        elif kind == "timeout":
+            print("Out of time, played", message["played"])
+        elif kind == "round":
+            for player, cards in message["played"].items():
+                print("Player", player, "played:", ", ".join(cards))
+            print("Scores:", message["scores"])
+        elif kind == "end":
+            print("Final scores:", message["scores"], "winner:", ", ".join(message["winners"]))
+            writer.close()
+            return
+        elif kind == "error":
+            print("Error:", message["message"])
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Sushi Go game server")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--host", default=HOST)
+    serve_parser.add_argument("--port", type=int, default=PORT)
+    serve_parser.add_argument("--q-table", default=Q_TABLE_PATH)
+    serve_parser.add_argument("--action-space", default=ACTION_SPACE)
+    serve_parser.add_argument("--tablebase", default=TABLEBASE_PATH)
+    client_parser = commands.add_parser("client")
+    client_parser.add_argument("--host", default=HOST)
+    client_parser.add_argument("--port", type=int, default=PORT)
+    client_parser.add_argument("--name", default="Human")
+    client_parser.add_argument("--bots", type=int, default=NUM_BOTS)
+    client_parser.add_argument("--num-cards", type=int, default=NUM_CARDS)
+    simulate_parser = commands.add_parser("simulate")
+    simulate_parser.add_argument("clients", type=int)
+    simulate_parser.add_argument("--bots", type=int, default=NUM_BOTS)
+    simulate_parser.add_argument("--num-cards", type=int, default=NUM_CARDS)
+    simulate_parser.add_argument("--q-table", default=Q_TABLE_PATH)
+    simulate_parser.add_argument("--action-space", default=ACTION_SPACE)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        async def serve():
+            endgame = (
+                Tablebase.load(args.tablebase) if os.path.exists(args.tablebase) else None
+            )
+            server = GameServer(load_q_table(args.q_table), action_space=args.action_space,
+                                endgame=endgame)
+            listener = await server.serve(args.host, args.port)
+            print("Serving on", args.host, args.port)
+            async with listener:
+                await listener.serve_forever()
+
+        asyncio.run(serve())
+    elif args.command == "client":
+        settings = {"bots": args.bots, "num_cards": args.num_cards}
+        asyncio.run(human_client(args.host, args.port, args.name, settings))
+    else:
+        stats = asyncio.run(
+            simulate(args.clients, args.q_table, action_space=args.action_space,
+                     bots=args.bots, num_cards=args.num_cards)
+        )
+        print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Training telemetry in bounded memory
+
+Epsilon is computed from the game count when needed, update magnitudes
+go into streaming aggregators, and per-interval metrics are appended to
+a CSV log, so a run of any length keeps the same memory footprint.
+`python telemetry.py metrics/training.csv update_mean` plots a column.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import csv
+import math
+import os
+import sys
+
+import numpy as np
+
+
+def exponential_decay(games, start, floor, rate=0.9999995):
+    """start * rate**games, the schedule train.py has always used"""
+    return start * rate**games
+
+
+def linear_decay(games, start, floor, horizon=1_000_000):
+    """Straight line from start to floor over horizon games"""
+    return start + (floor - start) * min(games / horizon, 1.0)
+
+
+def cosine_decay(games, start, floor, horizon=1_000_000):
+    """Half cosine from start to floor over horizon games"""
+    progress = min(games / horizon, 1.0)
+    return floor + (start - floor) * 0.5 * (1 + math.cos(math.pi * progress))
+
+
+DECAY_SHAPES = {
+    "exponential": exponential_decay,
+    "linear": linear_decay,
+    "cosine": cosine_decay,
+}
+MISSING_VALUE = "nan"  # Metrics log cells of a column a row did not have
+
+
+class EpsilonSchedule:
+    """Epsilon as a function of games played, never below floor
+
+    shape is a name from DECAY_SHAPES or any function
+    (games, start, floor, **params) -> epsilon.
+    """
+
+    def __init__(self, start=0.9, floor=0.1, shape="exponential", **params):
+        """Initialize variables"""
+        self.start = start
+        self.floor = floor
+        self.shape = DECAY_SHAPES[shape] if isinstance(shape, str) else shape
+        self.params = params
+
+    def __call__(self, games):
+        """Epsilon after `games` training games"""
+        return max(self.floor, self.shape(games, self.start, self.floor, **self.params))
+
+
+class QuantileSketch:
+    """Approximate quantiles of non-negative values from a log-scale histogram
+
+    Bins are evenly spaced in log10 between low and high, so any quantile
+    inside that range is off by at most one bin (about 2% at 500 bins over
+    8 decades). Smaller values count as 0 and larger ones as high.
+    """
+
+    def __init__(self, low=1e-6, high=1e2, num_bins=500):
+        """Initialize variables"""
+        self.log_low = math.log10(low)
+        self.log_high = math.log10(high)
+        self.num_bins = num_bins
+        # Bin 0 is everything below low
+        self.counts = np.zeros(num_bins + 1, dtype=np.int64)
+
+    def update_many(self, values):
+        """Adds an array of values"""
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            logs = np.log10(values)
+        scaled = (logs - self.log_low) / (self.log_high - self.log_low) * self.num_bins
+        scaled = np.where(np.isfinite(scaled), scaled, -1.0)  # 0 and nan
+        bins = np.where(
+            scaled >= 0, np.minimum(scaled, self.num_bins - 1).astype(np.int64) + 1, 0
+        )
+        self.counts += np.bincount(bins, minlength=self.num_bins + 1)
+
+    def quantile(self, q):
+        """Value at quantile q (0 to 1), the geometric middle of its bin"""
+        total = self.counts.sum()
+        if total == 0:
+            return float("nan")
+        position = int(np.searchsorted(np.cumsum(self.counts), q * total, side="left"))
+        if position == 0:
+            return 0.0
+        width = (self.log_high - self.log_low) / self.num_bins
+        return 10 ** (self.log_low + (position - 0.5) * width)
+
+    def reset(self):
+        """Forgets every value"""
+        self.counts[:] = 0
+
+
+class StreamingStats:
+    """Count, mean, variance, min/max, EWMA and quantiles of a value stream
+
+    A drop-in for the list Player.q_updates used to be: append and extend
+    add values, and nothing but the aggregates is kept. Single values are
+    buffered and folded in as an array every `buffer_size` values.
+    """
+
+    def __init__(self, ewma_alpha=1e-4, buffer_size=4096, sketch=None):
+        """Initialize variables"""
+        self.ewma_alpha = ewma_alpha
+        self.buffer_size = buffer_size
+        self.sketch = sketch if sketch is not None else QuantileSketch()
+        self.buffer = []
+        self.count = 0
+        self.total = 0.0
+        self.mean_value = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.ewma = math.nan
+
+    def append(self, value):
+        """Adds one value"""
+        self.buffer.append(value)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, values):
+        """Adds an array or list of values"""
+        self.flush()
+        self.update_many(values)
+
+    def flush(self):
+        """Folds buffered values into the aggregates"""
+        if self.buffer:
+            values, self.buffer = self.buffer, []
+            self.update_many(values)
+
+    def update_many(self, values):
+        """Merges a batch with Chan et al.'s parallel mean/variance update"""
+        values = np.asarray(values, dtype=np.float64)
+        count = len(values)
+        if count == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(np.sum((values - mean) ** 2))
+        total = self.count + count
+        delta = mean - self.mean_value
+        self.mean_value += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.total += float(values.sum())
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        # ewma_n = (1 - a)^n * ewma_0 + sum a (1 - a)^(n - 1 - i) x_i
+        decay = (1 - self.ewma_alpha) ** np.arange(count - 1, -1, -1, dtype=np.float64)
+        weighted = self.ewma_alpha * float(np.dot(decay, values))
+        if math.isnan(self.ewma):
+            # Start from the first value instead of biasing towards 0
+            self.ewma = float(values[0])
+        self.ewma = (1 - self.ewma_alpha) ** count * self.ewma + weighted
+        self.sketch.update_many(values)
+
+    def __len__(self):
+        """Number of values seen"""
+        return self.count + len(self.buffer)
+
+    @property
+    def mean(self):
+        """Mean of every value, nan before the first"""
+        self.flush()
+        return self.mean_value if self.count else math.nan
+
+    @property
+    def variance(self):
+        """Sample variance, nan with fewer than 2 values"""
+        self.flush()
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def quantile(self, q):
+        """Approximate quantile from the sketch"""
+        self.flush()
+        return self.sketch.quantile(q)
+
+    def summary(self, prefix):
+        """Aggregates as a flat dict, keys start with prefix"""
+        self.flush()
+        empty = self.count == 0
+        return {
+            f"{prefix}_count": self.count,
+            f"{prefix}_mean": self.mean,
+            f"{prefix}_std": math.sqrt(self.variance) if self.count > 1 else math.nan,
+            f"{prefix}_min": math.nan if empty else self.minimum,
+            f"{prefix}_max": math.nan if empty else self.maximum,
+            f"{prefix}_p50": self.quantile(0.5),
+            f"{prefix}_p90": self.quantile(0.9),
+            f"{prefix}_p99": self.quantile(0.99),
+            f"{prefix}_ewma": self.ewma,
+        }
+
+    def reset(self):
+        """Starts a new interval, the EWMA carries over"""
+        ewma = self.ewma
+        self.__init__(self.ewma_alpha, self.buffer_size, self.sketch)
+        self.sketch.reset()
+        self.ewma = ewma
+
+
+class MetricsLog:
+    """Append-only CSV log, one row per interval
+
+    The header is written with the first row. A row with a new key adds a
+    column: the file is rewritten with it, older rows read "nan" there,
+    as do later rows without a key. Every row is flushed so a killed run
+    keeps its history.
+    """
+
+    def __init__(self, path):
+        """Initialize variables"""
+        self.path = path
+        self.fields = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, newline="", encoding="utf-8") as file:
+                self.fields = next(csv.reader(file))
+
+    def append(self, row):
+        """Writes one row (a dict) to the end of the log"""
+        if self.fields is None:
+            self.fields = list(row)
+            self.write_rows([], "w")
+        elif not set(row) <= set(self.fields):
+            # E.g. a newer train.py resuming an older run's log
+            rows = self.read_rows()
+            self.fields += [key for key in row if key not in self.fields]
+            self.rewrite(rows)
+        self.write_rows([row], "a")
+
+    def write_rows(self, rows, mode):
+        """Writes the header (mode "w") or appends rows"""
+        with open(self.path, mode, newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=self.fields, restval=MISSING_VALUE)
+            if mode == "w":
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def read_rows(self):
+        """Every row of the log as a dict"""
+        with open(self.path, newline="", encoding="utf-8") as file:
+            return list(csv.DictReader(file))
+
+    def rewrite(self, rows):
+        """Replaces the log with rows under the current header"""
+        temp = self.path + ".tmp"
+        with open(temp, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=self.fields, restval=MISSING_VALUE)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(temp, self.path)
+
+    def truncate(self, games, key="games"):
+        """Drops rows after `games`, for a run resumed from a checkpoint"""
+        if self.fields is None:
+            return
+        self.rewrite([row for row in self.read_rows() if float(row[key]) <= games])
+
+    def restart(self):
+        """Empties the log, for a run that starts from scratch"""
+        self.fields = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def read_metrics(path):
+    """Columns of a metrics log as float arrays, keyed by field name"""
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    if not rows:
+        return {}
+    values = np.array(rows[1:], dtype=np.float64).reshape(-1, len(rows[0]))
+    return {field: values[:, i] for i, field in enumerate(rows[0])}
+
+
+def plot_metrics(path, columns, x="games"):
+    """Plots columns of a metrics log against x"""
+    import matplotlib.pyplot as plt  # trunk-ignore(pylint/C0415)
+
+    metrics = read_metrics(path)
+    for column in columns:
+        plt.plot(metrics[x], metrics[column], label=column)
+    plt.legend()
+    plt.xlabel(x)
+    plt.title(os.path.basename(path))
+    plt.show()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python telemetry.py METRICS.csv COLUMN [COLUMN ...]")
+        sys.exit(1)
+    plot_metrics(sys.argv[1], sys.argv[2:])
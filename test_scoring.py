@@ -0,0 +1,61 @@
+"""
+Randomized differential tests of round scoring against the original rules
+
+Run with `python -m pytest test_scoring.py`. Played sequences are random
+card ids (and -1 for an empty hand); Game's scalar scoring and BatchGame's
+incremental Wasabi tracking must both match reference_round_scores.
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import random
+
+import numpy as np
+
+from batch_game import BatchGame
+from cards import NUM_TYPES
+from player import Player
+from scoring import check_scoring, maki_points, reference_round_scores, score_played
+
+NUM_TRIALS = 5000
+
+
+def random_rounds(num_players, num_cards, count, seed):
+    """count rounds of random played sequences, one list per player"""
+    rng = random.Random(seed)
+    return [
+        [[rng.randrange(-1, NUM_TYPES) for _ in range(num_cards)] for _ in range(num_players)]
+        for _ in range(count)
+    ]
+
+
+def test_score_played_matches_reference():
+    """Game.score_round's scoring of every sequence"""
+    for num_players in range(2, 6):
+        for num_cards in (1, 4, 8, 10):
+            for played_lists in random_rounds(num_players, num_cards, 200, num_players):
+                results = [score_played(bytes(card % 256 for card in played))
+                           for played in played_lists]
+                bonus = maki_points([makis for _, makis, _ in results])
+                scores = [points + extra for (points, _, _), extra in zip(results, bonus)]
+                assert scores == reference_round_scores(played_lists)
+
+
+def test_batch_game_matches_reference():
+    """BatchGame.play_cards and score_round, fed the sequences pick by pick"""
+    for num_players in range(2, 6):
+        for num_cards in (1, 4, 8, 10):
+            rounds = random_rounds(num_players, num_cards, NUM_TRIALS // 20, num_cards)
+            players = [Player(f"P{i}", "random", None) for i in range(num_players)]
+            game = BatchGame(num_cards, players, len(rounds), update=False, seed=0)
+            sequences = np.array(rounds)  # (games, players, picks)
+            for pick in range(num_cards):
+                for index in range(num_players):
+                    game.play_cards(index, sequences[:, index, pick])
+            game.score_round()
+            expected = np.array([reference_round_scores(lists) for lists in rounds])
+            assert np.array_equal(game.ending(), expected)
+
+
+def test_check_scoring():
+    """The kernels behind `python scoring.py`"""
+    assert check_scoring(NUM_TRIALS) == 0
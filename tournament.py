@@ -0,0 +1,264 @@
+"""
+Round-robin tournament of strategies over player counts and hand sizes
+
+Every cell of the win-rate matrix is one entrant (row) in a BatchGame
+against num_players - 1 copies of another (column), seats shuffled every
+game, played in a process pool. An entrant is a built-in strategy or a
+saved table:
+    rules, rules2, worst, random - the built-in strategies
+    model:q_table.pkl - a Q-table (.pkl, .qmap or .qpol), played greedily
+    approx:q_network.npz - an approx.QNetwork
+    name=model:new.qmap - the same, under its own name
+Results are cached in one JSON file keyed by everything that decides
+them: the strategies, a hash of each table file's contents,
+TOURNAMENT_VERSION, the player count, hand size, games and seed. A rerun
+after retraining one table only plays the cells that table is in.
+Cells of the same player count and hand size are dealt the same hands,
+so entrants are compared on the same games.
+
+    python tournament.py [--entrants model:q_table.pkl rules rules2 worst random]
+                         [--players 2 3 4] [--cards 8] [--games 10000] [--out results.json]
+"""
+# trunk-ignore-all(pylint/E0401)
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+
+import numpy as np
+
+from batch_game import BatchGame
+from evaluation import wilson_interval
+from player import Player
+from registry import REGISTRY, file_version
+
+TOURNAMENT_VERSION = 1  # Bump when game rules or built-in strategies change
+CACHE_PATH = "tournament_cache.json"
+STRATEGIES = ("model", "approx", "rules", "rules2", "worst", "random")
+FILE_STRATEGIES = ("model", "approx")
+DEFAULT_ENTRANTS = ["model:q_table.pkl", "rules", "rules2", "worst", "random"]
+HASH_CHUNK = 1 << 20  # Bytes read at a time when hashing a table file
+
+
+def parse_entrant(spec):
+    """(name, strategy, path) of "[name=]strategy[:path]" """
+    name, _, entrant = spec.rpartition("=")
+    strategy, _, path = entrant.partition(":")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}, use one of {STRATEGIES}")
+    if strategy in FILE_STRATEGIES and not path:
+        raise ValueError(f"{spec!r} needs a file, e.g. {strategy}:PATH")
+    return name or entrant, strategy, path or None
+
+
+def file_digest(path, digests):
+    """sha256 of a file's contents, reused while its version is unchanged
+
+    digests maps "path|version" to a digest and is saved with the cache,
+    so an unchanged multi-gigabyte table is not read again.
+    """
+    path = os.path.abspath(path)
+    key = f"{path}|{'|'.join(map(str, file_version(path)))}"
+    if key not in digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        digests[key] = digest.hexdigest()
+    return digests[key]
+
+
+def make_player(name, strategy, path):
+    """A greedy Player of an entrant"""
+    if strategy == "approx":
+        return Player(name, "approx", path, epsilon=0)
+    if strategy == "model":
+        # Shared read-only per process, see registry.py
+        return Player(name, "model", None, epsilon=0, q_table_path=path, fallback="zeros",
+                      read_only=True)
+    return Player(name, strategy, None)
+
+
+def play_cell(row, column, num_players, num_cards, num_games, num_rounds, seed):
+    """{"games", "wins", "ties"} of row against num_players - 1 columns
+
+    row and column are (strategy, path). Hands depend only on the player
+    count, hand size and seed.
+    """
+    players = [make_player("Row", *row)] + [
+        make_player(f"Column{i + 1}", *column) for i in range(num_players - 1)
+    ]
+    game = BatchGame(num_cards, players, num_games, update=False,
+                     seed=(seed, num_players, num_cards))
+    for _ in range(num_rounds):
+        game.deal_cards()
+        game.play_round()
+        game.score_round()
+    winners = game.winners()
+    return {
+        "games": num_games,
+        "wins": int(np.sum(winners == 0)),
+        "ties": int(np.sum(winners == -1)),
+    }
+
+
+def cell_key(row, column, num_players, num_cards, num_games, num_rounds, seed):
+    """Cache key of a cell, row and column are (strategy, digest or None)"""
+    config = {
+        "version": TOURNAMENT_VERSION,
+        "row": row,
+        "column": column,
+        "players": num_players,
+        "cards": num_cards,
+        "games": num_games,
+        "rounds": num_rounds,
+        "seed": seed,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def load_cache(path):
+    """{"cells": {key: result}, "digests": {...}}, empty if there is none"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"cells": {}, "digests": {}}
+
+
+def save_cache(cache, path):
+    """Writes the cache atomically, a killed run keeps every finished cell"""
+    temp = path + ".tmp"
+    with open(temp, "w", encoding="utf-8") as file:
+        json.dump(cache, file)
+    os.replace(temp, path)
+
+
+def run_tournament(entrants, player_counts=(2, 3, 4), card_counts=(8,), num_games=10000,
+                   num_rounds=1, seed=0, cache_path=CACHE_PATH, max_workers=None):
+    """Plays every uncached cell and returns the results of all of them
+
+    entrants are "[name=]strategy[:path]" specs. Returns {"entrants":
+    names, "computed": cells played now, "cells": {(players, cards, row,
+    column): {"games", "wins", "ties"}}}.
+    """
+    parsed = [parse_entrant(spec) for spec in entrants]
+    names = [name for name, _, _ in parsed]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Entrant names must be unique: {names}")
+    cache = load_cache(cache_path)
+    versions = {
+        name: (strategy, file_digest(path, cache["digests"]) if path else None)
+        for name, strategy, path in parsed
+    }
+    sources = {name: (strategy, path) for name, strategy, path in parsed}
+    cells, todo = {}, {}
+    for num_players in player_counts:
+        for num_cards in card_counts:
+            for row in names:
+                for column in names:
+                    key = cell_key(versions[row], versions[column], num_players, num_cards,
+                                   num_games, num_rounds, seed)
+                    cell = (num_players, num_cards, row, column)
+                    if key in cache["cells"]:
+                        cells[cell] = cache["cells"][key]
+                    else:
+                        todo[cell] = key
+    if todo:
+        # Loaded once here; workers are forked like evaluation.Evaluator, so
+        # they inherit the registry and share the tables copy-on-write
+        for _, strategy, path in parsed:
+            if strategy == "model":
+                REGISTRY.view(path)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+            futures = {
+                pool.submit(
+                    play_cell, sources[row], sources[column], num_players, num_cards,
+                    num_games, num_rounds, seed,
+                ): (num_players, num_cards, row, column)
+                for num_players, num_cards, row, column in todo
+            }
+            for future in as_completed(futures):
+                cell = futures[future]
+                cells[cell] = cache["cells"][todo[cell]] = future.result()
+                save_cache(cache, cache_path)
+    save_cache(cache, cache_path)
+    return {"entrants": names, "computed": len(todo), "cells": cells}
+
+
+def win_rate_matrix(results, num_players, num_cards, confidence=0.95):
+    """(rates, lows, highs) arrays, row entrant against column entrants"""
+    names = results["entrants"]
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    shape = (len(names), len(names))
+    rates, lows, highs = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    for i, row in enumerate(names):
+        for j, column in enumerate(names):
+            cell = results["cells"][(num_players, num_cards, row, column)]
+            rates[i, j] = cell["wins"] / cell["games"]
+            lows[i, j], highs[i, j] = wilson_interval(cell["wins"], cell["games"], z)
+    return rates, lows, highs
+
+
+def format_matrix(results, num_players, num_cards, confidence=0.95):
+    """Win-rate matrix with intervals as text, chance is 1 / num_players"""
+    names = results["entrants"]
+    rates, lows, highs = win_rate_matrix(results, num_players, num_cards, confidence)
+    width = max(20, max(len(name) for name in names) + 2)
+    lines = [
+        f"{num_players} players, {num_cards} cards, row vs {num_players - 1} x column "
+        f"(chance {1 / num_players:.3f}, {100 * confidence:.0f}% intervals)",
+        " " * width + "".join(f"{name:>{width}}" for name in names),
+    ]
+    for i, row in enumerate(names):
+        lines.append(f"{row:<{width}}" + "".join(
+            f"{f'{rates[i, j]:.3f} [{lows[i, j]:.3f},{highs[i, j]:.3f}]':>{width}}"
+            for j in range(len(names))
+        ))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--entrants", nargs="+", default=DEFAULT_ENTRANTS)
+    parser.add_argument("--players", nargs="+", type=int, default=[2, 3, 4])
+    parser.add_argument("--cards", nargs="+", type=int, default=[8])
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--cache", default=CACHE_PATH)
+    parser.add_argument("--out", help="JSON file to write the matrices to")
+    args = parser.parse_args(argv)
+    results = run_tournament(args.entrants, args.players, args.cards, args.games,
+                             args.rounds, args.seed, args.cache, args.workers)
+    print(f"{results['computed']} of {len(results['cells'])} cells played, "
+          f"the rest were cached\n")
+    output = {"entrants": results["entrants"], "matrices": []}
+    for num_players in args.players:
+        for num_cards in args.cards:
+            print(format_matrix(results, num_players, num_cards) + "\n")
+            rates, lows, highs = win_rate_matrix(results, num_players, num_cards)
+            output["matrices"].append({
+                "players": num_players,
+                "cards": num_cards,
+                "rates": rates.tolist(),
+                "lows": lows.tolist(),
+                "highs": highs.tolist(),
+            })
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(output, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
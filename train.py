@@ -2,34 +2,73 @@
 This is the main file for training model / building out q-table
 """
 
+import os
 import pickle
 
 # trunk-ignore-all(pylint/E0401)
-import random
 import time
 
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 from tqdm import tqdm
 
-from game import Game
+from analytics import format_hand_stats, hand_stats, shares, stats_frame
+from approx import distill
+from batch_game import BatchGame
+from checkpoint import Checkpointer, restore_rng_states, rng_states
+from evaluation import Evaluator, sequential_evaluate
 from player import Player
+from profiling import Profiler
+from qtable import CappedQTable, DenseQTable, format_coverage
+from replay import ReplayBuffer
+from telemetry import EpsilonSchedule, MetricsLog
 
 NUM_CARDS = 5
 NUM_ROUNDS = 1_000_000
 NUM_ROUNDS_PER_GAME = 1
 INCREMENT = 100000
-NUM_SIMULATION_GAMES = 10000
+BATCH_SIZE = 1000  # Games simulated in lockstep, must divide INCREMENT
+CHECKPOINT_INTERVAL = 10000  # Games between checkpoints, multiple of BATCH_SIZE
+CHECKPOINT_DIR = "checkpoint"  # Delete to start training from scratch
+SEED = 0
+METRICS_DIR = "metrics"  # training.csv and evaluation.csv, see telemetry.py
+PROFILE = False  # Per-phase timing report at every INCREMENT, see profiling.py
+PROFILE_SAMPLE_EVERY = 10  # Time 1 in N calls of each phase
+NUM_SIMULATION_GAMES = 10000  # Most games of one periodic evaluation
+# Periodic evaluations stop early once the 95% win-rate interval is this
+# narrow, looking every EVALUATION_BATCH games; 0 always plays them all
+EVALUATION_WIDTH = 0.04
+EVALUATION_BATCH = 2000
 EPSILON = 0.90
+# "position" or "type", see policy.py; convert old tables before switching
+ACTION_SPACE = "position"
+# Cap on stored states, cold ones are evicted past it (None = unbounded);
+# `python qtable.py coverage q_table.pkl` shows what pruning would keep
+MAX_STATES = None
+# Recent picks replayed every batch (None = off), 17 bytes each, see replay.py;
+# the buffer is not checkpointed and refills after a resume
+REPLAY_CAPACITY = None
+REPLAY_PRIORITIZED = False
+# Distill the trained table into an approx.QNetwork saved here (None = off),
+# play it with Player(name, "approx", DISTILL_PATH)
+DISTILL_PATH = None
 
 print("Number of Cards:", NUM_CARDS, "Rounds:", NUM_ROUNDS)
 AI1 = Player(
-    "AI1", "model", None, epsilon=EPSILON, alpha=0.05, gamma=0.9
+    "AI1", "model", None, epsilon=EPSILON, alpha=0.05, gamma=0.9, action_space=ACTION_SPACE
 )  # Should be best
+if not isinstance(AI1.q_table, DenseQTable):
+    AI1.q_table = DenseQTable.from_dict(AI1.q_table, NUM_CARDS)
+if MAX_STATES:
+    AI1.q_table = CappedQTable.from_table(AI1.q_table, NUM_CARDS, MAX_STATES)
+if REPLAY_CAPACITY:
+    AI1.replay = ReplayBuffer(REPLAY_CAPACITY, prioritized=REPLAY_PRIORITIZED, seed=SEED)
+    print("Replay buffer:", AI1.replay.nbytes / 2**20, "MiB")
 AI2 = Player("Random1", "random", None)
 AI3 = Player("Random2", "random", None)
 # AI4 = Player("Random3", "random", None)
+# Training opponents; compare saved tables against every strategy with
+# python tournament.py instead of editing this list
 players = [AI1, AI2, AI3]  # , AI4]
 evaluation_wins = {}
 for player in players:
@@ -40,11 +79,12 @@ evaluation_wins["Ties"] = []
 
 print("Epsilon =", EPSILON)
 
-epsilon_decay = [max(0.1, EPSILON * (0.9999995**i)) for i in range(NUM_ROUNDS)]
+# Computed per batch, a list over NUM_ROUNDS would take gigabytes
+epsilon_schedule = EpsilonSchedule(EPSILON, floor=0.1, shape="exponential")
 
 
 def plot_data(temp_evaluation_wins, temp_players, temp_increment):
-    """Plots Wins from evaluations games over time, for all players"""
+    """Plots win rates from evaluations games over time, for all players"""
     games = list(
         range(
             0,
@@ -52,80 +92,181 @@ def plot_data(temp_evaluation_wins, temp_players, temp_increment):
             temp_increment,
         )
     )
+    # Evaluations stop after different numbers of games, so plot rates
+    totals = np.maximum(np.sum(list(temp_evaluation_wins.values()), axis=0), 1)
     colors = ["red", "blue", "green", "orange", "purple", "yellow", "gray"]
-    for temp_player in temp_players:
+    for color, temp_player in zip(colors, temp_players):
         plt.plot(
             games,
-            temp_evaluation_wins[temp_player.name],
+            100 * np.array(temp_evaluation_wins[temp_player.name]) / totals,
             label=temp_player.name,
-            color=colors[_],
+            color=color,
         )
-    plt.plot(games, temp_evaluation_wins["Ties"], label="Ties", color="black")
+    plt.plot(games, 100 * np.array(temp_evaluation_wins["Ties"]) / totals, label="Ties",
+             color="black")
     plt.legend()
-    plt.title("Wins")
-    plt.ylabel("Wins")
+    plt.title("Win rate")
+    plt.ylabel("Win %")
     plt.xlabel("Training rounds")
     plt.show()
 
 
+def log_evaluation(log, games, wins):
+    """Appends wins and win rates of one evaluation to the metrics log"""
+    total = sum(wins.values())
+    row = {"games": games}
+    row.update({f"{name}_wins": count for name, count in wins.items()})
+    row.update({f"{name}_rate": count / total for name, count in wins.items()})
+    log.append(row)
+
+
 try:
     start = time.time()
-    SAVE_COUNTER = 0
-    game = Game(num_cards=NUM_CARDS, players=players, print_info=False)
-    for numGames in tqdm(range(NUM_ROUNDS)):
-        game.reset()  # or game = Game(...) if you still instantiate
-        AI1.epsilon = epsilon_decay[numGames]
+    START_GAME = 0
+    game = BatchGame(
+        num_cards=NUM_CARDS, players=players, num_games=BATCH_SIZE, seed=SEED
+    )
+    evaluator = Evaluator(
+        [(player.name, player.strategy) for player in players],
+        NUM_CARDS,
+        NUM_SIMULATION_GAMES,
+        seed=SEED,
+        num_rounds=NUM_ROUNDS_PER_GAME,
+        action_space=ACTION_SPACE,
+        width=EVALUATION_WIDTH,
+        batch_size=EVALUATION_BATCH,
+    )
+    profiler = Profiler(PROFILE_SAMPLE_EVERY)
+    if PROFILE:
+        profiler.instrument_game(game)
+    checkpointer = Checkpointer(CHECKPOINT_DIR)
+    training_log = MetricsLog(f"{METRICS_DIR}/training.csv")
+    evaluation_log = MetricsLog(f"{METRICS_DIR}/evaluation.csv")
+    if checkpointer.exists():
+        AI1.q_table, training_state = checkpointer.load()
+        if MAX_STATES:
+            # Visit counts are not checkpointed, resumed rows restart at one
+            AI1.q_table = CappedQTable.from_table(AI1.q_table, NUM_CARDS, MAX_STATES)
+        START_GAME = training_state["games"]
+        AI1.q_updates = training_state["q_updates"]
+        evaluation_wins = training_state["evaluation_wins"]
+        restore_rng_states(training_state["rng"], game.rng)
+        for games, path in training_state["pending_evaluations"]:
+            if os.path.exists(path):
+                evaluator.submit_snapshot(games, path)
+            else:
+                print("Snapshot", path, "is missing, skipping its evaluation")
+        # Rows past the checkpoint are logged again as training repeats them
+        training_log.truncate(START_GAME)
+        evaluation_log.truncate(
+            min([START_GAME + 1] + [games for games, _ in evaluator.pending_snapshots()]) - 1
+        )
+        print("Resumed from checkpoint at game", START_GAME)
+    else:
+        # A fresh run starts fresh logs instead of appending to the last run's
+        training_log.restart()
+        evaluation_log.restart()
+    interval_start, interval_games = time.time(), START_GAME
+    for numGames in tqdm(range(START_GAME, NUM_ROUNDS, BATCH_SIZE)):
+        game.reset()
+        AI1.epsilon = epsilon_schedule(numGames)
         for _ in range(NUM_ROUNDS_PER_GAME):
-            random.shuffle(game.players)
             game.deal_cards()
             game.play_round()
             game.score_round()
-        if (numGames + 1) % INCREMENT == 0:
-            average_update = np.mean(AI1.q_updates[-INCREMENT:])
-            AI1.q_updates = []
-            print("\nAverage Q-table update:", average_update)
+        if (numGames + BATCH_SIZE) % INCREMENT == 0:
+            interval_time = time.time() - interval_start
+            update_stats = AI1.q_updates.summary("update")
+            AI1.q_updates.reset()
+            training_log.append(
+                {
+                    "games": numGames + BATCH_SIZE,
+                    "elapsed": round(time.time() - start, 3),
+                    "games_per_sec": round(
+                        (numGames + BATCH_SIZE - interval_games) / interval_time, 1
+                    ),
+                    "epsilon": AI1.epsilon,
+                    "q_table_size": len(AI1.q_table),
+                    "evicted": getattr(AI1.q_table, "evicted", 0),
+                    "replay_size": len(AI1.replay) if AI1.replay is not None else 0,
+                    **update_stats,
+                }
+            )
+            interval_start, interval_games = time.time(), numGames + BATCH_SIZE
+            print("\nAverage Q-table update:", update_stats["update_mean"])
             print("Epsilon:", AI1.epsilon)
+            if PROFILE:
+                print(profiler.report())
             print(
-                "numGames:", (numGames + 1), "Q-table size:", len(AI1.q_table), end=" "
+                "numGames:",
+                (numGames + BATCH_SIZE),
+                "Q-table size:",
+                len(AI1.q_table),
             )
 
-            AI1.epsilon = 0
-            evaluation_set_wins = {player.name: 0 for player in players}
-            evaluation_set_wins["Ties"] = 0
-            for _ in range(NUM_SIMULATION_GAMES):
-                game2 = Game(
-                    num_cards=NUM_CARDS, players=players, print_info=False, update=False
-                )
-                for _ in range(NUM_ROUNDS_PER_GAME):
-                    random.shuffle(game2.players)
-                    game2.deal_cards()
-                    game2.play_round()
-                    game2.score_round()
-                finalpoints = game2.ending()
-                won_player = finalpoints.index(max(finalpoints))
-                finalpoints.sort(reverse=True)
-                if finalpoints[0] != finalpoints[1]:
-                    evaluation_set_wins[players[won_player].name] += 1
-                else:
-                    evaluation_set_wins["Ties"] += 1
-            print("WINS:", evaluation_set_wins)
-            for player in players:
-                evaluation_wins[player.name].append(evaluation_set_wins[player.name])
-            evaluation_wins["Ties"].append(evaluation_set_wins["Ties"])
-
-            FILENAME = "q_table.pkl" if SAVE_COUNTER == 0 else "q_table1.pkl"
-            with open(FILENAME, "wb") as file:
-                pickle.dump(AI1.q_table, file)
-            SAVE_COUNTER = 1 - SAVE_COUNTER
-            print("\nDone Saving\n")
-
-            AI1.epsilon = EPSILON
+            # Played on a frozen snapshot in the background, merged below
+            evaluator.submit(AI1.q_table, numGames + BATCH_SIZE)
+
+        for games, evaluation_set_wins in evaluator.collect(evaluation_wins):
+            print("\nnumGames:", games, "WINS:", evaluation_set_wins)
+            log_evaluation(evaluation_log, games, evaluation_set_wins)
+
+        if (numGames + BATCH_SIZE) % CHECKPOINT_INTERVAL == 0:
+            # Only rows changed since the last checkpoint are written
+            checkpointer.save(
+                AI1.q_table,
+                {
+                    "games": numGames + BATCH_SIZE,
+                    "q_updates": AI1.q_updates,
+                    "evaluation_wins": evaluation_wins,
+                    "pending_evaluations": evaluator.pending_snapshots(),
+                    "rng": rng_states(game.rng),
+                },
+            )
+            # Safe now, a resume only resubmits what this checkpoint lists
+            evaluator.remove_merged()
+
+    for games, evaluation_set_wins in evaluator.collect(evaluation_wins, wait=True):
+        print("\nnumGames:", games, "WINS:", evaluation_set_wins)
+        log_evaluation(evaluation_log, games, evaluation_set_wins)
+    evaluator.remove_merged()
+    evaluator.close()
+    if PROFILE:
+        # Open with `python -m pstats`, snakeviz or https://www.speedscope.app
+        profiler.export_pstats("profile.prof")
+        profiler.export_speedscope("profile.speedscope.json")
 
 except KeyboardInterrupt:
+    evaluator.close()
     plot_data(evaluation_wins, players, INCREMENT)
 
+with open("q_table.pkl", "wb") as file:
+    pickle.dump(AI1.q_table, file)
+print("\nDone Saving\n")
+
 end = time.time()
 print("Time taken:", (end - start))
+
+# Stops as soon as the win rate is known to +-1% or clearly beats chance
+final_evaluation = sequential_evaluate(
+    AI1, players[1:], NUM_CARDS, threshold=1 / len(players), seed=SEED
+)
+print("Final evaluation over", final_evaluation["games"], "games (95% intervals):")
+for name, (rate, low, high) in final_evaluation["rates"].items():
+    print(f"{name}: {rate:.3f} [{low:.3f}, {high:.3f}]")
+if DISTILL_PATH:
+    network = distill(AI1.q_table, NUM_CARDS, action_space=ACTION_SPACE, seed=SEED)
+    network.save(DISTILL_PATH)
+    print("Distilled", network.num_parameters, "parameters into", DISTILL_PATH)
+    network_evaluation = sequential_evaluate(
+        Player("Approx", "approx", network, epsilon=0),
+        players[1:],
+        NUM_CARDS,
+        threshold=1 / len(players),
+        seed=SEED,
+    )
+    rate, low, high = network_evaluation["rates"]["Approx"]
+    print(f"Approx: {rate:.3f} [{low:.3f}, {high:.3f}]")
 # @title Print Stats
 card_types = [
     "Dumpling",
@@ -140,61 +281,17 @@ card_types = [
     "Wasabi",
 ]
 
-Popularities = [{card: 0 for card in card_types} for _ in range(NUM_CARDS)]
-percents = [[0 for _ in range(10)] for _ in range(NUM_CARDS)]
-Seen = [{card: 0 for card in card_types} for _ in range(NUM_CARDS)]
-
 q_table = AI1.q_table
 print("Q-table size:", len(q_table))
-# column_width = 4  # For alignment
+if isinstance(q_table, CappedQTable):
+    print("Evicted states:", q_table.evicted)
+    print(format_coverage(q_table.coverage()))
 
-for state, q_values in q_table.items():
-    hand_vector = state[:10]  # First 10 elements of tuple = hand counts
-    total_cards = sum(hand_vector)
-    if total_cards == 0 or total_cards > NUM_CARDS:
-        continue  # Skip invalid or oversized hands
-
-    # Reconstruct the list of available cards in the hand
-    hand = []
-    for i, count in enumerate(hand_vector):
-        hand.extend([card_types[i]] * count)
-        Seen[total_cards - 1][card_types[i]] += count
-
-    if not hand:
-        continue  # Avoid edge case where hand is empty
-
-    # Find the index of the highest Q-value among all possible actions
-    max_index = np.argmax(q_values)
-    if max_index >= len(hand):
-        continue  # Avoid index error
-
-    chosen_card = hand[max_index]
-    Popularities[total_cards - 1][chosen_card] += 1
-
-# Print percentages and seen counts together
-for hand_size, popularity in enumerate(Popularities):
-    print(f"\nHand Size {hand_size + 1}:")
-    print("Card\t\tTimes Seen\tTimes Played\t% Played")
-
-    total_played = sum(popularity.values())
-    for i, card in enumerate(card_types):
-        times_played = popularity[card]
-        times_seen = Seen[hand_size][card]
-        percent_played = (
-            round(times_played / total_played, 4) if total_played > 0 else 0.0
-        )
-
-        print(
-            f"{card.ljust(14)}\t"
-            f"{str(times_seen).ljust(10)}\t"
-            f"{str(times_played).ljust(10)}\t"
-            f"{str(percent_played).ljust(10)}"
-        )
-
-        # Store percentage correctly
-        percents[hand_size][i] = 100 * percent_played
-
-    print("Total Played:", total_played)
+# Counts per hand size and card, vectorized over chunks of states; also
+# `python analytics.py q_table.qmap` for a saved table
+Popularities, Seen = hand_stats(q_table, NUM_CARDS, ACTION_SPACE)
+print(format_hand_stats(Popularities, Seen))
+percents = 100 * np.round(shares(Popularities), 4)
 
 # Plot
 plot_colors = [
@@ -219,13 +316,10 @@ plt.legend()
 plt.show()
 
 # Popularity vs seen
+seen_percents = shares(Seen, 100)
 for i, card in enumerate(card_types):
     popularity_values = [percents[size][i] for size in range(NUM_CARDS)]
-    seen_totals = [sum(Seen[size].values()) for size in range(NUM_CARDS)]
-    seen_values = [
-        (100 * Seen[size][card] / seen_totals[size]) if seen_totals[size] > 0 else 0
-        for size in range(NUM_CARDS)
-    ]
+    seen_values = seen_percents[:, i]
     # plt.plot(range(1, NUM_CARDS + 1), popularity_values,
     # label=f"{card} Popularity", linestyle='-', color=colors[i])
     plt.plot(
@@ -243,29 +337,6 @@ plt.legend(ncol=2)
 plt.show()
 
 # @title How often cards are picked vs just seen
-table_rows = []
-for size in range(NUM_CARDS):
-    total_pop = sum(Popularities[size].values())
-    total_seen = sum(Seen[size].values())
-    for card in card_types:
-        pop_count = Popularities[size][card]
-        seen_count = Seen[size][card]
-        pop_percent = (100 * pop_count / total_pop) if total_pop > 0 else 0
-        seen_percent = (100 * seen_count / total_seen) if total_seen > 0 else 0
-        ratio = (pop_percent / seen_percent) if seen_percent > 0 else 0
-        table_rows.append(
-            [
-                size + 1,
-                card,
-                round(pop_percent, 2),
-                round(seen_percent, 2),
-                round(ratio, 2),
-            ]
-        )
-
-df = pd.DataFrame(
-    table_rows,
-    columns=["Hand Size", "Card Type", "Popularity %", "Seen %", "Pop/Seen Ratio"],
-)
+df = stats_frame(Popularities, Seen)
 df.sort_values("Pop/Seen Ratio")
 print(df.to_string(index=False))